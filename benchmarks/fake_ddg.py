@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the DuckDuckGo instant answer API.
+
+Answers ``GET /?q=...`` with a DuckDuckGo-shaped JSON body after a
+configurable delay, failing a configurable share of requests with HTTP 503,
+so tool latency can be measured without the network and with upstream
+behaviour under control. Point the server at it with ``KBEAUTY_SEARCH_URL``.
+
+    python benchmarks/fake_ddg.py --port 8900 --latency-ms 80 --error-rate 0.05
+    KBEAUTY_SEARCH_URL=http://127.0.0.1:8900/ python kbeauty_mcp.py
+
+Payload shapes:
+
+* ``full``:  abstract, definition, answer and a few related topics
+* ``empty``: every field blank, like a query DuckDuckGo knows nothing about
+* ``large``: long abstract and 50 related topics, some nested in groups
+* ``mixed``: one of the above per request
+"""
+
+import argparse
+import asyncio
+import json
+import random
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from aiohttp import web
+
+PAYLOAD_SHAPES = ("full", "empty", "large", "mixed")
+# Request and error counts of a running app
+STATS = web.AppKey("stats", dict)
+
+
+@dataclass
+class FakeSearchConfig:
+    latency_ms: float = 50.0  # mean response delay
+    jitter_ms: float = 10.0   # delay spread (uniform, +/-)
+    error_rate: float = 0.0   # share of requests answered with HTTP 503
+    payload: str = "full"     # one of PAYLOAD_SHAPES
+    seed: Optional[int] = None
+
+
+def make_payload(shape: str, query: str, rng: random.Random) -> Dict[str, Any]:
+    """A DuckDuckGo instant answer body of the given shape for ``query``."""
+    if shape == "mixed":
+        shape = rng.choice(PAYLOAD_SHAPES[:-1])
+    if shape == "empty":
+        return {"Abstract": "", "Definition": "", "Answer": "", "RelatedTopics": []}
+    topics = 50 if shape == "large" else 4
+    related = [
+        {"Text": f"{query} related topic {i}: " + "K-Beauty detail " * (20 if shape == "large" else 3),
+         "FirstURL": f"https://duckduckgo.com/Topic_{i}"}
+        for i in range(topics)
+    ]
+    if shape == "large":
+        # Real answers mix plain topics with named groups of topics
+        related.insert(1, {"Name": "Products", "Topics": related[-10:]})
+    return {
+        "Abstract": f"{query} is a popular subject in Korean skincare. " * (30 if shape == "large" else 2),
+        "Definition": f"{query}: a K-Beauty term.",
+        "Answer": "",
+        "RelatedTopics": related,
+    }
+
+
+def create_app(config: FakeSearchConfig) -> web.Application:
+    rng = random.Random(config.seed)
+    stats = {"requests": 0, "errors": 0}
+
+    async def search(request: web.Request) -> web.Response:
+        stats["requests"] += 1
+        delay = config.latency_ms + rng.uniform(-config.jitter_ms, config.jitter_ms)
+        await asyncio.sleep(max(delay, 0.0) / 1000)
+        if rng.random() < config.error_rate:
+            stats["errors"] += 1
+            return web.Response(status=503, text="Service Unavailable")
+        body = make_payload(config.payload, request.query.get("q", ""), rng)
+        # DuckDuckGo serves JSON as application/x-javascript
+        return web.Response(text=json.dumps(body), content_type="application/x-javascript")
+
+    app = web.Application()
+    app[STATS] = stats
+    app.router.add_get("/", search)
+    return app
+
+
+async def start(config: FakeSearchConfig, host: str = "127.0.0.1", port: int = 0) -> Tuple[web.AppRunner, str]:
+    """Start the fake server in the running loop; returns its runner and base URL."""
+    runner = web.AppRunner(create_app(config), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{bound_port}/"
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Fake upstream options, shared with the tool benchmark."""
+    parser.add_argument("--latency-ms", type=float, default=FakeSearchConfig.latency_ms, help="mean upstream delay")
+    parser.add_argument("--jitter-ms", type=float, default=FakeSearchConfig.jitter_ms, help="upstream delay spread")
+    parser.add_argument("--error-rate", type=float, default=FakeSearchConfig.error_rate,
+                        help="share of upstream requests failing with HTTP 503")
+    parser.add_argument("--payload", choices=PAYLOAD_SHAPES, default=FakeSearchConfig.payload,
+                        help="shape of upstream answers")
+    parser.add_argument("--seed", type=int, help="random seed for delays, errors and mixed payloads")
+
+
+def config_from_args(args: argparse.Namespace) -> FakeSearchConfig:
+    return FakeSearchConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.payload, args.seed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(create_app(config_from_args(args)), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark for the K-Beauty MCP server.
+
+Spawns the server over stdio the way an MCP client does, performs the
+initialize handshake and times how long it takes from process spawn until
+the first ``tools/list`` response arrives. Each run is a fresh process, so
+the number includes interpreter startup and every import.
+
+    python benchmarks/startup.py --runs 10
+    python benchmarks/startup.py --max-ms 1500   # exit 1 if the median is slower
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER = os.path.join(ROOT, "kbeauty_mcp.py")
+
+
+def _send(process: subprocess.Popen, message: Dict) -> None:
+    process.stdin.write(json.dumps(message) + "\n")
+    process.stdin.flush()
+
+
+def _wait_for(process: subprocess.Popen, request_id: int) -> Dict:
+    for line in process.stdout:
+        message = json.loads(line)
+        if message.get("id") == request_id:
+            return message
+    raise RuntimeError(f"server exited before answering request {request_id}")
+
+
+def measure_startup(python: str = sys.executable) -> Dict[str, float]:
+    """Milliseconds from spawn to the initialize response and to the first tools/list response."""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [python, SERVER], cwd=ROOT, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL, text=True,
+    )
+    try:
+        _send(process, {
+            "jsonrpc": "2.0", "id": 1, "method": "initialize",
+            "params": {
+                "protocolVersion": "2024-11-05",
+                "capabilities": {},
+                "clientInfo": {"name": "startup-benchmark", "version": "1.0"},
+            },
+        })
+        _wait_for(process, 1)
+        initialized = time.perf_counter()
+        _send(process, {"jsonrpc": "2.0", "method": "notifications/initialized"})
+        _send(process, {"jsonrpc": "2.0", "id": 2, "method": "tools/list"})
+        tools = _wait_for(process, 2)["result"]["tools"]
+        listed = time.perf_counter()
+    finally:
+        process.stdin.close()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return {
+        "initialize_ms": (initialized - started) * 1000,
+        "list_tools_ms": (listed - started) * 1000,
+        "tools": len(tools),
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh server processes to time (default 5)")
+    parser.add_argument("--python", default=sys.executable, help="interpreter to run the server with")
+    parser.add_argument("--max-ms", type=float, help="fail when the median time to tools/list exceeds this")
+    args = parser.parse_args(argv)
+
+    runs = [measure_startup(args.python) for _ in range(max(args.runs, 1))]
+    to_list = [run["list_tools_ms"] for run in runs]
+    median = statistics.median(to_list)
+    print(f"tools listed:          {runs[0]['tools']}")
+    print(f"spawn -> initialize:   {statistics.median(run['initialize_ms'] for run in runs):.0f} ms (median)")
+    print(f"spawn -> tools/list:   {median:.0f} ms (median), {min(to_list):.0f} ms (best) over {len(runs)} runs")
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"FAIL: median {median:.0f} ms exceeds the {args.max_ms:.0f} ms limit")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Per-tool latency, throughput and allocation benchmark.
+
+Starts the local DuckDuckGo stand-in from ``fake_ddg.py``, points the server
+at it through ``KBEAUTY_SEARCH_URL`` and drives every tool from
+``list_tools`` through ``call_tool`` in-process, at each requested
+concurrency. For every tool and concurrency it reports p50/p95/p99 latency,
+calls per second and errors: ``call_tool`` answers failed searches with
+fallback text rather than raising, so ``errors`` counts the upstream
+requests the fake server failed during that run and ``exceptions`` the
+calls that raised. A separate sequential pass under ``tracemalloc``
+reports the peak and retained Python heap per call (work done in the photo
+worker processes is not traced).
+
+    python benchmarks/tool_latency.py --calls 200 --concurrency 1,8,32
+    python benchmarks/tool_latency.py --latency-ms 150 --error-rate 0.1 --cache cold
+    python benchmarks/tool_latency.py --output after.json --baseline before.json --max-regression 20
+
+``--output`` writes the results as JSON (sorted keys, one file per run) so
+runs from two commits can be diffed; ``--baseline`` prints the change
+against an earlier file and exits 1 when any p95 regressed by more than
+``--max-regression`` percent.
+
+``--cache warm`` (default) keeps the search and photo caches, as a long
+running server would; ``--cache cold`` disables them so every search goes
+to the fake upstream. The user's persistent cache file is never touched.
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import logging
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.dirname(os.path.abspath(__file__))]
+
+import fake_ddg  # noqa: E402
+
+# Argument variants per tool, cycled through call by call. Every listed tool needs an entry.
+SAMPLE_CALLS: Dict[str, List[Dict[str, Any]]] = {
+    "search_kbeauty_brands": [{"query": "COSRX"}, {"query": "snail mucin"}, {"query": "glass skin indie brand"}],
+    "get_product_info": [
+        {"brand": "cosrx"},
+        {"brand": "laneige", "product_name": "Water Sleeping Mask", "include_web": True},
+        {"brand": "innisfree", "product_name": "Green Tea Seed Serum", "include_web": True},
+    ],
+    "analyze_ingredients": [
+        {"ingredient": "niacinamide"},
+        {"ingredient": "centella asiatica", "include_web": True},
+        {"ingredient": "mugwort", "include_web": True},
+    ],
+    "recommend_routine": [
+        {"skin_type": "oily", "concerns": ["acne"], "routine_type": "acne_prone"},
+        {"skin_type": "dry", "concerns": ["aging", "dryness"], "routine_type": "anti_aging", "include_web": True},
+    ],
+    "compare_products": [
+        {"products": [{"brand": "cosrx", "product_name": "Snail Essence"},
+                      {"brand": "laneige", "product_name": "Water Sleeping Mask"}]},
+        {"products": [{"brand": "sulwhasoo", "product_name": "First Care Activating Serum"},
+                      {"brand": "innisfree", "product_name": "Green Tea Seed Serum"},
+                      {"brand": "beauty of joseon", "product_name": "Relief Sun"}]},
+    ],
+    "analyze_skin_photo": [{"image_data": None, "additional_info": "oily T-zone"}],  # filled in by sample_photo()
+    "skin_concern_matcher": [
+        {"concerns": ["acne", "pores"], "skin_type": "oily"},
+        {"concerns": ["aging", "pigmentation"], "skin_type": "dry", "budget": "luxury"},
+    ],
+    "filter_products": [
+        {"types": ["serum"], "skin_types": ["Oily"], "sort": "price"},
+        {"benefits": ["hydration"], "max_price": 30, "limit": 20},
+    ],
+    "check_shelf_compatibility": [
+        {"products": [
+            {"name": "AHA toner", "ingredients": ["Water", "Glycolic Acid", "Glycerin"], "routine": "PM"},
+            {"name": "Retinol serum", "ingredients": "Water, Retinol, Squalane, Niacinamide", "routine": "PM"},
+            {"name": "Vitamin C serum", "ingredients": ["Ascorbic Acid", "Ferulic Acid"], "routine": "AM"},
+        ]},
+    ],
+    "build_routine": [
+        {"skin_type": "oily", "concerns": ["acne"], "routine_type": "acne_prone"},
+        {"skin_type": "dry", "concerns": ["aging", "dryness"], "budget_usd": 150, "top_k": 3},
+    ],
+    "server_stats": [{}, {"format": "json"}],
+    "batch_call": [
+        {"calls": [
+            {"name": "analyze_ingredients", "arguments": {"ingredient": "snail mucin"}},
+            {"name": "filter_products", "arguments": {"types": ["toner"]}},
+            {"name": "get_product_info", "arguments": {"brand": "cosrx", "include_web": True}},
+        ]},
+    ],
+}
+
+
+def sample_photo() -> Optional[str]:
+    """A synthetic face-sized JPEG, or None without Pillow."""
+    try:
+        from PIL import Image, ImageDraw, ImageFilter
+    except ImportError:
+        return None
+    image = Image.new("RGB", (600, 800), (205, 160, 140))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse([100, 120, 500, 700], fill=(225, 180, 160))
+    draw.ellipse([190, 300, 270, 350], fill=(70, 50, 40))
+    draw.ellipse([330, 300, 410, 350], fill=(70, 50, 40))
+    buffer = io.BytesIO()
+    image.filter(ImageFilter.GaussianBlur(4)).save(buffer, format="JPEG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of ``values`` (q in 0-100)."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+async def run_load(
+    server, name: str, variants: List[Dict[str, Any]], calls: int, concurrency: int, upstream: Dict[str, int]
+) -> Dict[str, Any]:
+    """Time ``calls`` calls of one tool with at most ``concurrency`` in flight.
+
+    ``upstream`` is the fake server's request and error tally.
+    """
+    latencies: List[float] = []
+    exceptions = 0
+    next_call = 0
+    upstream_before = dict(upstream)
+
+    async def worker():
+        nonlocal exceptions, next_call
+        while next_call < calls:
+            arguments = variants[next_call % len(variants)]
+            next_call += 1
+            started = time.perf_counter()
+            try:
+                await server.call_tool(name, arguments)
+            except Exception:
+                exceptions += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "calls": len(latencies),
+        "errors": upstream["errors"] - upstream_before["errors"],
+        "exceptions": exceptions,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "throughput_per_s": round(len(latencies) / elapsed, 1),
+    }
+
+
+async def measure_allocations(server, name: str, variants: List[Dict[str, Any]], runs: int) -> Dict[str, float]:
+    """Median peak and retained traced heap (KiB) over ``runs`` sequential calls."""
+    peaks: List[float] = []
+    retained: List[float] = []
+    tracemalloc.start()
+    try:
+        for i in range(runs):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            try:
+                await server.call_tool(name, variants[i % len(variants)])
+            except Exception:
+                pass
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append((peak - before) / 1024)
+            retained.append((current - before) / 1024)
+    finally:
+        tracemalloc.stop()
+    return {"alloc_peak_kib": round(statistics.median(peaks), 1), "retained_kib": round(statistics.median(retained), 1)}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: Optional[float]) -> bool:
+    """Print p50/p95 changes against ``baseline``; False if a p95 regressed past the limit."""
+    ok = True
+    print(f"\nChange vs baseline {baseline['meta'].get('commit') or '(unknown commit)'}:")
+    for tool, levels in results["tools"].items():
+        for level, stats in levels["load"].items():
+            before = baseline["tools"].get(tool, {}).get("load", {}).get(level)
+            if not before:
+                continue
+            p50 = (stats["p50_ms"] - before["p50_ms"]) / max(before["p50_ms"], 1e-3) * 100
+            p95 = (stats["p95_ms"] - before["p95_ms"]) / max(before["p95_ms"], 1e-3) * 100
+            flag = ""
+            if max_regression is not None and p95 > max_regression:
+                flag, ok = "  REGRESSION", False
+            print(f"  {tool:<26} c={level:<4} p50 {p50:+6.1f}%  p95 {p95:+6.1f}%{flag}")
+    return ok
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    runner, url = await fake_ddg.start(fake_ddg.config_from_args(args))
+    os.environ["KBEAUTY_SEARCH_URL"] = url
+    os.environ["KBEAUTY_CACHE_PATH"] = ""
+    if args.cache == "cold":
+        os.environ["KBEAUTY_PHOTO_CACHE_ENTRIES"] = "0"
+    import kbeauty_mcp
+    from search_cache import MemoryCache
+
+    if args.cache == "cold":
+        kbeauty_mcp.search_cache.backend = MemoryCache(max_entries=0)
+    # Injected upstream errors would otherwise log a warning per call
+    logging.disable(logging.WARNING)
+    upstream = runner.app[fake_ddg.STATS]
+    levels = [int(level) for level in args.concurrency.split(",")]
+    photo = sample_photo()
+    tools: Dict[str, Any] = {}
+    try:
+        async with kbeauty_mcp.server_resources():
+            listed = [tool.name for tool in await kbeauty_mcp.list_tools()]
+            missing = [name for name in listed if name not in SAMPLE_CALLS]
+            if missing:
+                raise SystemExit(f"No sample arguments for: {', '.join(missing)}")
+            for name in listed:
+                if args.tools and name not in args.tools:
+                    continue
+                variants = SAMPLE_CALLS[name]
+                if name == "analyze_skin_photo":
+                    if photo is None:
+                        tools[name] = {"skipped": "Pillow is not installed"}
+                        continue
+                    variants = [{**variant, "image_data": photo} for variant in variants]
+
+                started = time.perf_counter()
+                await kbeauty_mcp.call_tool(name, variants[0])
+                first_call = (time.perf_counter() - started) * 1000
+                for i in range(args.warmup):
+                    await kbeauty_mcp.call_tool(name, variants[i % len(variants)])
+
+                requests_before = upstream["requests"]
+                load = {}
+                for level in levels:
+                    load[str(level)] = await run_load(kbeauty_mcp, name, variants, args.calls, level, upstream)
+                tools[name] = {
+                    "first_call_ms": round(first_call, 3),
+                    "upstream_requests": upstream["requests"] - requests_before,
+                    "load": load,
+                    **await measure_allocations(kbeauty_mcp, name, variants, args.alloc_runs),
+                }
+                print(f"{name:<26} " + "  ".join(
+                    f"c={level}: p50 {stats['p50_ms']:.1f} p95 {stats['p95_ms']:.1f} p99 {stats['p99_ms']:.1f} ms,"
+                    f" {stats['throughput_per_s']:.0f}/s, {stats['errors']} errors" for level, stats in load.items()
+                ) + f"  peak {tools[name]['alloc_peak_kib']:.0f} KiB", flush=True)
+    finally:
+        await runner.cleanup()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "cache": args.cache,
+            "calls": args.calls,
+            "concurrency": levels,
+            "upstream": {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms,
+                         "error_rate": args.error_rate, "payload": args.payload},
+        },
+        "tools": tools,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=100, help="timed calls per tool and concurrency (default 100)")
+    parser.add_argument("--concurrency", default="1,8", help="comma-separated concurrency levels (default 1,8)")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed calls per tool before measuring")
+    parser.add_argument("--alloc-runs", type=int, default=20, help="sequential calls traced for allocations")
+    parser.add_argument("--cache", choices=("warm", "cold"), default="warm", help="keep or disable result caches")
+    parser.add_argument("--tools", nargs="+", help="only these tools (default every listed tool)")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--max-regression", type=float, help="with --baseline, fail when a p95 grows by more percent")
+    fake_ddg.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            if not compare(results, json.load(f), args.max_regression):
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
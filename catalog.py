@@ -0,0 +1,246 @@
+"""
+Columnar brand and product catalog.
+
+Products are stored column by column instead of as one dict per product:
+parallel arrays of integers for brand, type and price, with ``type``,
+``skin_types`` and ``key_benefits`` interned into one shared string table
+and the list-valued columns packed into flat id arrays with offsets. Per
+product that is its name plus a few dozen bytes, however large the catalog
+grows.
+
+The catalog is read from a JSON data file on first use, so importing the
+server stays cheap. ``BrandsView`` presents it in the nested
+``KBEAUTY_BRANDS`` shape (brand -> fields and ``popular_products``), with
+each product materialized on access.
+"""
+
+import json
+import os
+from array import array
+from bisect import bisect_right
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from config import env_str
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "catalog.json")
+
+# Column order of each product row in the data file
+PRODUCT_COLUMNS = ("brand", "name", "type", "price_usd", "key_benefits", "skin_types")
+PRODUCT_FIELDS = PRODUCT_COLUMNS[1:]
+
+
+class StringTable:
+    """Interned strings addressed by small integer ids."""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._strings: List[str] = []
+
+    def intern(self, text: str) -> int:
+        return self._ids.setdefault(text, len(self._ids))
+
+    def intern_all(self, texts: Iterable[str]) -> List[int]:
+        ids = self._ids
+        return [ids.setdefault(text, len(ids)) for text in texts]
+
+    def __getitem__(self, string_id: int) -> str:
+        if len(self._strings) < len(self._ids):
+            # Ids are dense and in insertion order, so the reverse table is the key list
+            self._strings = list(self._ids)
+        return self._strings[string_id]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class Catalog:
+    """Brands plus a columnar product table, grouped by brand."""
+
+    def __init__(self, brands: Mapping, products: Iterable[Sequence[Any]]):
+        # Brand metadata stays as small dicts: brands number in the hundreds at most
+        self._brands: Dict[str, Dict[str, Any]] = {
+            key: {field: value for field, value in brand.items() if field != "popular_products"}
+            for key, brand in brands.items()
+        }
+        self._brand_keys = list(self._brands)
+        self._brand_ids = brand_ids = {key: i for i, key in enumerate(self._brand_keys)}
+        self.strings = StringTable()
+        self._names: List[str] = []
+        self._types = array("I")
+        self._price_cents = array("Q")
+        self._benefit_offsets = array("I", [0])
+        self._benefit_ids = array("I")
+        self._skin_offsets = array("I", [0])
+        self._skin_ids = array("I")
+
+        rows = list(products)
+        for row in rows:
+            if row[0] not in brand_ids:
+                raise ValueError(f"Product {row[1]!r} refers to unknown brand {row[0]!r}")
+        # Stable sort: products stay in file order within their brand
+        rows.sort(key=lambda row: brand_ids[row[0]])
+        brand_counts = [0] * len(brand_ids)
+        intern, intern_all = self.strings.intern, self.strings.intern_all
+        for brand_key, name, product_type, price_usd, benefits, skin_types in rows:
+            brand_counts[brand_ids[brand_key]] += 1
+            self._names.append(name)
+            self._types.append(intern(product_type))
+            self._price_cents.append(round(price_usd * 100))
+            self._benefit_ids.extend(intern_all(benefits))
+            self._benefit_offsets.append(len(self._benefit_ids))
+            self._skin_ids.extend(intern_all(skin_types))
+            self._skin_offsets.append(len(self._skin_ids))
+
+        self._brand_offsets = array("I", [0])
+        for count in brand_counts:
+            self._brand_offsets.append(self._brand_offsets[-1] + count)
+
+    @classmethod
+    def from_file(cls, path: str) -> "Catalog":
+        """Load a catalog data file: ``{"brands": {...}, "columns": [...], "products": [[...], ...]}``."""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if tuple(data.get("columns", ())) != PRODUCT_COLUMNS:
+            raise ValueError(f"{path}: product columns must be {list(PRODUCT_COLUMNS)}")
+        return cls(data["brands"], data["products"])
+
+    @classmethod
+    def from_brands(cls, brands: Mapping) -> "Catalog":
+        """Build a catalog from the nested ``KBEAUTY_BRANDS`` dict shape."""
+        rows = (
+            [key, *(product[field] for field in PRODUCT_FIELDS)]
+            for key, brand in brands.items()
+            for product in brand.get("popular_products", [])
+        )
+        return cls(brands, rows)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def brand_keys(self) -> List[str]:
+        return list(self._brand_keys)
+
+    def brand_info(self, brand_key: str) -> Dict[str, Any]:
+        """Brand fields other than its products; raises ``KeyError`` for unknown brands."""
+        return self._brands[brand_key]
+
+    def product_ids(self, brand_key: str) -> range:
+        index = self._brand_ids[brand_key]
+        return range(self._brand_offsets[index], self._brand_offsets[index + 1])
+
+    def brand_of(self, product_id: int) -> str:
+        """Key of the brand a product belongs to."""
+        return self._brand_keys[bisect_right(self._brand_offsets, product_id) - 1]
+
+    def product(self, product_id: int) -> "ProductView":
+        return ProductView(self, product_id)
+
+    def products_of(self, brand_key: str) -> List["ProductView"]:
+        return [ProductView(self, product_id) for product_id in self.product_ids(brand_key)]
+
+    def price_cents(self, product_id: int) -> int:
+        return self._price_cents[product_id]
+
+    def string_ids(self, product_id: int, name: str) -> Sequence[int]:
+        """Interned ids of a ``type``, ``key_benefits`` or ``skin_types`` field, without decoding."""
+        if name == "type":
+            return (self._types[product_id],)
+        if name == "key_benefits":
+            return self._benefit_ids[self._benefit_offsets[product_id]:self._benefit_offsets[product_id + 1]]
+        if name == "skin_types":
+            return self._skin_ids[self._skin_offsets[product_id]:self._skin_offsets[product_id + 1]]
+        raise KeyError(name)
+
+    def field(self, product_id: int, name: str) -> Any:
+        """One field of one product, decoded from its column."""
+        if name == "name":
+            return self._names[product_id]
+        if name == "type":
+            return self.strings[self._types[product_id]]
+        if name == "price_usd":
+            cents = self._price_cents[product_id]
+            return cents // 100 if cents % 100 == 0 else cents / 100
+        if name in ("key_benefits", "skin_types"):
+            return [self.strings[string_id] for string_id in self.string_ids(product_id, name)]
+        raise KeyError(name)
+
+
+class ProductView(Mapping):
+    """Read-only dict-like view of one catalog product."""
+
+    __slots__ = ("_catalog", "_id")
+
+    def __init__(self, catalog: Catalog, product_id: int):
+        self._catalog = catalog
+        self._id = product_id
+
+    def __getitem__(self, name: str) -> Any:
+        return self._catalog.field(self._id, name)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(PRODUCT_FIELDS)
+
+    def __len__(self) -> int:
+        return len(PRODUCT_FIELDS)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ProductView):
+            return self._catalog is other._catalog and self._id == other._id
+        return super().__eq__(other)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"ProductView({dict(self)!r})"
+
+
+class BrandView(Mapping):
+    """Read-only view of one brand in the nested ``KBEAUTY_BRANDS`` shape."""
+
+    __slots__ = ("_catalog", "_key")
+
+    def __init__(self, catalog: Catalog, brand_key: str):
+        self._catalog = catalog
+        self._key = brand_key
+
+    def __getitem__(self, name: str) -> Any:
+        if name == "popular_products":
+            return self._catalog.products_of(self._key)
+        return self._catalog.brand_info(self._key)[name]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._catalog.brand_info(self._key)
+        yield "popular_products"
+
+    def __len__(self) -> int:
+        return len(self._catalog.brand_info(self._key)) + 1
+
+
+class BrandsView(Mapping):
+    """Lazy ``brand key -> BrandView`` mapping; the catalog loads on first access."""
+
+    def __init__(self, loader: Callable[[], Catalog]):
+        self._loader = loader
+        self._catalog: Optional[Catalog] = None
+
+    @property
+    def catalog(self) -> Catalog:
+        if self._catalog is None:
+            self._catalog = self._loader()
+        return self._catalog
+
+    def __getitem__(self, brand_key: str) -> BrandView:
+        self.catalog.brand_info(brand_key)
+        return BrandView(self.catalog, brand_key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.catalog.brand_keys())
+
+    def __len__(self) -> int:
+        return len(self.catalog.brand_keys())
+
+
+def load_default_catalog() -> Catalog:
+    """Load the catalog named by ``KBEAUTY_CATALOG_PATH`` (the bundled one by default)."""
+    return Catalog.from_file(env_str("KBEAUTY_CATALOG_PATH", "") or DEFAULT_CATALOG_PATH)
@@ -0,0 +1,150 @@
+"""
+Async concurrency helpers shared by the tool handlers.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one in-flight task.
+
+    Every caller awaiting the same key receives the same result or the same
+    exception. A caller being cancelled only detaches that caller; the shared
+    task is cancelled once its last waiter has gone away.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody is left to receive the result; stop the upstream work
+                # and make sure later callers start a fresh flight.
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+class Overloaded(Exception):
+    """No capacity freed up within the admission gate's queue timeout."""
+
+
+class AdmissionGate:
+    """Backpressure for work shared by many clients.
+
+    At most ``limit`` callers are admitted at once. The rest queue for up to
+    ``queue_timeout`` seconds and are then turned away with ``Overloaded``,
+    so a burst turns into quick, retryable refusals instead of an ever
+    growing backlog that makes every caller slow.
+    """
+
+    def __init__(self, limit: int, queue_timeout: float):
+        self.limit = max(1, limit)
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _slots(self) -> asyncio.Semaphore:
+        # One semaphore per event loop, so the gate survives asyncio.run() being called again
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._semaphore = loop, asyncio.Semaphore(self.limit)
+        return self._semaphore
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        slots = self._slots()
+        if slots.locked():
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise Overloaded(f"{self.in_flight} calls in flight, {self.waiting} waiting") from None
+            finally:
+                self.waiting -= 1
+        else:
+            await slots.acquire()
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            slots.release()
+
+
+async def gather_bounded(
+    factories: Sequence[Callable[[], Awaitable[T]]],
+    limit: int,
+    deadline: Optional[float],
+    fallback: Callable[[int, BaseException], T],
+) -> List[T]:
+    """Run coroutine factories concurrently and return their results in input order.
+
+    At most ``limit`` run at once. Items that raise, or are still pending when
+    ``deadline`` seconds have passed, are replaced by ``fallback(index, error)``
+    (an ``asyncio.TimeoutError`` for items that ran out of time) instead of
+    failing or stalling the whole batch.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(factory: Callable[[], Awaitable[T]]) -> T:
+        async with semaphore:
+            return await factory()
+
+    tasks = [asyncio.ensure_future(run(factory)) for factory in factories]
+    if not tasks:
+        return []
+
+    try:
+        _, pending = await asyncio.wait(tasks, timeout=deadline)
+    except asyncio.CancelledError:
+        for task in tasks:
+            task.cancel()
+        raise
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+
+    results: List[T] = []
+    for index, task in enumerate(tasks):
+        if task in pending:
+            results.append(fallback(index, asyncio.TimeoutError()))
+        elif task.cancelled():
+            results.append(fallback(index, asyncio.CancelledError()))
+        elif task.exception() is not None:
+            results.append(fallback(index, task.exception()))
+        else:
+            results.append(task.result())
+    return results
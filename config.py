@@ -0,0 +1,38 @@
+"""
+Environment-driven settings helpers.
+
+All tunables are read from ``KBEAUTY_*`` environment variables so the server
+can be configured from the Claude Desktop ``env`` block without CLI flags.
+"""
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Ignoring invalid {name}={value!r}, using {default}")
+        return default
+
+
+def env_int(name: str, default: int) -> int:
+    return int(env_float(name, default))
+
+
+def env_str(name: str, default: str) -> str:
+    value = os.environ.get(name)
+    return default if value is None else value
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
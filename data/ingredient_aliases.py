@@ -0,0 +1,22 @@
+"""K-Beauty Ingredient Aliases
+
+INCI and common names of each canonical ingredient, so shelf checks can
+recognize "Sodium Hyaluronate" or "Glycolic Acid" on a label. Keys are
+canonical ingredient IDs: ``INGREDIENT_DATABASE`` keys, plus the actives
+its ``incompatible`` lists refer to.
+"""
+
+INGREDIENT_ALIASES = {
+    "snail_secretion": ["Snail Secretion Filtrate", "Snail Mucin", "Snail Mucus"],
+    "ginseng": ["Panax Ginseng Root Extract", "Panax Ginseng", "Red Ginseng", "Ginseng Root Extract"],
+    "niacinamide": ["Niacinamide", "Nicotinamide", "Vitamin B3"],
+    "hyaluronic_acid": ["Hyaluronic Acid", "Sodium Hyaluronate", "Hydrolyzed Hyaluronic Acid", "Sodium Acetylated Hyaluronate"],
+    "retinol": ["Retinol", "Retinal", "Retinaldehyde", "Retinyl Palmitate", "Hydroxypinacolone Retinoate", "Retinoid"],
+    "vitamin_c": [
+        "Vitamin C", "Ascorbic Acid", "L-Ascorbic Acid", "Ascorbyl Glucoside", "Sodium Ascorbyl Phosphate",
+        "Magnesium Ascorbyl Phosphate", "3-O-Ethyl Ascorbic Acid", "Ethyl Ascorbic Acid", "Ascorbyl Tetraisopalmitate",
+    ],
+    "aha": ["AHA", "Alpha Hydroxy Acid", "Glycolic Acid", "Lactic Acid", "Mandelic Acid"],
+    "bha": ["BHA", "Beta Hydroxy Acid", "Salicylic Acid", "Betaine Salicylate"],
+    "benzoyl_peroxide": ["Benzoyl Peroxide"],
+}
@@ -0,0 +1,53 @@
+"""K-Beauty Skin Analysis Patterns and Face Zones"""
+
+SKIN_ANALYSIS_PATTERNS = {
+    "acne_indicators": [
+        "blackheads", "whiteheads", "inflammatory papules", "pustules",
+        "cystic acne", "comedones", "pimples", "blemishes"
+    ],
+    "aging_indicators": [
+        "fine lines", "wrinkles", "sagging", "loss of firmness",
+        "age spots", "dark spots", "uneven texture", "dullness"
+    ],
+    "dryness_indicators": [
+        "flaking", "rough texture", "tightness", "dull appearance",
+        "fine lines from dehydration", "lack of glow"
+    ],
+    "sensitivity_indicators": [
+        "redness", "irritation", "inflammation", "broken capillaries",
+        "reactive skin", "burning sensation", "stinging"
+    ],
+    "pigmentation_indicators": [
+        "dark spots", "melasma", "post-inflammatory hyperpigmentation",
+        "sun damage", "uneven skin tone", "freckles", "age spots"
+    ],
+    "oily_indicators": [
+        "excess shine", "enlarged pores", "blackheads", "greasy t-zone",
+        "frequent breakouts", "thick skin texture"
+    ]
+}
+
+# Each zone's "regions" are [top, bottom, left, right] rectangles as fractions
+# of a centered 3:4 portrait crop of the face.
+SKIN_ZONE_ANALYSIS = {
+    "t_zone": {
+        "areas": ["forehead", "nose", "chin"],
+        "common_issues": ["oiliness", "blackheads", "enlarged pores", "acne"],
+        "regions": [[0.10, 0.28, 0.30, 0.70], [0.34, 0.62, 0.42, 0.58], [0.84, 0.95, 0.38, 0.62]]
+    },
+    "cheek_area": {
+        "areas": ["left cheek", "right cheek"],
+        "common_issues": ["dryness", "sensitivity", "aging", "pigmentation"],
+        "regions": [[0.48, 0.70, 0.14, 0.36], [0.48, 0.70, 0.64, 0.86]]
+    },
+    "eye_area": {
+        "areas": ["under eyes", "around eyes", "eyelids"],
+        "common_issues": ["fine lines", "dark circles", "puffiness", "dryness"],
+        "regions": [[0.40, 0.47, 0.20, 0.40], [0.40, 0.47, 0.60, 0.80]]
+    },
+    "mouth_area": {
+        "areas": ["around mouth", "lips"],
+        "common_issues": ["fine lines", "dryness", "pigmentation"],
+        "regions": [[0.70, 0.81, 0.32, 0.68]]
+    }
+}
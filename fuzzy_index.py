@@ -0,0 +1,243 @@
+"""
+Typo-tolerant lookup for K-Beauty names.
+
+Latin terms are indexed by character trigrams; Hangul is first decomposed
+into jamo so a single wrong vowel or final consonant only changes a few
+grams instead of a whole syllable. Candidates sharing enough grams with the
+query are verified with a bounded edit distance and the best k are returned.
+"""
+
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+_HANGUL_BASE = 0xAC00
+_HANGUL_LAST = 0xD7A3
+_JONGSEONG_COUNT = 28
+_JUNGSEONG_COUNT = 21
+# Compatibility jamo so decomposed text stays printable and comparable
+_CHOSEONG = "ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ"
+_JUNGSEONG = "ㅏㅐㅑㅒㅓㅔㅕㅖㅗㅘㅙㅚㅛㅜㅝㅞㅟㅠㅡㅢㅣ"
+_JONGSEONG = " ㄱㄲㄳㄴㄵㄶㄷㄹㄺㄻㄼㄽㄾㄿㅀㅁㅂㅄㅅㅆㅇㅈㅊㅋㅌㅍㅎ"
+
+
+class FuzzyMatch(NamedTuple):
+    """A fuzzy lookup result; lower distance is better."""
+
+    term: str
+    distance: int
+    score: float
+
+
+def decompose_hangul(text: str) -> str:
+    """Split precomposed Hangul syllables into their jamo ("설" -> "ㅅㅓㄹ")."""
+    chars = []
+    for char in text:
+        code = ord(char)
+        if _HANGUL_BASE <= code <= _HANGUL_LAST:
+            offset = code - _HANGUL_BASE
+            chars.append(_CHOSEONG[offset // (_JUNGSEONG_COUNT * _JONGSEONG_COUNT)])
+            chars.append(_JUNGSEONG[(offset // _JONGSEONG_COUNT) % _JUNGSEONG_COUNT])
+            final = _JONGSEONG[offset % _JONGSEONG_COUNT]
+            if final != " ":
+                chars.append(final)
+        else:
+            chars.append(char)
+    return "".join(chars)
+
+
+def fuzzy_key(text: str) -> str:
+    """Normalize text for fuzzy comparison: casefold, jamo, and no spacing.
+
+    Spaces and punctuation are dropped so "some by mi", "somebymi" and
+    "some-by-mi" compare equal, which also covers inconsistent Korean spacing.
+    """
+    return "".join(char for char in decompose_hangul(text.casefold()) if char.isalnum())
+
+
+def char_signature(key: str) -> int:
+    """64-bit set of the characters in ``key`` (hashed into bit positions)."""
+    signature = 0
+    for char in key:
+        signature |= 1 << (ord(char) % 64)
+    return signature
+
+
+def trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def bounded_edit_distance(a: str, b: str, limit: int) -> Optional[int]:
+    """Levenshtein distance between ``a`` and ``b``, or ``None`` if it exceeds ``limit``.
+
+    Uses Myers' bit-parallel algorithm: one column of the DP matrix is held
+    in a pair of integers, so each character of ``b`` costs a handful of
+    big-integer operations instead of a Python loop over ``a``.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return None
+    if not a or not b:
+        distance = max(len(a), len(b))
+        return distance if distance <= limit else None
+    peq: Dict[str, int] = {}
+    for i, char in enumerate(a):
+        peq[char] = peq.get(char, 0) | (1 << i)
+    mask = (1 << len(a)) - 1
+    high_bit = 1 << (len(a) - 1)
+    pv, mv, score = mask, 0, len(a)
+    remaining = len(b)
+    for char in b:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high_bit:
+            score += 1
+        elif mh & high_bit:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+        remaining -= 1
+        # The score can drop by at most one per remaining character
+        if score - remaining > limit:
+            return None
+    return score if score <= limit else None
+
+
+class FuzzyIndex:
+    """Trigram inverted index with edit-distance verification."""
+
+    def __init__(self, terms: Iterable[str] = ()):
+        self._terms: List[str] = []
+        self._keys: List[str] = []
+        self._signatures: List[int] = []
+        self._exact: Dict[str, int] = {}
+        # gram -> key length -> term ids, so lookups only touch plausible lengths
+        self._postings: Dict[str, Dict[int, List[int]]] = {}
+        for term in terms:
+            self.add(term)
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def add(self, term: str) -> None:
+        key = fuzzy_key(term)
+        if not key or key in self._exact:
+            return
+        term_id = len(self._terms)
+        self._terms.append(term)
+        self._keys.append(key)
+        self._exact[key] = term_id
+        self._signatures.append(char_signature(key))
+        for gram in trigrams(key):
+            self._postings.setdefault(gram, {}).setdefault(len(key), []).append(term_id)
+
+    @staticmethod
+    def max_distance(key: str) -> int:
+        """Allowed typos grow with length: 0 for very short keys, up to 3."""
+        if len(key) <= 3:
+            return 0
+        if len(key) <= 5:
+            return 1
+        if len(key) <= 10:
+            return 2
+        return 3
+
+    def search(self, text: str, k: int = 5, max_distance: Optional[int] = None) -> List[FuzzyMatch]:
+        """Return up to ``k`` indexed terms within the edit-distance bound of ``text``."""
+        key = fuzzy_key(text)
+        if not key:
+            return []
+        exact = self._exact.get(key)
+        if exact is not None and k == 1:
+            return [FuzzyMatch(self._terms[exact], 0, 1.0)]
+
+        limit = self.max_distance(key) if max_distance is None else max_distance
+        query_grams = trigrams(key)
+        # Iterative deepening: most typos are a single edit, and a tight bound
+        # keeps the candidate set tiny, so only widen it when results are short.
+        for bound in range(min(1, limit), limit + 1):
+            results = self._search_within(key, query_grams, bound, k)
+            if len(results) >= k:
+                break
+        return results
+
+    def _search_within(self, key: str, query_grams: Set[str], limit: int, k: int) -> List[FuzzyMatch]:
+        lengths = range(len(key) - limit, len(key) + limit + 1)
+        postings = []
+        for gram in query_grams:
+            by_length = self._postings.get(gram)
+            lists = [by_length[length] for length in lengths if length in by_length] if by_length else []
+            postings.append((sum(map(len, lists)), lists))
+
+        # Prefix filter: each edit destroys at most 3 grams, so a candidate
+        # within `limit` edits must contain one of the 3 * limit + 1 rarest
+        # query grams. Only those (short) posting lists generate candidates.
+        postings.sort(key=lambda item: item[0])
+        candidates: Set[int] = set()
+        for _, lists in postings[:3 * limit + 1]:
+            for term_ids in lists:
+                candidates.update(term_ids)
+
+        # Character filter: every character present in only one of the two
+        # strings needs its own edit, up to one per side for a substitution.
+        # Then a count filter on the exact gram overlap, verifying the most
+        # overlapping candidates first.
+        query_signature = char_signature(key)
+        query_count = len(query_grams)
+        keys = self._keys
+        signatures = self._signatures
+        scored = []
+        for term_id in candidates:
+            signature = signatures[term_id]
+            if (query_signature & ~signature).bit_count() > limit or (signature & ~query_signature).bit_count() > limit:
+                continue
+            candidate_grams = trigrams(keys[term_id])
+            shared = len(query_grams & candidate_grams)
+            if max(query_count, len(candidate_grams)) - shared <= 3 * limit:
+                scored.append((shared - len(candidate_grams), term_id))
+        scored.sort()
+
+        results: List[FuzzyMatch] = []
+        worst = limit
+        for _, term_id in scored:
+            candidate = keys[term_id]
+            distance = bounded_edit_distance(key, candidate, worst)
+            if distance is None:
+                continue
+            score = 1.0 - distance / max(len(key), len(candidate))
+            results.append(FuzzyMatch(self._terms[term_id], distance, score))
+            if len(results) >= k:
+                results.sort(key=lambda match: (match.distance, -match.score, match.term))
+                del results[k:]
+                worst = results[-1].distance
+        results.sort(key=lambda match: (match.distance, -match.score, match.term))
+        return results[:k]
+
+    def best(self, text: str, max_distance: Optional[int] = None) -> Optional[FuzzyMatch]:
+        matches = self.search(text, k=1, max_distance=max_distance)
+        return matches[0] if matches else None
+
+    def find_in_text(self, text: str, max_window: int = 3, min_score: float = 0.6) -> List[FuzzyMatch]:
+        """Fuzzy-match runs of up to ``max_window`` words anywhere in ``text``.
+
+        Longer runs are tried first and the words they cover are not reused,
+        so "beuty of josun" resolves as one term rather than three.
+        """
+        words = text.split()
+        used = [False] * len(words)
+        found: List[FuzzyMatch] = []
+        for size in range(min(max_window, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                if any(used[start:start + size]):
+                    continue
+                match = self.best(" ".join(words[start:start + size]))
+                if match is None or match.score < min_score:
+                    continue
+                if all(match.term != seen.term for seen in found):
+                    found.append(match)
+                for i in range(start, start + size):
+                    used[i] = True
+        return found
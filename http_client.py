@@ -0,0 +1,108 @@
+"""
+Shared HTTP client for upstream web searches.
+
+One pooled aiohttp session lives for the whole server lifetime so repeated
+searches reuse keep-alive connections and cached DNS lookups instead of
+paying a fresh TCP+TLS handshake per query.
+
+aiohttp is imported when the first session is created rather than with this
+module: it is the heaviest import of the server and tools that never reach
+the web should not pay for it at startup.
+"""
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+from config import env_float, env_int
+
+if TYPE_CHECKING:
+    import aiohttp
+
+
+@dataclass
+class HttpClientConfig:
+    """Connection pool and timeout settings for upstream requests."""
+
+    limit: int = 100                  # total open connections
+    limit_per_host: int = 10          # connections per upstream host
+    dns_cache_ttl: int = 300          # seconds to keep resolved addresses
+    keepalive_timeout: float = 30.0   # seconds an idle connection stays open
+    connect_timeout: float = 3.0      # TCP connect + TLS handshake
+    read_timeout: float = 5.0         # gap between received chunks
+    total_timeout: float = 10.0       # whole request, including redirects
+
+    @classmethod
+    def from_env(cls) -> "HttpClientConfig":
+        """Build a config from ``KBEAUTY_HTTP_*`` environment variables."""
+        return cls(
+            limit=env_int("KBEAUTY_HTTP_LIMIT", cls.limit),
+            limit_per_host=env_int("KBEAUTY_HTTP_LIMIT_PER_HOST", cls.limit_per_host),
+            dns_cache_ttl=env_int("KBEAUTY_HTTP_DNS_CACHE_TTL", cls.dns_cache_ttl),
+            keepalive_timeout=env_float("KBEAUTY_HTTP_KEEPALIVE", cls.keepalive_timeout),
+            connect_timeout=env_float("KBEAUTY_HTTP_CONNECT_TIMEOUT", cls.connect_timeout),
+            read_timeout=env_float("KBEAUTY_HTTP_READ_TIMEOUT", cls.read_timeout),
+            total_timeout=env_float("KBEAUTY_HTTP_TOTAL_TIMEOUT", cls.total_timeout),
+        )
+
+
+class HttpClient:
+    """Server-lifetime owner of a pooled ``aiohttp.ClientSession``.
+
+    Use as an async context manager around the server run loop so the
+    session is closed on shutdown. The session itself is created on first
+    use, which keeps the server's cold start free of aiohttp and lets tools
+    work outside of ``main()`` (tests, scripts); call ``start()`` to create
+    it up front.
+    """
+
+    def __init__(self, config: Optional[HttpClientConfig] = None):
+        self.config = config or HttpClientConfig.from_env()
+        self._session: Optional["aiohttp.ClientSession"] = None
+
+    def _create_session(self) -> "aiohttp.ClientSession":
+        import aiohttp
+
+        config = self.config
+        connector = aiohttp.TCPConnector(
+            limit=config.limit,
+            limit_per_host=config.limit_per_host,
+            ttl_dns_cache=config.dns_cache_ttl,
+            use_dns_cache=True,
+            keepalive_timeout=config.keepalive_timeout,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=config.total_timeout,
+            sock_connect=config.connect_timeout,
+            sock_read=config.read_timeout,
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    @property
+    def session(self) -> "aiohttp.ClientSession":
+        """Return the shared session, creating it on first access."""
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+
+    def request_timeout(self, budget: Optional[float]) -> "aiohttp.ClientTimeout":
+        """Per-request timeout that never outlives the caller's remaining budget."""
+        import aiohttp
+
+        config = self.config
+        total = config.total_timeout if budget is None else min(config.total_timeout, budget)
+        return aiohttp.ClientTimeout(
+            total=total,
+            sock_connect=min(config.connect_timeout, total),
+            sock_read=min(config.read_timeout, total),
+        )
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self) -> "HttpClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
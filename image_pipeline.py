@@ -0,0 +1,197 @@
+"""
+Off-event-loop pipeline for skin photo analysis.
+
+Base64 decoding, image decoding, downscaling and analysis all run in a
+process pool so a large selfie never blocks the asyncio loop serving the
+other tools. Inputs are size-checked before they are queued, and the queue
+itself is bounded: when it is full new photos are turned away immediately
+instead of piling up.
+
+Finished analyses are remembered by perceptual hash, so a resubmitted,
+recompressed or resized selfie only pays for a decode instead of the full
+decode-and-analyze path.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from copy import deepcopy
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+
+from config import env_int
+from skin_analysis import ImageRejected, analyze_image_data, analyze_unless_known
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineBusy(ImageRejected):
+    """Every worker is busy and the waiting queue is full."""
+
+
+class WorkerCrashed(ImageRejected):
+    """A worker died mid-job (e.g. out of memory); the pool has been replaced."""
+
+
+class PhotoResultCache:
+    """Size-bounded LRU of analyses keyed by 64-bit perceptual hash.
+
+    Lookups accept any stored hash within ``max_distance`` differing bits
+    and return the closest. The default of 3 bits catches recompressed and
+    resized copies; larger distances also catch re-crops, but can hand one
+    person's analysis to a different, similar-looking photo. Only hashes
+    and analysis dicts are kept, never image bytes; the scan is a few
+    hundred integer XORs at the default size.
+    Analyses are copied in and out, so callers may modify what they get.
+    """
+
+    def __init__(self, max_entries: int = 256, max_distance: int = 3):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, fingerprint: int) -> Optional[Dict[str, Any]]:
+        best, best_distance = None, self.max_distance + 1
+        if fingerprint in self._entries:
+            best, best_distance = fingerprint, 0
+        elif self.max_distance > 0:
+            for stored in self._entries:
+                distance = (stored ^ fingerprint).bit_count()
+                if distance < best_distance:
+                    best, best_distance = stored, distance
+        if best is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(best)
+        return deepcopy(self._entries[best])
+
+    def fingerprints(self) -> List[int]:
+        return list(self._entries)
+
+    def put(self, fingerprint: int, analysis: Dict[str, Any]) -> None:
+        self._entries[fingerprint] = deepcopy(analysis)
+        self._entries.move_to_end(fingerprint)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class PhotoPipeline:
+    """Bounded process pool for photo analysis jobs."""
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_pending: int = 8,
+        max_bytes: int = 8 * 1024 * 1024,
+        max_pixels: int = 40_000_000,
+        results: Optional[PhotoResultCache] = None,
+    ):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.results = results
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+
+    @classmethod
+    def from_env(cls) -> "PhotoPipeline":
+        """Build a pipeline from ``KBEAUTY_PHOTO_*`` environment variables.
+
+        ``KBEAUTY_PHOTO_CACHE_ENTRIES=0`` turns the result cache off.
+        """
+        cache_entries = env_int("KBEAUTY_PHOTO_CACHE_ENTRIES", 256)
+        results = None
+        if cache_entries > 0:
+            results = PhotoResultCache(cache_entries, env_int("KBEAUTY_PHOTO_CACHE_DISTANCE", 3))
+        return cls(
+            workers=env_int("KBEAUTY_PHOTO_WORKERS", min(2, os.cpu_count() or 1)),
+            max_pending=env_int("KBEAUTY_PHOTO_MAX_PENDING", 8),
+            max_bytes=env_int("KBEAUTY_PHOTO_MAX_BYTES", 8 * 1024 * 1024),
+            max_pixels=env_int("KBEAUTY_PHOTO_MAX_PIXELS", 40_000_000),
+            results=results,
+        )
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned workers only import skin_analysis, not the server
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def check_input(self, image_data: str) -> None:
+        """Reject oversized input before it is copied to a worker."""
+        if len(image_data) > self.max_bytes:
+            raise ImageRejected(
+                f"The image is too large ({len(image_data) // 1024} KB encoded); "
+                f"please upload a photo under {self.max_bytes // (1024 * 1024)} MB."
+            )
+
+    async def run(self, fn, *args) -> Any:
+        """Run ``fn(*args)`` in the pool, rejecting the job when the queue is full."""
+        if self._in_flight >= self.workers + self.max_pending:
+            raise PipelineBusy("Photo analysis is busy right now; please try again in a moment.")
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        try:
+            future = executor.submit(fn, *args)
+            self._in_flight += 1
+            # A caller that stops waiting (a timeout) does not stop a job already
+            # running in a worker, so the slot is only freed when the job finishes
+            future.add_done_callback(lambda _: self._job_done(loop))
+            return await asyncio.wrap_future(future, loop=loop)
+        except BrokenProcessPool as e:
+            self._replace_broken(executor)
+            raise WorkerCrashed("Photo analysis failed unexpectedly; please try again in a moment.") from e
+
+    def _replace_broken(self, executor: ProcessPoolExecutor) -> None:
+        # A broken pool rejects every later job, so the next one starts a new
+        # pool; other callers failing on the same pool must not drop that one
+        if self._executor is executor:
+            logger.warning("Photo worker pool broke; starting a new one for the next job")
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _job_done(self, loop: asyncio.AbstractEventLoop) -> None:
+        # Called from the pool's management thread; the count lives on the loop
+        try:
+            loop.call_soon_threadsafe(self._release_slot)
+        except RuntimeError:
+            pass  # the loop has closed along with the server
+
+    def _release_slot(self) -> None:
+        self._in_flight -= 1
+
+    async def analyze(self, image_data: str) -> Dict[str, Any]:
+        self.check_input(image_data)
+        if self.results is None:
+            return await self.run(analyze_image_data, image_data, self.max_pixels)
+
+        # One job decodes the photo and skips the analysis when a near duplicate is cached
+        fingerprint, analysis = await self.run(
+            analyze_unless_known, image_data, self.max_pixels, self.results.fingerprints(), self.results.max_distance
+        )
+        cached = self.results.get(fingerprint)
+        if cached is not None:
+            return cached
+        if analysis is None:
+            # The near duplicate was evicted while the job ran
+            analysis = await self.run(analyze_image_data, image_data, self.max_pixels)
+        self.results.put(fingerprint, analysis)
+        return analysis
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,175 @@
+"""
+Ingredient conflict graph.
+
+The free-text ``incompatible`` notes of the ingredient database ("AHA",
+"Vitamin C at same time") are resolved once, at load time, into canonical
+ingredient IDs, and every ID gets an adjacency bitset of the IDs it
+conflicts with. Edges are symmetric: retinol's note against AHA also flags
+AHA against retinol.
+
+Ingredient labels are recognized with one Aho-Corasick pass over the text,
+so checking a whole shelf costs one pass per label plus the conflicts
+found, with no pairwise string comparisons.
+"""
+
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from knowledge_index import name_variants, normalize_name
+from product_filter import set_bits
+from term_matcher import TermMatcher
+
+
+class Conflict(NamedTuple):
+    """Two ingredient groups (e.g. products on a shelf) holding conflicting ingredients."""
+
+    first: int              # index of the first group
+    second: int             # index of the second group, always greater
+    first_ingredient: str   # canonical ID found in the first group
+    second_ingredient: str  # canonical ID found in the second group
+    detail: str             # qualifier from the database note, e.g. "at same time"
+
+
+class IngredientGraph:
+    """Canonical ingredient IDs, their aliases and the conflicts between them."""
+
+    def __init__(
+        self,
+        ingredients: Mapping[str, Mapping],
+        aliases: Optional[Mapping[str, Iterable[str]]] = None,
+        entry_cache_size: int = 8192,
+    ):
+        self.entry_cache_size = entry_cache_size
+        self._entry_cache: Dict[str, Tuple[str, ...]] = {}
+        self._ids: Dict[str, int] = {}
+        self._keys: List[str] = []
+        self._names: List[str] = []
+        self._adjacency: List[int] = []
+        self._details: Dict[Tuple[int, int], str] = {}
+        self._matcher = TermMatcher()
+
+        for key, ingredient in ingredients.items():
+            terms = [key.replace("_", " "), *name_variants(ingredient["name"])]
+            if ingredient.get("korean_name"):
+                terms.append(ingredient["korean_name"])
+            self._register(key, ingredient["name"], terms)
+        for key, names in (aliases or {}).items():
+            names = list(names)
+            self._register(key, names[0] if names else key.replace("_", " ").title(), names)
+
+        for key, ingredient in ingredients.items():
+            for note in ingredient.get("incompatible", []):
+                self._add_conflict(self._ids[key], note)
+        # Conflict-only ingredients registered above join the automaton here
+        self._matcher.compile()
+
+    def _register(self, key: str, name: str, terms: Iterable[str]) -> int:
+        index = self._ids.get(key)
+        if index is None:
+            index = self._ids[key] = len(self._keys)
+            self._keys.append(key)
+            self._names.append(name)
+            self._adjacency.append(0)
+        for term in terms:
+            self._matcher.add(normalize_name(term), key)
+        return index
+
+    def _add_conflict(self, source: int, note: str) -> None:
+        text = normalize_name(note)
+        matches = self._matcher.find_all(text)
+        if matches:
+            targets = {self._ids[match.kind] for match in matches}
+            # Whatever the note says beyond the ingredient name qualifies the conflict
+            detail = " ".join((text[:matches[0].start] + " " + text[matches[-1].end:]).split())
+        else:
+            # An ingredient only ever mentioned as a conflict still gets an ID
+            targets = {self._register(text.replace(" ", "_"), note, [text])}
+            detail = ""
+        for target in targets - {source}:
+            self._adjacency[source] |= 1 << target
+            self._adjacency[target] |= 1 << source
+            self._details[(min(source, target), max(source, target))] = detail
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._ids
+
+    def name(self, key: str) -> str:
+        """Display name of a canonical ID."""
+        return self._names[self._ids[key]]
+
+    def resolve(self, text: str) -> List[str]:
+        """Canonical IDs of the ingredients named in ``text``, in order of first mention."""
+        found: List[str] = []
+        for match in self._matcher.find_all(normalize_name(text)):
+            if match.kind not in found:
+                found.append(match.kind)
+        return found
+
+    def resolve_names(self, names: Iterable[str]) -> List[str]:
+        """Like ``resolve`` for a list of label entries, memoized per entry.
+
+        Real labels share most of their entries (water, glycerin, ...), so
+        after the first few shelves nearly every entry is a dict lookup.
+        """
+        found: List[str] = []
+        for name in names:
+            keys = self._entry_cache.get(name)
+            if keys is None:
+                keys = tuple(self.resolve(name))
+                if len(self._entry_cache) >= self.entry_cache_size:
+                    self._entry_cache.clear()
+                self._entry_cache[name] = keys
+            found.extend(key for key in keys if key not in found)
+        return found
+
+    def bits(self, keys: Iterable[str]) -> int:
+        """Bitset of canonical IDs, for fast set tests against ``conflict_bits``."""
+        mask = 0
+        for key in keys:
+            mask |= 1 << self._ids[key]
+        return mask
+
+    def conflict_bits(self, keys: Iterable[str]) -> int:
+        """Bitset of every ID that conflicts with any of ``keys``."""
+        mask = 0
+        for key in keys:
+            mask |= self._adjacency[self._ids[key]]
+        return mask
+
+    def conflicts_with(self, key: str) -> List[str]:
+        """Canonical IDs that conflict with ``key``."""
+        return [self._keys[index] for index in set_bits(self._adjacency[self._ids[key]])]
+
+    def find_conflicts(self, groups: Sequence[Iterable[str]]) -> List[Conflict]:
+        """Every conflicting ingredient pair held by two different groups.
+
+        Each group is a collection of canonical IDs, such as one product's
+        ingredients. Conflicts within a single group are not reported: the
+        product was formulated with both. Work is proportional to the
+        distinct ingredients present plus the conflicts found.
+        """
+        holders: Dict[int, int] = {}  # ingredient index -> bitset of groups holding it
+        for group, keys in enumerate(groups):
+            for key in keys:
+                index = self._ids[key]
+                holders[index] = holders.get(index, 0) | 1 << group
+        present = 0
+        for index in holders:
+            present |= 1 << index
+
+        conflicts: List[Conflict] = []
+        for index, groups_with in holders.items():
+            # Partners with a higher index, so each ingredient pair is visited once
+            partners = self._adjacency[index] & present & ~((1 << (index + 1)) - 1)
+            for partner in set_bits(partners):
+                detail = self._details[(index, partner)]
+                for group in set_bits(groups_with):
+                    for other in set_bits(holders[partner] & ~(1 << group)):
+                        if group < other:
+                            conflicts.append(Conflict(group, other, self._keys[index], self._keys[partner], detail))
+                        else:
+                            conflicts.append(Conflict(other, group, self._keys[partner], self._keys[index], detail))
+        conflicts.sort(key=lambda conflict: (conflict.first, conflict.second, conflict.first_ingredient))
+        return conflicts
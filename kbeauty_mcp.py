@@ -7,14 +7,41 @@ ingredient analysis, and skincare routine recommendations through web search.
 
 import json
 import logging
-import aiohttp
+import math
+import os
+import argparse
 import asyncio
-import base64
-from typing import Dict, List, Any, Optional
+import time
+from contextlib import asynccontextmanager, nullcontext
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Any, Optional, Sequence, Tuple
 from mcp.server import Server
-from mcp.types import Tool, TextContent, ImageContent
+from mcp.types import Tool, TextContent
 from urllib.parse import quote
 
+from concurrency import AdmissionGate, Overloaded, SingleFlight, gather_bounded
+from config import env_float, env_int, env_str
+from data.brands import KBEAUTY_BRANDS
+from data.ingredient_aliases import INGREDIENT_ALIASES
+from data.ingredients import INGREDIENT_DATABASE
+from data.routines import SKINCARE_ROUTINES
+from data.skin_zones import SKIN_ZONE_ANALYSIS
+from fuzzy_index import FuzzyIndex
+from http_client import HttpClient
+from image_pipeline import PhotoPipeline
+from ingredient_graph import IngredientGraph
+from knowledge_index import EntityRecord, KnowledgeIndex
+from metrics import SIZE_BUCKETS, MetricsRegistry, WaitTimer
+from profiler import SlowCallProfiler
+from product_filter import SORT_ORDERS, ProductIndex
+from resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, deadline_scope, remaining_budget, within_budget
+from routine_builder import ROUTINE_SLOTS, RoutineBuilder, routine_steps
+from search_cache import MemoryCache, SearchCache, make_cache_key
+from skin_analysis import ImageRejected
+from term_matcher import TermMatcher
+from transport import TRANSPORTS, HttpServeConfig, create_http_app, serve_http, serve_workers
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -92,131 +119,260 @@ KBEAUTY_SEARCH_TERMS = {
     ]
 }
 
-# Skin Analysis Knowledge Base
-SKIN_ANALYSIS_PATTERNS = {
-    "acne_indicators": [
-        "blackheads", "whiteheads", "inflammatory papules", "pustules",
-        "cystic acne", "comedones", "pimples", "blemishes"
-    ],
-    "aging_indicators": [
-        "fine lines", "wrinkles", "sagging", "loss of firmness",
-        "age spots", "dark spots", "uneven texture", "dullness"
-    ],
-    "dryness_indicators": [
-        "flaking", "rough texture", "tightness", "dull appearance",
-        "fine lines from dehydration", "lack of glow"
-    ],
-    "sensitivity_indicators": [
-        "redness", "irritation", "inflammation", "broken capillaries",
-        "reactive skin", "burning sensation", "stinging"
-    ],
-    "pigmentation_indicators": [
-        "dark spots", "melasma", "post-inflammatory hyperpigmentation",
-        "sun damage", "uneven skin tone", "freckles", "age spots"
-    ],
-    "oily_indicators": [
-        "excess shine", "enlarged pores", "blackheads", "greasy t-zone",
-        "frequent breakouts", "thick skin texture"
-    ]
-}
+# Pooled HTTP client shared by every upstream search for the server lifetime
+http_client = HttpClient()
 
-SKIN_ZONE_ANALYSIS = {
-    "t_zone": {
-        "areas": ["forehead", "nose", "chin"],
-        "common_issues": ["oiliness", "blackheads", "enlarged pores", "acne"]
-    },
-    "cheek_area": {
-        "areas": ["left cheek", "right cheek"],
-        "common_issues": ["dryness", "sensitivity", "aging", "pigmentation"]
-    },
-    "eye_area": {
-        "areas": ["under eyes", "around eyes", "eyelids"],
-        "common_issues": ["fine lines", "dark circles", "puffiness", "dryness"]
-    },
-    "mouth_area": {
-        "areas": ["around mouth", "lips"],
-        "common_issues": ["fine lines", "dryness", "pigmentation"]
+# Cache of parsed search results keyed by (normalized query, search type)
+search_cache = SearchCache.from_env()
+
+# Identical concurrent upstream searches share one in-flight request
+search_flights = SingleFlight()
+
+# Trips after repeated upstream errors or slow calls so searches fail fast to curated content
+upstream_breaker = CircuitBreaker.from_env()
+
+# Time budget (seconds) for a whole tool call, passed down into upstream requests
+TOOL_BUDGET = env_float("KBEAUTY_TOOL_BUDGET", 15.0)
+
+# Backpressure when many sessions share one process: tool calls running at once, and
+# how long (seconds) an extra call may queue before it is told to retry
+TOOL_CONCURRENCY = env_int("KBEAUTY_TOOL_CONCURRENCY", 64)
+TOOL_QUEUE_TIMEOUT = env_float("KBEAUTY_TOOL_QUEUE_TIMEOUT", 2.0)
+tool_gate = AdmissionGate(TOOL_CONCURRENCY, TOOL_QUEUE_TIMEOUT)
+
+# Runtime metrics behind server_stats and /metrics; KBEAUTY_METRICS=0 turns recording off
+metrics = MetricsRegistry.from_env()
+started_at = time.time()
+tool_calls = metrics.counter("kbeauty_tool_calls_total", "Tool calls by tool and outcome", ("tool", "outcome"))
+tool_seconds = metrics.histogram("kbeauty_tool_duration_seconds", "Whole tool call time", ("tool",))
+tool_upstream_seconds = metrics.histogram(
+    "kbeauty_tool_upstream_seconds", "Part of a tool call spent waiting on web searches", ("tool",)
+)
+tool_render_seconds = metrics.histogram(
+    "kbeauty_tool_render_seconds", "Part of a tool call spent on local work: lookups, analysis and rendering", ("tool",)
+)
+tool_response_bytes = metrics.histogram(
+    "kbeauty_tool_response_bytes", "Size of the text a tool call returns", ("tool",), SIZE_BUCKETS
+)
+upstream_responses = metrics.counter("kbeauty_upstream_responses_total", "Upstream search responses by HTTP status", ("status",))
+upstream_errors = metrics.counter("kbeauty_upstream_errors_total", "Failed upstream searches by error type", ("error",))
+upstream_seconds = metrics.histogram("kbeauty_upstream_request_seconds", "Upstream search round trip time")
+metrics.callback(
+    "kbeauty_search_cache_lookups_total", "Search cache lookups by result",
+    lambda: {("hit",): search_cache.hits, ("stale",): search_cache.stale_hits, ("miss",): search_cache.misses},
+    kind="counter", labels=("result",),
+)
+metrics.callback(
+    "kbeauty_photo_cache_lookups_total", "Photo analysis cache lookups by result",
+    lambda: {("hit",): photo_pipeline.results.hits, ("miss",): photo_pipeline.results.misses} if photo_pipeline.results else {},
+    kind="counter", labels=("result",),
+)
+metrics.callback("kbeauty_upstream_breaker_open", "1 while the upstream circuit breaker pauses searches",
+                 lambda: float(upstream_breaker.state != "closed"))
+metrics.callback("kbeauty_upstream_rejected_total", "Searches skipped by the open circuit breaker",
+                 lambda: upstream_breaker.rejected, kind="counter")
+metrics.callback("kbeauty_tool_calls_in_flight", "Tool calls running now", lambda: tool_gate.in_flight)
+metrics.callback("kbeauty_tool_calls_waiting", "Tool calls queued for a slot", lambda: tool_gate.waiting)
+
+# Calls slower than KBEAUTY_PROFILE_THRESHOLD seconds leave a profile in KBEAUTY_PROFILE_DIR
+profiler = SlowCallProfiler.from_env()
+
+# Time the current tool call spends waiting on upstream search requests (a WaitTimer while metrics record)
+upstream_wait: ContextVar[Any] = ContextVar("upstream_wait", default=nullcontext())
+
+# compare_products fan-out: parallel product lookups and overall deadline (seconds)
+COMPARE_CONCURRENCY = env_int("KBEAUTY_COMPARE_CONCURRENCY", 4)
+COMPARE_DEADLINE = env_float("KBEAUTY_COMPARE_DEADLINE", 8.0)
+
+# batch_call fan-out: parallel sub-calls and the most calls accepted per batch
+BATCH_CONCURRENCY = env_int("KBEAUTY_BATCH_CONCURRENCY", 4)
+BATCH_MAX_CALLS = env_int("KBEAUTY_BATCH_MAX_CALLS", 20)
+
+# Largest page filter_products returns
+FILTER_MAX_LIMIT = 50
+
+# Most products check_shelf_compatibility accepts in one call
+SHELF_MAX_PRODUCTS = 100
+# Most alternative routines build_routine returns
+ROUTINE_MAX_PLANS = 5
+
+# DuckDuckGo instant answer endpoint; point it at a local stand-in for benchmarks
+SEARCH_URL = env_str("KBEAUTY_SEARCH_URL", "https://api.duckduckgo.com/")
+
+class UpstreamError(Exception):
+    """The search provider answered with a non-success status."""
+
+def build_search_query(query: str, search_type: str) -> str:
+    """Expand a query with K-Beauty context for the given search type."""
+    if search_type == "brand":
+        return f"{query} K-Beauty Korean cosmetics brand products review 2024"
+    elif search_type == "product":
+        return f"{query} K-Beauty Korean skincare product review ingredients benefits"
+    elif search_type == "ingredient":
+        return f"{query} skincare ingredient benefits safety K-Beauty Korean cosmetics"
+    elif search_type == "routine":
+        return f"Korean skincare routine {query} K-Beauty steps products"
+    return f"{query} K-Beauty Korean beauty skincare"
+
+async def fetch_search_data(query: str, search_type: str) -> Dict[str, Any]:
+    """Query DuckDuckGo and keep only the fields used to render results."""
+    search_query = build_search_query(query, search_type)
+
+    # DuckDuckGo instant answer API (no API key required) over the shared pooled session
+    ddg_url = f"{SEARCH_URL}?q={quote(search_query)}&format=json&no_html=1&skip_disambig=1"
+    # This runs as a flight shared by every caller of the query, so it keeps
+    # the client's own timeout rather than the budget of the caller that
+    # started it; each caller still stops waiting when its own budget runs out
+    timeout = http_client.request_timeout(None)
+    async with http_client.session.get(ddg_url, timeout=timeout) as response:
+        upstream_responses.inc(str(response.status))
+        if response.status != 200:
+            raise UpstreamError(f"DuckDuckGo returned HTTP {response.status}")
+        data = await response.json(content_type=None)
+
+    related = [
+        topic["Text"][:200]
+        for topic in (data.get("RelatedTopics") or [])[:3]  # Limit to 3 results
+        if isinstance(topic, dict) and topic.get("Text")
+    ]
+    return {
+        "abstract": data.get("Abstract") or "",
+        "related": related,
+        "definition": data.get("Definition") or "",
+        "answer": data.get("Answer") or "",
     }
-}
 
-async def search_web(query: str, search_type: str = "general") -> str:
-    """Search the web for K-Beauty information using DuckDuckGo."""
+def format_search_results(query: str, data: Dict[str, Any]) -> str:
+    """Render parsed search data as the markdown block shown to the user."""
+    result = f"🔍 **Search Results for '{query}'**\n\n"
+
+    # Abstract (main summary)
+    if data["abstract"]:
+        result += f"**Overview:** {data['abstract']}\n\n"
+
+    # Related topics
+    if data["related"]:
+        result += "**Related Information:**\n"
+        for text in data["related"]:
+            result += f"• {text}...\n"
+        result += "\n"
+
+    # Definition if available
+    if data["definition"]:
+        result += f"**Definition:** {data['definition']}\n\n"
+
+    # Answer
+    if data["answer"]:
+        result += f"**Quick Answer:** {data['answer']}\n\n"
+
+    # If no results, provide fallback
+    if not any([data["abstract"], data["related"], data["definition"], data["answer"]]):
+        result += "No direct search results found. Providing curated K-Beauty information below.\n\n"
+
+    return result
+
+async def fetch_upstream(query: str, search_type: str) -> Dict[str, Any]:
+    """Fetch search data through the upstream circuit breaker."""
+    async def request() -> Dict[str, Any]:
+        # Only runs when the breaker lets the request out
+        started = time.perf_counter()
+        try:
+            return await fetch_search_data(query, search_type)
+        except Exception as e:
+            upstream_errors.inc(type(e).__name__)
+            raise
+        finally:
+            upstream_seconds.observe(time.perf_counter() - started)
+
+    return await upstream_breaker.call(request)
+
+async def cached_search(query: str, search_type: str) -> Dict[str, Any]:
+    """Search data from the cache, or from one upstream fetch shared by every caller in this process."""
+    key = make_cache_key(query, search_type)
+    fetch = lambda: fetch_upstream(query, search_type)
+    entry = await search_cache.lookup(key, fetch)
+    if entry is not None:
+        return entry.value
+    # Coalesce here first, so only the shared load competes for the cross-worker fetch lease.
+    # The wait is timed on this side, so callers joining another's flight count it too
+    with upstream_wait.get():
+        return await search_flights.do(key, lambda: search_cache.load(key, fetch))
+
+async def search_web_data(query: str, search_type: str = "general") -> Dict[str, Any]:
+    """Search the web for K-Beauty information, returning the parsed fields.
+
+    When the search cannot be completed the result carries an ``error``
+    message instead, so callers can fall back to curated content.
+    """
     try:
-        # Enhanced search queries for better results
-        if search_type == "brand":
-            search_query = f"{query} K-Beauty Korean cosmetics brand products review 2024"
-        elif search_type == "product":
-            search_query = f"{query} K-Beauty Korean skincare product review ingredients benefits"
-        elif search_type == "ingredient":
-            search_query = f"{query} skincare ingredient benefits safety K-Beauty Korean cosmetics"
-        elif search_type == "routine":
-            search_query = f"Korean skincare routine {query} K-Beauty steps products"
-        else:
-            search_query = f"{query} K-Beauty Korean beauty skincare"
+        data = await within_budget(cached_search(query, search_type))
+        return {"query": query, **data}
 
-        # Use DuckDuckGo search (no API key required)
-        async with aiohttp.ClientSession() as session:
-            # DuckDuckGo instant answer API
-            ddg_url = f"https://api.duckduckgo.com/?q={quote(search_query)}&format=json&no_html=1&skip_disambig=1"
-            
-            async with session.get(ddg_url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    # Extract useful information
-                    result = f"🔍 **Search Results for '{query}'**\n\n"
-                    
-                    # Abstract (main summary)
-                    if data.get("Abstract"):
-                        result += f"**Overview:** {data['Abstract']}\n\n"
-                    
-                    # Related topics
-                    if data.get("RelatedTopics"):
-                        result += "**Related Information:**\n"
-                        for topic in data["RelatedTopics"][:3]:  # Limit to 3 results
-                            if isinstance(topic, dict) and topic.get("Text"):
-                                result += f"• {topic['Text'][:200]}...\n"
-                        result += "\n"
-                    
-                    # Definition if available
-                    if data.get("Definition"):
-                        result += f"**Definition:** {data['Definition']}\n\n"
-                    
-                    # Answer
-                    if data.get("Answer"):
-                        result += f"**Quick Answer:** {data['Answer']}\n\n"
-                    
-                    # If no results, provide fallback
-                    if not any([data.get("Abstract"), data.get("RelatedTopics"), data.get("Definition"), data.get("Answer")]):
-                        result += "No direct search results found. Providing curated K-Beauty information below.\n\n"
-                    
-                    return result
-                else:
-                    # Fallback if search fails
-                    return f"🔍 **Searching for '{query}'**\n\nSearch temporarily unavailable. Providing curated K-Beauty information below.\n\n"
-        
+    except CircuitOpenError:
+        # Upstream is unhealthy; skip the network and serve curated content right away
+        return {"query": query, "error": "Search temporarily paused after repeated errors"}
+    except DeadlineExceeded:
+        logger.warning(f"Search for {query!r} ran out of time budget")
+        return {"query": query, "error": "Search timed out"}
+    except UpstreamError as e:
+        # Fallback if search fails
+        logger.warning(f"Search unavailable: {e}")
+        return {"query": query, "error": "Search temporarily unavailable"}
     except Exception as e:
         logger.error(f"Search error: {e}")
-        return f"🔍 **Searching for '{query}'**\n\nSearch service temporarily unavailable. Providing curated K-Beauty information below.\n\n"
+        return {"query": query, "error": "Search service temporarily unavailable"}
+
+def format_search_data(data: Dict[str, Any]) -> str:
+    """Render ``search_web_data`` output, or its fallback notice on error."""
+    if "error" in data:
+        return f"🔍 **Searching for '{data['query']}'**\n\n{data['error']}. Providing curated K-Beauty information below.\n\n"
+    return format_search_results(data["query"], data)
+
+async def search_web(query: str, search_type: str = "general") -> str:
+    """Search the web for K-Beauty information using DuckDuckGo."""
+    return format_search_data(await search_web_data(query, search_type))
+
+# The indexes below are built on first use rather than at import, so
+# spawning the server and listing its tools stays fast
+
+@lru_cache(maxsize=1)
+def term_matcher() -> TermMatcher:
+    """Single-pass matcher over every term in KBEAUTY_SEARCH_TERMS."""
+    return TermMatcher.from_groups(KBEAUTY_SEARCH_TERMS)
+
+@lru_cache(maxsize=1)
+def term_kinds() -> Dict[str, List[str]]:
+    """The kinds each KBEAUTY_SEARCH_TERMS term is listed under."""
+    kinds: Dict[str, List[str]] = {}
+    for kind, terms in KBEAUTY_SEARCH_TERMS.items():
+        for term in terms:
+            kinds.setdefault(term, []).append(kind)
+    return kinds
+
+@lru_cache(maxsize=1)
+def fuzzy_index() -> FuzzyIndex:
+    """Typo-tolerant fallback over the same vocabulary ("cosrks", "hyaluronic acd")."""
+    return FuzzyIndex(term_kinds())
+
+def recognize_terms(query: str) -> Dict[str, List[str]]:
+    """Group recognized K-Beauty terms by kind, falling back to fuzzy matching."""
+    recognized = term_matcher().terms_by_kind(query)
+    if recognized:
+        return recognized
+    for match in fuzzy_index().find_in_text(query):
+        for kind in term_kinds()[match.term]:
+            recognized.setdefault(kind, []).append(match.term)
+    return recognized
 
 def enhance_search_with_knowledge(query: str, search_type: str) -> str:
     """Enhance search queries with K-Beauty knowledge."""
-    query_lower = query.lower()
+    recognized = recognize_terms(query)
     
     # Add context based on recognized terms
     context_additions = []
-    
-    for brand in KBEAUTY_SEARCH_TERMS["brands"]:
-        if brand in query_lower:
-            context_additions.append(f"Korean beauty brand {brand}")
-    
-    for product_type in KBEAUTY_SEARCH_TERMS["product_types"]:
-        if product_type in query_lower:
-            context_additions.append(f"K-Beauty {product_type}")
-    
-    for ingredient in KBEAUTY_SEARCH_TERMS["ingredients"]:
-        if ingredient in query_lower:
-            context_additions.append(f"Korean skincare ingredient {ingredient}")
+    context_additions.extend(f"Korean beauty brand {brand}" for brand in recognized.get("major_brands", []))
+    context_additions.extend(f"K-Beauty {category}" for category in recognized.get("product_categories", []))
+    context_additions.extend(f"Korean skincare ingredient {ingredient}" for ingredient in recognized.get("key_ingredients", []))
     
     if context_additions:
         return f"{query} {' '.join(context_additions[:2])}"  # Limit to avoid too long queries
@@ -225,13 +381,10 @@ def enhance_search_with_knowledge(query: str, search_type: str) -> str:
 
 def get_brand_recognition_info(query: str) -> str:
     """Provide brand recognition and search enhancement info."""
-    query_lower = query.lower()
+    recognized = recognize_terms(query)
     
     # Check if query contains recognized K-Beauty brands
-    recognized_brands = []
-    for brand in KBEAUTY_SEARCH_TERMS["major_brands"]:
-        if brand in query_lower:
-            recognized_brands.append(brand)
+    recognized_brands = recognized.get("major_brands", [])
     
     if recognized_brands:
         return f"""**Recognized K-Beauty Brand:** {', '.join(recognized_brands)}
@@ -245,10 +398,7 @@ def get_brand_recognition_info(query: str) -> str:
 """
     
     # Check for product categories
-    recognized_categories = []
-    for category in KBEAUTY_SEARCH_TERMS["product_categories"]:
-        if category in query_lower:
-            recognized_categories.append(category)
+    recognized_categories = recognized.get("product_categories", [])
     
     if recognized_categories:
         return f"""**Product Category:** {', '.join(recognized_categories)}
@@ -261,10 +411,7 @@ def get_brand_recognition_info(query: str) -> str:
 """
     
     # Check for ingredients
-    recognized_ingredients = []
-    for ingredient in KBEAUTY_SEARCH_TERMS["key_ingredients"]:
-        if ingredient in query_lower:
-            recognized_ingredients.append(ingredient)
+    recognized_ingredients = recognized.get("key_ingredients", [])
     
     if recognized_ingredients:
         return f"""**Korean Beauty Ingredient:** {', '.join(recognized_ingredients)}
@@ -284,13 +431,745 @@ def get_brand_recognition_info(query: str) -> str:
 - Expert reviews and community recommendations
 """
 
+@lru_cache(maxsize=1)
+def knowledge_index() -> KnowledgeIndex:
+    """Entity index over the curated data modules for local-first answers."""
+    return KnowledgeIndex(KBEAUTY_BRANDS, INGREDIENT_DATABASE, SKINCARE_ROUTINES)
+
+@lru_cache(maxsize=1)
+def ingredient_graph() -> IngredientGraph:
+    """Canonical ingredient IDs and the conflicts between them, for shelf checks."""
+    return IngredientGraph(INGREDIENT_DATABASE, INGREDIENT_ALIASES)
+
+CURATED_FOOTER = "_Answered from the curated K-Beauty database. Set `include_web` for live web results._\n"
+
+def format_curated_brand(brand: EntityRecord) -> str:
+    """Render a curated brand record and its popular products."""
+    data = brand.data
+    result = f"📚 **Curated K-Beauty Data: {data['name']}**\n"
+    result += f"- **Origin:** {data['origin']} (founded {data['founded']})\n"
+    result += f"- **Category:** {data['category']} · **Price Range:** {data['price_range']}\n"
+    result += f"- **Key Ingredients:** {', '.join(data['key_ingredients'])}\n\n"
+    result += "**Popular Products:**\n"
+    for product in data.get("popular_products", []):
+        result += (
+            f"- **{product['name']}** ({product['type']}, ${product['price_usd']}) - "
+            f"{', '.join(product['key_benefits'])} · Skin types: {', '.join(product['skin_types'])}\n"
+        )
+    return result + "\n"
+
+def format_curated_product(brand: EntityRecord, product: EntityRecord) -> str:
+    """Render a curated product record with its brand summary."""
+    data = product.data
+    result = f"📚 **Curated K-Beauty Data: {brand.data['name']} {data['name']}**\n"
+    result += f"- **Brand:** {brand.data['name']} ({brand.data['category']}, {brand.data['price_range']})\n"
+    result += f"- **Type:** {data['type']}\n"
+    result += f"- **Price:** ${data['price_usd']}\n"
+    result += f"- **Key Benefits:** {', '.join(data['key_benefits'])}\n"
+    result += f"- **Best For:** {', '.join(data['skin_types'])} skin\n\n"
+    return result
+
+def format_curated_ingredient(ingredient: EntityRecord) -> str:
+    """Render a curated ingredient record."""
+    data = ingredient.data
+    result = f"📚 **Curated Ingredient Data: {data['name']} ({data['korean_name']})**\n"
+    result += f"- **Safety Grade:** {data['safety_grade']}\n"
+    result += f"- **Benefits:** {', '.join(data['benefits'])}\n"
+    result += f"- **Suitable For:** {', '.join(data['suitable_for'])}\n"
+    result += f"- **Typical Concentration:** {data['concentration']}\n"
+    result += f"- **Avoid Combining With:** {', '.join(data['incompatible']) or 'No known conflicts'}\n\n"
+    return result
+
+def format_curated_routine(routine: EntityRecord) -> str:
+    """Render a curated routine and its steps."""
+    data = routine.data
+    result = f"📚 **Curated Routine: {data['name']}**\n"
+    result += f"_{data['description']}_ · Target: {data['target_skin']}\n\n"
+    for step in data["steps"]:
+        result += f"{step['step']}. **{step['type'].replace('_', ' ').title()}** - {step['description']}\n"
+    return result + "\n"
+
+@lru_cache(maxsize=None)
+def curated_routine(routine_key: str) -> str:
+    """Rendered curated routine, memoized per routine key."""
+    return format_curated_routine(knowledge_index().resolve(routine_key, "routine"))
+
+# Process pool for photo decoding and analysis, kept off the event loop
+photo_pipeline = PhotoPipeline.from_env()
+
+# What each photo-detected concern calls for in a K-Beauty routine
+PHOTO_CONCERN_GUIDE = {
+    "oiliness": ("Balance sebum without stripping", "Niacinamide, BHA, tea tree, volcanic ash"),
+    "blackheads": ("Keep pores clear", "BHA, oil cleansing, volcanic ash"),
+    "enlarged pores": ("Refine the look of pores", "Niacinamide, BHA, green tea"),
+    "acne": ("Calm breakouts", "Centella asiatica, tea tree, BHA, propolis"),
+    "sensitivity": ("Soothe redness and strengthen the barrier", "Centella asiatica, mugwort, panthenol, ceramides"),
+    "aging": ("Support firmness and elasticity", "Ginseng, peptides, retinol, snail mucin"),
+    "pigmentation": ("Even out tone and fade spots", "Vitamin C, niacinamide, arbutin, rice water"),
+    "fine lines": ("Plump and smooth fine lines", "Peptides, adenosine, hyaluronic acid"),
+    "dark circles": ("Brighten and depuff the under-eye area", "Caffeine, niacinamide, ginseng eye cream"),
+    "dullness": ("Brighten and restore glow", "Vitamin C, rice water, ginseng, niacinamide"),
+}
+
+async def analyze_skin_from_image(image_data: str) -> Dict[str, Any]:
+    """Analyze a base64 face photo in the photo pipeline's worker processes."""
+    return await within_budget(photo_pipeline.analyze(image_data))
+
+def photo_product_picks(skin_type: str, limit: int = 4) -> List[Tuple[str, Dict[str, Any]]]:
+    """Curated (brand name, product) pairs suited to a photo-estimated skin type."""
+    wanted = {"normal": "All"}.get(skin_type, skin_type.title())
+    picks = [
+        (brand["name"], product)
+        for brand in KBEAUTY_BRANDS.values()
+        for product in brand["popular_products"]
+        if wanted in product["skin_types"] or "All" in product["skin_types"]
+    ]
+    return picks[:limit]
+
+def get_kbeauty_recommendations_from_analysis(analysis: Dict[str, Any]) -> str:
+    """Turn a photo analysis into a markdown report with K-Beauty picks."""
+    skin_type = analysis["skin_type"]
+    concerns = analysis["primary_concerns"]
+    metrics = analysis["metrics"]
+
+    result = "## 📸 Skin Analysis Results\n\n"
+    result += f"**Estimated Skin Type:** {skin_type.title()}\n"
+    result += f"**Detected Concerns:** {', '.join(c.title() for c in concerns) or 'None prominent'}\n\n"
+    result += "### Measurements\n"
+    result += f"- **Redness:** {metrics['redness']:.2f}\n"
+    result += f"- **Shine:** {metrics['shine']:.2f}\n"
+    result += f"- **Texture Variation:** {metrics['texture']:.2f}\n"
+    result += f"- **Brightness:** {metrics['brightness']:.2f}\n\n"
+
+    zones = analysis.get("zones")
+    if zones:
+        result += "### Zone-by-Zone Analysis\n"
+        result += "| Zone | Redness | Shine | Texture | Pigmentation | Flags |\n"
+        result += "|------|---------|-------|---------|--------------|-------|\n"
+        for zone_name, zone in zones.items():
+            areas = ", ".join(SKIN_ZONE_ANALYSIS[zone_name]["areas"])
+            flags = ", ".join(zone["issues"]) or "-"
+            result += (
+                f"| {zone_name.replace('_', ' ').title()} ({areas}) | {zone['redness']:.2f} | {zone['shine']:.2f} "
+                f"| {zone['texture']:.3f} | {zone['pigmentation']:.2f} | {flags} |\n"
+            )
+        result += "\n"
+
+    if concerns:
+        result += "### What Your Skin Needs\n"
+        for concern in concerns:
+            goal, ingredients = PHOTO_CONCERN_GUIDE[concern]
+            result += f"- **{concern.title()}:** {goal} — look for {ingredients}\n"
+        result += "\n"
+
+    picks = photo_product_picks(skin_type)
+    if picks:
+        result += "### Curated K-Beauty Picks\n"
+        for brand_name, product in picks:
+            result += f"- **{brand_name} {product['name']}** ({product['type']}, ${product['price_usd']}) - {', '.join(product['key_benefits'])}\n"
+    result += "\n_Photo analysis is an estimate from lighting-sensitive image statistics, not a dermatological diagnosis._"
+    return result
+
+# recommend_routine advice per skin type, rendered as "- **Label:** text" bullets
+SKIN_TYPE_TIPS = {
+    "oily": {
+        "Focus": "Oil control, pore care, gentle exfoliation",
+        "Key Ingredients": "Niacinamide, BHA, tea tree, volcanic ash",
+        "Avoid": "Heavy creams, over-cleansing",
+        "K-Beauty Picks": "COSRX, Innisfree, Some By Mi",
+    },
+    "dry": {
+        "Focus": "Deep hydration, barrier repair, gentle care",
+        "Key Ingredients": "Hyaluronic acid, ceramides, snail mucin, honey",
+        "Avoid": "Harsh exfoliants, alcohol-based toners",
+        "K-Beauty Picks": "Laneige, Beauty of Joseon, Torriden",
+    },
+    "sensitive": {
+        "Focus": "Soothing, minimal irritation, barrier strengthening",
+        "Key Ingredients": "Centella asiatica, mugwort, panthenol, ceramides",
+        "Avoid": "Fragrances, high concentrations of actives",
+        "K-Beauty Picks": "Purito, Dear Klairs, Dr. Jart+",
+    },
+    "combination": {
+        "Focus": "Balance between T-zone and dry areas",
+        "Key Ingredients": "Niacinamide, hyaluronic acid, gentle AHA",
+        "Strategy": "Different products for different face areas",
+        "K-Beauty Picks": "Missha, The Face Shop, Etude House",
+    },
+}
+
+# recommend_routine ingredients per concern: (keywords, label, ingredients); first match wins
+ROUTINE_CONCERN_TIPS = [
+    (("acne",), "Acne", "BHA (salicylic acid), tea tree, centella asiatica"),
+    (("aging",), "Anti-aging", "Retinol, peptides, ginseng, vitamin C"),
+    (("dark", "pigment"), "Pigmentation", "Vitamin C, arbutin, kojic acid, rice water"),
+    (("pore",), "Pores", "Niacinamide, BHA, clay masks, volcanic ash"),
+]
+
+def routine_concern_tip(concern: str) -> Optional[Tuple[str, str]]:
+    """Return the (label, ingredients) tip for a free-text concern, if any."""
+    for keywords, label, ingredients in ROUTINE_CONCERN_TIPS:
+        if any(keyword in concern for keyword in keywords):
+            return label, ingredients
+    return None
+
+def list_argument(arguments: Dict[str, Any], key: str) -> Optional[List[Any]]:
+    """A list-valued tool argument; a bare string counts as one item, and None means the value is not a list."""
+    value = arguments.get(key)
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return value if isinstance(value, list) else None
+
+def canonical_concerns(concerns: Iterable[Any]) -> Tuple[str, ...]:
+    """Normalize free-text concerns into a sorted, de-duplicated key."""
+    return tuple(sorted({" ".join(str(concern).lower().split()) for concern in concerns} - {""}))
+
+def routine_concern_tips(concerns: Tuple[str, ...]) -> List[Tuple[str, str]]:
+    return [tip for tip in map(routine_concern_tip, concerns) if tip]
+
+# Static part of the routine framework, compiled once
+ROUTINE_FRAMEWORK_STEPS = """
+
+**🌅 Morning Routine (AM):**
+1. **Gentle Cleanser** (if needed) - Remove overnight impurities
+2. **Toner/First Treatment Essence** - Prepare skin for products
+3. **Vitamin C Serum** - Antioxidant protection and brightening
+4. **Hydrating Essence/Serum** - Based on skin needs
+5. **Eye Cream** - Delicate eye area care
+6. **Moisturizer** - Lock in hydration
+7. **Sunscreen SPF 30+** - Essential UV protection
+
+**🌙 Evening Routine (PM):**
+1. **Oil Cleanser** - Remove makeup and sunscreen
+2. **Water-based Cleanser** - Deep clean (double cleansing)
+3. **Exfoliation** - 2-3x per week (AHA/BHA/PHA)
+4. **Toner** - Restore pH balance
+5. **Treatment Essence** - Fermented ingredients for skin renewal
+6. **Active Serum** - Target specific concerns
+7. **Eye Cream** - Anti-aging or hydrating
+8. **Face Oil** - Optional, for extra nourishment
+9. **Moisturizer/Night Cream** - Repair and regenerate
+10. **Sleeping Mask** - 2-3x per week for intensive care
+
+**🎯 Skin Type Specific Tips:**"""
+
+SKIN_TYPE_TIP_BLOCKS = {
+    skin_type: "".join(f"\n- **{label}:** {tip}" for label, tip in tips.items())
+    for skin_type, tips in SKIN_TYPE_TIPS.items()
+}
+
+@lru_cache(maxsize=1024)
+def routine_framework(skin_type: str, concerns: Tuple[str, ...]) -> str:
+    """Render the routine framework for a lowercase skin type and canonical concerns."""
+    parts = [
+        f"**Korean Skincare Routine Framework for {skin_type.title()} Skin:**",
+        ROUTINE_FRAMEWORK_STEPS,
+        SKIN_TYPE_TIP_BLOCKS.get(skin_type, ""),
+    ]
+    if concerns:
+        parts.append(f"\n\n**🎯 Addressing Your Concerns ({', '.join(concerns)}):**")
+        parts.extend(f"\n- **{label}:** {ingredients}" for label, ingredients in routine_concern_tips(concerns))
+    return "".join(parts)
+
+# skin_concern_matcher picks per concern: (keywords, {price tier: [(product, note)]}); first match wins
+CONCERN_PRODUCT_PICKS = [
+    (("acne",), {
+        "budget": [
+            ("COSRX BHA Blackhead Power Liquid", "Gentle yet effective BHA treatment"),
+            ("COSRX Snail 96 Mucin Power Essence", "Healing and anti-inflammatory"),
+        ],
+        "mid-range": [("Beauty of Joseon Red Bean Water Gel", "Gentle moisture for acne-prone skin")],
+        "luxury": [("Sulwhasoo Clarifying Mask", "Deep pore cleansing with traditional herbs")],
+    }),
+    (("aging", "wrinkle"), {
+        "budget": [
+            ("Beauty of Joseon Glow Deep Serum", "Alpha arbutin + niacinamide"),
+            ("COSRX Retinol 0.1 Cream", "Gentle retinol for beginners"),
+        ],
+        "mid-range": [("Laneige Time Freeze Intensive Cream", "Advanced anti-aging formula")],
+        "luxury": [("Sulwhasoo Concentrated Ginseng Renewing Cream", "Premium anti-aging")],
+    }),
+    (("dry", "dehydrat"), {
+        "budget": [
+            ("Laneige Water Sleeping Mask", "Overnight hydration boost"),
+            ("COSRX Hyaluronic Acid Intensive Cream", "Deep moisture"),
+        ],
+        "mid-range": [("Laneige Cream Skin Refiner", "Toner-cream hybrid for extra moisture")],
+        "luxury": [("Sulwhasoo First Care Activating Serum", "Luxury hydrating treatment")],
+    }),
+    (("pigment", "dark spot"), {
+        "budget": [
+            ("Beauty of Joseon Glow Deep Serum", "Alpha arbutin for brightening"),
+            ("Purito Centella Unscented Serum", "Niacinamide for even tone"),
+        ],
+        "mid-range": [("Klairs Freshly Juiced Vitamin C Serum", "Gentle vitamin C")],
+        "luxury": [("Sulwhasoo Concentrated Ginseng Renewing Serum", "Brightening ginseng")],
+    }),
+    (("sensitive",), {
+        "budget": [
+            ("Purito Centella Unscented Recovery Cream", "Ultra-gentle moisture"),
+            ("COSRX Snail 96 Mucin Power Essence", "Soothing and healing"),
+        ],
+        "mid-range": [("Dr. Jart+ Cicapair Tiger Grass Cream", "Centella for redness")],
+        "luxury": [("Sulwhasoo Gentle Cleansing Foam", "Ultra-mild cleansing")],
+    }),
+]
+
+# Budget preferences under which each price tier is shown
+TIER_BUDGETS = {
+    "budget": ("budget", "all"),
+    "mid-range": ("mid-range", "luxury", "all"),
+    "luxury": ("luxury", "all"),
+}
+
+@lru_cache(maxsize=1024)
+def concern_product_picks(concern: str, budget: str) -> Tuple[Tuple[str, str], ...]:
+    """(product, note) picks for a normalized concern within a budget preference."""
+    for keywords, tiers in CONCERN_PRODUCT_PICKS:
+        if any(keyword in concern for keyword in keywords):
+            return tuple(pick for tier, products in tiers.items() if budget in TIER_BUDGETS[tier] for pick in products)
+    return ()
+
+# Catalog benefits that address each concern, matched by substring; first match wins
+CONCERN_BENEFITS = [
+    (("acne",), ("acne", "pore", "blemish", "clarif")),
+    (("aging", "wrinkle"), ("aging", "wrinkle", "firming", "regenerat")),
+    (("dry", "dehydrat"), ("moistur", "hydrat", "barrier")),
+    (("pigment", "dark spot"), ("brighten", "tone", "spot")),
+    (("sensitive",), ("sooth", "calm", "healing", "barrier")),
+    (("pore", "blackhead"), ("pore", "exfoliat")),
+]
+
+# Catalog price range (USD) for each budget preference, mirroring TIER_BUDGETS
+BUDGET_PRICE_RANGES = {
+    "budget": (None, 30.0),
+    "mid-range": (30.0, 80.0),
+    "luxury": (30.0, None),
+}
+
+# Catalog product types that are not facial skincare
+NON_FACIAL_TYPES = ("lip care",)
+
+@lru_cache(maxsize=1)
+def product_index() -> ProductIndex:
+    """Filter indexes over the brand catalog, built on first use."""
+    return ProductIndex(KBEAUTY_BRANDS.catalog)
+
+def catalog_product(product_id: int) -> Dict[str, Any]:
+    """A catalog product as a plain dict, with its brand's display name."""
+    catalog = KBEAUTY_BRANDS.catalog
+    brand_name = catalog.brand_info(catalog.brand_of(product_id))["name"]
+    return {"brand": brand_name.split(" (")[0], **catalog.product(product_id)}
+
+def concern_benefits(concern: str) -> Tuple[str, ...]:
+    """Catalog benefit keywords addressing a normalized concern, if any."""
+    return next((terms for keywords, terms in CONCERN_BENEFITS if any(k in concern for k in keywords)), ())
+
+@lru_cache(maxsize=1024)
+def catalog_concern_picks(concern: str, skin_type: str, budget: str, limit: int = 3) -> Tuple[Tuple[str, str], ...]:
+    """(product, note) picks from the catalog for a normalized concern, skin type and budget."""
+    benefits = concern_benefits(concern)
+    if not benefits:
+        return ()
+    index = product_index()
+    min_price, max_price = BUDGET_PRICE_RANGES.get(budget, (None, None))
+    result = index.filter(
+        types=[t for t in index.values("type") if t not in NON_FACIAL_TYPES],
+        skin_types=[] if skin_type == "normal" else [skin_type],
+        benefits=benefits,
+        min_price=min_price,
+        max_price=max_price,
+        limit=limit,
+    )
+    picks = []
+    for product_id in result.product_ids:
+        product = catalog_product(product_id)
+        picks.append((
+            f"{product['brand']} {product['name']}",
+            f"{', '.join(product['key_benefits'])} (${product['price_usd']})",
+        ))
+    return tuple(picks)
+
+def concern_picks(concern: str, skin_type: str, budget: str) -> List[Tuple[str, str]]:
+    """Catalog matches first, then curated picks that are not already listed."""
+    picks = list(catalog_concern_picks(concern, skin_type, budget))
+    listed = [name.casefold() for name, _ in picks]
+    picks += [
+        pick for pick in concern_product_picks(concern, budget)
+        if not any(name in pick[0].casefold() or pick[0].casefold() in name for name in listed)
+    ]
+    return picks
+
+def format_filtered_products(total: int, offset: int, products: List[Dict[str, Any]]) -> str:
+    """Render one page of filter_products matches."""
+    if not products:
+        return f"No catalog products match these filters ({total} matches in total)."
+    parts = [
+        "## K-Beauty Product Filter\n\n",
+        f"**Matches:** {total} (showing {offset + 1}-{offset + len(products)})\n\n",
+    ]
+    for product in products:
+        parts.append(
+            f"- **{product['brand']} {product['name']}** ({product['type']}, ${product['price_usd']}) - "
+            f"{', '.join(product['key_benefits'])}; for {', '.join(product['skin_types'])} skin\n"
+        )
+    if offset + len(products) < total:
+        parts.append(f"\n_Pass offset {offset + len(products)} for the next page._\n")
+    return "".join(parts)
+
+SHELF_RESOLUTION_TIPS = """
+### How to Resolve Conflicts
+1. **Split AM/PM**: Keep vitamin C in the morning and retinol at night
+2. **Alternate Nights**: Use exfoliating acids (AHA/BHA) and retinol on different evenings
+3. **"At Same Time" Pairs**: Apply them in different routines rather than layering one over the other
+4. **Go Slowly**: Introduce one active at a time and watch for irritation
+"""
+
+def shelf_item(index: int, item: Any) -> Dict[str, Any]:
+    """Normalize one shelf entry: a product object, or a bare ingredient list or string."""
+    if not isinstance(item, dict):
+        item = {"ingredients": item}
+    ingredients = item.get("ingredients") or []
+    graph = ingredient_graph()
+    if isinstance(ingredients, str):
+        found = graph.resolve(ingredients)
+    else:
+        found = graph.resolve_names(map(str, ingredients))
+    routine = str(item.get("routine") or "both").upper()
+    return {
+        "name": str(item.get("name") or f"Item {index + 1}"),
+        "routines": [slot for slot in ROUTINE_SLOTS if routine in (slot, "BOTH")] or list(ROUTINE_SLOTS),
+        "ingredients": found,
+    }
+
+def check_shelf(items: List[Any]) -> Dict[str, Any]:
+    """Find every conflicting ingredient pair across a shelf and where it bites.
+
+    A conflict affects the routines both products are used in, at each
+    product's step in that routine (products are numbered in shelf order);
+    pairs never used in the same routine are reported as already separated.
+    """
+    graph = ingredient_graph()
+    shelf = [shelf_item(index, item) for index, item in enumerate(items)]
+    steps: Dict[str, Dict[int, int]] = {slot: {} for slot in ROUTINE_SLOTS}
+    for index, product in enumerate(shelf):
+        for slot in product["routines"]:
+            steps[slot][index] = len(steps[slot]) + 1
+
+    conflicts, separated = [], []
+    for conflict in graph.find_conflicts([product["ingredients"] for product in shelf]):
+        first, second = shelf[conflict.first], shelf[conflict.second]
+        entry = {
+            "products": [first["name"], second["name"]],
+            "ingredients": [graph.name(conflict.first_ingredient), graph.name(conflict.second_ingredient)],
+            "detail": conflict.detail,
+            "affects": [
+                {"routine": slot, "steps": [steps[slot][conflict.first], steps[slot][conflict.second]]}
+                for slot in ROUTINE_SLOTS if slot in first["routines"] and slot in second["routines"]
+            ],
+        }
+        (conflicts if entry["affects"] else separated).append(entry)
+
+    return {
+        "products": [
+            {"name": product["name"], "routines": product["routines"],
+             "ingredients": [graph.name(key) for key in product["ingredients"]]}
+            for product in shelf
+        ],
+        "conflicts": conflicts,
+        "separated": separated,
+    }
+
+def format_shelf_report(report: Dict[str, Any]) -> str:
+    """Render a shelf compatibility report."""
+    products = report["products"]
+    recognized = list(dict.fromkeys(name for product in products for name in product["ingredients"]))
+    parts = [
+        "## 🧴 Shelf Compatibility Check\n\n",
+        f"**Products Checked:** {len(products)}\n",
+        f"**Tracked Actives Found:** {', '.join(recognized) or 'None'}\n\n",
+    ]
+
+    def pair(entry: Dict[str, Any]) -> str:
+        (first, second), (first_ingredient, second_ingredient) = entry["products"], entry["ingredients"]
+        detail = f" ({entry['detail']})" if entry["detail"] else ""
+        return f"**{first}** ({first_ingredient}) × **{second}** ({second_ingredient}){detail}"
+
+    if report["conflicts"]:
+        parts.append(f"### ⚠️ Conflicts ({len(report['conflicts'])})\n")
+        for entry in report["conflicts"]:
+            affects = "; ".join(
+                f"{where['routine']} steps {where['steps'][0]} and {where['steps'][1]}" for where in entry["affects"]
+            )
+            parts.append(f"- {pair(entry)} — {affects}\n")
+        parts.append("\n")
+    else:
+        parts.append("### ✅ No Conflicts\nNone of the tracked actives on this shelf clash within a routine.\n\n")
+
+    if report["separated"]:
+        parts.append("### ✅ Already Separated\n")
+        parts.extend(f"- {pair(entry)} — never used in the same routine\n" for entry in report["separated"])
+        parts.append("\n")
+
+    unchecked = [product["name"] for product in products if not product["ingredients"]]
+    if unchecked:
+        parts.append(f"_No tracked actives recognized in: {', '.join(unchecked)}._\n")
+    if report["conflicts"]:
+        parts.append(SHELF_RESOLUTION_TIPS)
+    return "".join(parts)
+
+@lru_cache(maxsize=1)
+def routine_builder() -> RoutineBuilder:
+    """Routine search over the catalog indexes, built on first use."""
+    return RoutineBuilder(product_index(), ingredient_graph())
+
+def build_routine_plans(
+    routine_key: str, skin_type: str, concerns: Tuple[str, ...], budget: Optional[float], top_k: int
+) -> Dict[str, Any]:
+    """Fill a curated routine's steps with catalog products; the best ``top_k`` routines first."""
+    routine = SKINCARE_ROUTINES[routine_key]
+    matched = [(concern, concern_benefits(concern)) for concern in concerns]
+    result = routine_builder().build(
+        routine_steps(routine), skin_type, [pair for pair in matched if pair[1]], budget, top_k
+    )
+    return {
+        "routine": routine["name"],
+        "skin_type": skin_type,
+        "concerns": list(concerns),
+        "budget_usd": budget,
+        "plans": [
+            {
+                "score": plan.score,
+                "total_usd": plan.price_cents / 100,
+                "covers": list(plan.covered),
+                "steps": [
+                    {"step": step.number, "description": step.description, "routines": list(step.slots),
+                     "product": catalog_product(product_id)}
+                    for step, product_id in plan.picks
+                ],
+            }
+            for plan in result.plans
+        ],
+        "unfilled": [{"step": step.number, "type": step.type, "description": step.description} for step in result.unfilled],
+        "unmatched_concerns": [concern for concern, terms in matched if not terms],
+    }
+
+def format_routine_plans(report: Dict[str, Any]) -> str:
+    """Render build_routine results."""
+    budget = report["budget_usd"]
+    parts = [
+        f"## 🧴 Built Routine: {report['routine']}\n\n",
+        f"**Skin Type:** {report['skin_type'].title() or 'Any'}\n",
+        f"**Concerns:** {', '.join(concern.title() for concern in report['concerns']) or 'None'}\n",
+        f"**Budget:** {'No limit' if budget is None else f'${budget:g}'}\n\n",
+    ]
+    if not report["plans"]:
+        parts.append("No combination of catalog products fits these constraints. Try a higher budget or fewer concerns.\n\n")
+    for number, plan in enumerate(report["plans"], 1):
+        covers = f" — covers {', '.join(plan['covers'])}" if plan["covers"] else ""
+        parts.append(f"### Option {number}: ${plan['total_usd']:.2f} (score {plan['score']}){covers}\n")
+        for entry in plan["steps"]:
+            product = entry["product"]
+            parts.append(
+                f"{entry['step']}. **{product['brand']} {product['name']}** (${product['price_usd']}) - {entry['description']}\n"
+            )
+        parts.append("\n")
+    if report["unfilled"]:
+        parts.append("### Steps Without a Catalog Match\n")
+        parts.extend(f"- Step {entry['step']}: {entry['description']} ({entry['type']})\n" for entry in report["unfilled"])
+        parts.append("\n")
+    if report["unmatched_concerns"]:
+        parts.append(f"_No catalog benefits are mapped to: {', '.join(report['unmatched_concerns'])}._\n")
+    parts.append("_Products in the same AM or PM routine never combine conflicting actives._\n")
+    return "".join(parts)
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    """Milliseconds of a histogram quantile; None past the last bucket."""
+    return None if seconds is None or seconds == float("inf") else round(seconds * 1000, 1)
+
+def _ratio(part: float, whole: float) -> Optional[float]:
+    return round(part / whole, 3) if whole else None
+
+def server_stats_report() -> Dict[str, Any]:
+    """Snapshot of the runtime metrics for the server_stats tool."""
+    tools = []
+    for tool in sorted({key[0] for key in tool_calls.values}):
+        series = tool_seconds.series.get((tool,))
+        calls = series.count if series else 0
+        sizes = tool_response_bytes.series.get((tool,))
+        tools.append({
+            "tool": tool,
+            "calls": calls,
+            "errors": tool_calls.values.get((tool, "error"), 0),
+            "overloaded": tool_calls.values.get((tool, "overloaded"), 0),
+            "p50_ms": _ms(tool_seconds.quantile(0.5, tool)),
+            "p95_ms": _ms(tool_seconds.quantile(0.95, tool)),
+            "mean_ms": round(series.sum / calls * 1000, 2) if calls else None,
+            "mean_upstream_ms": round(tool_upstream_seconds.series[(tool,)].sum / calls * 1000, 2) if calls else None,
+            "mean_render_ms": round(tool_render_seconds.series[(tool,)].sum / calls * 1000, 2) if calls else None,
+            "mean_response_bytes": round(sizes.sum / sizes.count) if sizes and sizes.count else None,
+        })
+    lookups = search_cache.hits + search_cache.stale_hits + search_cache.misses
+    report: Dict[str, Any] = {
+        "uptime_seconds": round(time.time() - started_at),
+        "in_flight": tool_gate.in_flight,
+        "waiting": tool_gate.waiting,
+        "tools": tools,
+        "upstream": {
+            "responses": {key[0]: count for key, count in sorted(upstream_responses.values.items())},
+            "errors": {key[0]: count for key, count in sorted(upstream_errors.values.items())},
+            "p50_ms": _ms(upstream_seconds.quantile(0.5)),
+            "p95_ms": _ms(upstream_seconds.quantile(0.95)),
+            "breaker": upstream_breaker.stats(),
+        },
+        "search_cache": {
+            "hits": search_cache.hits,
+            "stale_hits": search_cache.stale_hits,
+            "misses": search_cache.misses,
+            "hit_ratio": _ratio(search_cache.hits + search_cache.stale_hits, lookups),
+        },
+    }
+    if photo_pipeline.results is not None:
+        photos = photo_pipeline.results
+        report["photo_cache"] = {
+            "hits": photos.hits,
+            "misses": photos.misses,
+            "hit_ratio": _ratio(photos.hits, photos.hits + photos.misses),
+        }
+    return report
+
+def format_server_stats(report: Dict[str, Any]) -> str:
+    """Render server_stats results."""
+    def ms(value: Optional[float]) -> str:
+        return "> 10000" if value is None else f"{value:g}"
+
+    parts = [
+        "## 📈 Server Stats\n\n",
+        f"**Uptime:** {report['uptime_seconds']} s | **Calls in flight:** {report['in_flight']} "
+        f"| **Waiting:** {report['waiting']}\n\n",
+    ]
+    if report["tools"]:
+        parts.append("| Tool | Calls | Errors | p50 ms | p95 ms | Upstream ms | Render ms | Avg bytes |\n")
+        parts.append("|------|-------|--------|--------|--------|-------------|-----------|-----------|\n")
+        for tool in report["tools"]:
+            if not tool["calls"]:
+                parts.append(f"| {tool['tool']} | 0 | {tool['errors']} | - | - | - | - | - |\n")
+                continue
+            parts.append(
+                f"| {tool['tool']} | {tool['calls']} | {tool['errors']} | {ms(tool['p50_ms'])} | {ms(tool['p95_ms'])} "
+                f"| {tool['mean_upstream_ms']:g} | {tool['mean_render_ms']:g} | {tool['mean_response_bytes'] or 0} |\n"
+            )
+        parts.append("\n_Latency percentiles are histogram bucket bounds; upstream and render times are per-call means._\n\n")
+    else:
+        parts.append("No tool calls recorded yet.\n\n")
+
+    upstream = report["upstream"]
+    statuses = ", ".join(f"{status}: {count:g}" for status, count in upstream["responses"].items()) or "none"
+    errors = ", ".join(f"{error}: {count:g}" for error, count in upstream["errors"].items()) or "none"
+    parts.append("### Upstream Searches\n")
+    parts.append(f"- **Responses:** {statuses}\n- **Errors:** {errors}\n")
+    if upstream["p50_ms"] is not None or upstream["responses"] or upstream["errors"]:
+        parts.append(f"- **Latency:** p50 {ms(upstream['p50_ms'])} ms, p95 {ms(upstream['p95_ms'])} ms\n")
+    parts.append(f"- **Circuit breaker:** {upstream['breaker']['state']} ({upstream['breaker']['trips']} trips)\n\n")
+
+    parts.append("### Caches\n")
+    for label, key in (("Search", "search_cache"), ("Photo analysis", "photo_cache")):
+        cache = report.get(key)
+        if cache is None:
+            continue
+        ratio = "n/a" if cache["hit_ratio"] is None else f"{cache['hit_ratio']:.0%}"
+        stale = f", {cache['stale_hits']} stale" if "stale_hits" in cache else ""
+        parts.append(f"- **{label}:** {cache['hits']} hits{stale}, {cache['misses']} misses (hit ratio {ratio})\n")
+    return "".join(parts)
+
+ROUTINE_INTEGRATION_TIPS = """
+### Quick Routine Integration Tips
+1. **Start Slowly**: Introduce one new product every 1-2 weeks
+2. **Patch Test**: Always test new products on your inner arm first
+3. **Layer Properly**: Thinnest to thickest consistency
+4. **Morning vs Evening**: Use actives (BHA, retinol) at night
+5. **Sun Protection**: Essential when using any active ingredients
+"""
+
+@lru_cache(maxsize=1024)
+def concern_matcher_report(skin_type: str, concerns: Tuple[str, ...], budget: str) -> str:
+    """Render the skin_concern_matcher report up to the web results."""
+    parts = [
+        "## Targeted K-Beauty Recommendations\n\n",
+        f"**Skin Type:** {skin_type.title()}\n",
+        f"**Primary Concerns:** {', '.join(concern.title() for concern in concerns)}\n",
+        f"**Budget Preference:** {budget.title()}\n\n",
+        "### Concern-Specific Product Recommendations\n\n",
+    ]
+    for concern in concerns:
+        parts.append(f"#### For {concern.title()}:\n")
+        parts.extend(f"- **{product_name}** - {note}\n" for product_name, note in concern_picks(concern, skin_type, budget))
+        parts.append("\n")
+    return "".join(parts)
+
+# Output formats every tool accepts; compact and json carry only the dynamic data
+OUTPUT_FORMATS = ("markdown", "compact", "json")
+
+FORMAT_PROPERTY = {
+    "type": "string",
+    "enum": list(OUTPUT_FORMATS),
+    "description": "Output format: markdown (default), compact text, or json with only the dynamic data",
+}
+
+def _compact_value(value: Any) -> str:
+    return ", ".join(map(str, value)) if isinstance(value, list) else str(value)
+
+def _is_flat(record: Dict[str, Any]) -> bool:
+    """Whether every field is a scalar or a list of scalars."""
+    return not any(
+        isinstance(field, dict) or (isinstance(field, list) and any(isinstance(item, dict) for item in field))
+        for field in record.values()
+    )
+
+def format_compact(payload: Dict[str, Any], prefix: str = "") -> str:
+    """Render a payload as terse ``key: value`` lines, skipping empty fields.
+
+    Flat nested dicts become one ``key: field=value; ...`` line and deeper
+    ones use dotted keys; list items that are flat records become a single
+    ``key[i]: value | value`` line.
+    """
+    lines = []
+    for key, value in payload.items():
+        if value is None or value == "" or value == [] or value == {}:
+            continue
+        label = f"{prefix}{key}"
+        if isinstance(value, dict) and _is_flat(value):
+            fields = [f"{name}={_compact_value(field)}" for name, field in value.items() if field not in (None, "", [])]
+            lines.append(f"{label}: {'; '.join(fields)}")
+        elif isinstance(value, dict):
+            lines.append(format_compact(value, f"{label}."))
+        elif isinstance(value, list) and any(isinstance(item, dict) for item in value):
+            for i, item in enumerate(value):
+                if not _is_flat(item):
+                    lines.append(format_compact(item, f"{label}[{i}]."))
+                else:
+                    lines.append(f"{label}[{i}]: {' | '.join(_compact_value(field) for field in item.values())}")
+        else:
+            lines.append(f"{label}: {_compact_value(value)}")
+    return "\n".join(line for line in lines if line)
+
+def render_structured(output_format: str, payload: Dict[str, Any]) -> List[TextContent]:
+    """Render a tool payload in the compact or json output format."""
+    if output_format == "json":
+        text = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    else:
+        text = format_compact(payload)
+    return [TextContent(type="text", text=text)]
+
 # Initialize MCP Server
 app = Server("k-beauty-mcp")
 
-@app.list_tools()
-async def list_tools() -> List[Tool]:
-    """List available K-Beauty tools."""
-    return [
+@lru_cache(maxsize=1)
+def tool_registry() -> Tuple[Tool, ...]:
+    """Every tool and its input schema, built once on first listing and reused."""
+    tools = [
         Tool(
             name="search_kbeauty_brands",
             description="Search K-Beauty brands and get information about popular Korean cosmetic brands",
@@ -318,6 +1197,10 @@ async def list_tools() -> List[Tool]:
                     "product_name": {
                         "type": "string",
                         "description": "Product name (optional, returns all products if not specified)"
+                    },
+                    "include_web": {
+                        "type": "boolean",
+                        "description": "Also fetch live web results to enrich the curated data (default: false)"
                     }
                 },
                 "required": ["brand"]
@@ -332,6 +1215,10 @@ async def list_tools() -> List[Tool]:
                     "ingredient": {
                         "type": "string", 
                         "description": "Ingredient name to analyze"
+                    },
+                    "include_web": {
+                        "type": "boolean",
+                        "description": "Also fetch live web results to enrich the curated data (default: false)"
                     }
                 },
                 "required": ["ingredient"]
@@ -354,7 +1241,11 @@ async def list_tools() -> List[Tool]:
                     },
                     "routine_type": {
                         "type": "string", 
-                        "description": "Type of routine: basic_korean, anti_aging"
+                        "description": "Type of routine: basic_korean, anti_aging, acne_prone"
+                    },
+                    "include_web": {
+                        "type": "boolean",
+                        "description": "Also fetch live web results to enrich the curated data (default: false)"
                     }
                 },
                 "required": ["skin_type"]
@@ -421,12 +1312,229 @@ async def list_tools() -> List[Tool]:
                 },
                 "required": ["concerns", "skin_type"]
             }
+        ),
+        Tool(
+            name="filter_products",
+            description="Filter the K-Beauty product catalog by type, skin type, benefit, brand and price, with sorting and pagination",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "types": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Product types to include, any of (e.g. serum, toner, essence)"
+                    },
+                    "skin_types": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Skin types, any of (e.g. Oily, Acne-prone); products for all skin types always match"
+                    },
+                    "benefits": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Benefit keywords, any of, matched within benefit names (e.g. pore, hydration)"
+                    },
+                    "brands": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Brand keys to include, any of (e.g. cosrx, laneige)"
+                    },
+                    "min_price": {"type": "number", "description": "Lowest price in USD"},
+                    "max_price": {"type": "number", "description": "Highest price in USD"},
+                    "sort": {
+                        "type": "string",
+                        "enum": list(SORT_ORDERS),
+                        "description": "Result order: price (default), price_desc or name"
+                    },
+                    "limit": {"type": "integer", "description": f"Results per page (default 10, at most {FILTER_MAX_LIMIT})"},
+                    "offset": {"type": "integer", "description": "Matches to skip, for the next page"}
+                }
+            }
+        ),
+        Tool(
+            name="check_shelf_compatibility",
+            description="Check a whole shelf of K-Beauty products for conflicting ingredients and the AM/PM steps they affect",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "products": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "name": {"type": "string"},
+                                "ingredients": {
+                                    "type": "array",
+                                    "items": {"type": "string"},
+                                    "description": "Ingredient names, or the full label"
+                                },
+                                "routine": {"type": "string", "enum": ["AM", "PM", "both"]}
+                            }
+                        },
+                        "description": "Products in the order they are applied, each with its ingredients and routine (default both)"
+                    }
+                },
+                "required": ["products"]
+            }
+        ),
+        Tool(
+            name="build_routine",
+            description="Build complete K-Beauty routines from the product catalog: one product per step, fitting skin type, concerns and budget, with no conflicting actives in the same AM/PM routine",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "skin_type": {
+                        "type": "string",
+                        "description": "Skin type: oily, dry, combination, sensitive, normal"
+                    },
+                    "concerns": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Skin concerns the routine should cover: acne, aging, dryness, pigmentation, etc."
+                    },
+                    "routine_type": {
+                        "type": "string",
+                        "description": "Routine to fill: basic_korean (default), anti_aging, acne_prone"
+                    },
+                    "budget_usd": {"type": "number", "description": "Most the whole routine may cost in USD"},
+                    "top_k": {"type": "integer", "description": f"Alternative routines to return, best first (default 3, at most {ROUTINE_MAX_PLANS})"}
+                },
+                "required": ["skin_type"]
+            }
+        ),
+        Tool(
+            name="server_stats",
+            description="Runtime statistics of this server: per-tool call counts and latency, upstream search health and cache hit rates",
+            inputSchema={"type": "object", "properties": {}}
+        ),
+        Tool(
+            name="batch_call",
+            description="Run several K-Beauty tool calls concurrently in one request; per-call results and errors are returned in order as JSON",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "calls": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "name": {"type": "string"},
+                                "arguments": {"type": "object"}
+                            },
+                            "required": ["name"]
+                        },
+                        "description": "Tool calls to run, each with a tool name and its arguments (batch_call cannot be nested)"
+                    }
+                },
+                "required": ["calls"]
+            }
         )
     ]
+    for tool in tools:
+        tool.inputSchema["properties"]["format"] = FORMAT_PROPERTY
+    return tuple(tools)
+
+@app.list_tools()
+async def list_tools() -> List[Tool]:
+    """List available K-Beauty tools."""
+    return list(tool_registry())
 
 @app.call_tool()
 async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
+    """Handle tool calls within the per-call time budget, once admitted past the tool gate."""
+    try:
+        async with tool_gate.admit():
+            with deadline_scope(TOOL_BUDGET), profiler.watch(name, arguments):
+                if not metrics.enabled:
+                    return await dispatch_tool(name, arguments)
+                return await measured_dispatch(name, arguments)
+    except Overloaded:
+        tool_calls.inc(name if name in tool_names() else "unknown", "overloaded")
+        return [TextContent(type="text", text="The server is at capacity right now. Please retry in a moment.")]
+
+@lru_cache(maxsize=1)
+def tool_names() -> frozenset:
+    return frozenset(tool.name for tool in tool_registry())
+
+async def measured_dispatch(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
+    """``dispatch_tool`` with its time split into upstream waits and local work, and its output size."""
+    # Client-supplied names become labels, so unknown ones share a single series
+    tool = name if name in tool_names() else "unknown"
+    timer = WaitTimer()
+    token = upstream_wait.set(timer)
+    started = time.perf_counter()
+    try:
+        contents = await dispatch_tool(name, arguments)
+    except Exception:
+        # A cancelled call (the client went away) is not a tool error
+        tool_calls.inc(tool, "error")
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        upstream_wait.reset(token)
+        tool_seconds.observe(elapsed, tool)
+        tool_upstream_seconds.observe(timer.total, tool)
+        tool_render_seconds.observe(max(elapsed - timer.total, 0.0), tool)
+    tool_calls.inc(tool, "ok")
+    tool_response_bytes.observe(
+        sum(len(content.text.encode()) for content in contents if isinstance(content, TextContent)), tool
+    )
+    return contents
+
+async def run_batch(calls: List[Any]) -> str:
+    """Run tool calls concurrently and report each result or error in input order.
+
+    Identical calls (same name and arguments) run once and share the result.
+    The whole batch shares the caller's time budget.
+    """
+    known = {tool.name for tool in tool_registry()} - {"batch_call"}
+    jobs: List[Tuple[str, Dict[str, Any]]] = []
+    slots: List[Optional[int]] = []  # index into jobs for each call, None if invalid
+    seen: Dict[str, int] = {}
+    for call in calls:
+        name = call.get("name") if isinstance(call, dict) else None
+        arguments = (call.get("arguments") or {}) if isinstance(call, dict) else None
+        if name not in known or not isinstance(arguments, dict):
+            slots.append(None)
+            continue
+        key = json.dumps([name, arguments], sort_keys=True)
+        if key not in seen:
+            seen[key] = len(jobs)
+            jobs.append((name, arguments))
+        slots.append(seen[key])
+
+    async def run(name: str, arguments: Dict[str, Any]) -> Tuple[bool, str]:
+        contents = await dispatch_tool(name, arguments)
+        return True, "\n".join(content.text for content in contents if isinstance(content, TextContent))
+
+    def failed(index: int, error: BaseException) -> Tuple[bool, str]:
+        if isinstance(error, asyncio.TimeoutError):
+            return False, "Timed out"
+        logger.warning(f"Batched {jobs[index][0]} call failed: {error!r}")
+        return False, f"{type(error).__name__}: {error}"
+
+    outcomes = await gather_bounded(
+        [lambda job=job: run(*job) for job in jobs],
+        limit=BATCH_CONCURRENCY,
+        deadline=remaining_budget(),
+        fallback=failed,
+    )
+
+    results = []
+    for index, (call, slot) in enumerate(zip(calls, slots)):
+        item: Dict[str, Any] = {"index": index, "name": call.get("name") if isinstance(call, dict) else None}
+        if slot is None:
+            item["error"] = "Unknown tool or invalid arguments"
+        else:
+            ok, text = outcomes[slot]
+            item["result" if ok else "error"] = text
+        results.append(item)
+    return json.dumps({"results": results}, ensure_ascii=False)
+
+async def dispatch_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
     """Handle tool calls with comprehensive web search integration."""
+    output_format = arguments.get("format", "markdown")
+    structured = output_format in OUTPUT_FORMATS and output_format != "markdown"
     
     if name == "search_kbeauty_brands":
         query = arguments.get("query", "")
@@ -435,7 +1543,10 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
         enhanced_query = enhance_search_with_knowledge(query, "brand")
         
         # Perform web search
-        web_results = await search_web(enhanced_query, "brand")
+        web_data = await search_web_data(enhanced_query, "brand")
+        if structured:
+            return render_structured(output_format, {"query": query, "recognized": recognize_terms(query), "web": web_data})
+        web_results = format_search_data(web_data)
         
         # Add brand recognition context
         brand_context = get_brand_recognition_info(query)
@@ -447,6 +1558,39 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
     elif name == "get_product_info":
         brand = arguments.get("brand", "")
         product_name = arguments.get("product_name", "")
+        include_web = arguments.get("include_web", False)
+        
+        # Answer from the curated database first
+        curated = ""
+        product_record = None
+        brand_record = knowledge_index().lookup(brand, "brand")
+        if brand_record is not None:
+            if product_name:
+                product_record = knowledge_index().resolve_product(brand_record.key, product_name)
+                if product_record is not None:
+                    curated = format_curated_product(brand_record, product_record)
+            else:
+                curated = format_curated_brand(brand_record)
+        
+        if structured:
+            payload: Dict[str, Any] = {
+                "brand": dict(brand_record.data) if brand_record else None,
+                "product": dict(product_record.data) if product_name and brand_record and product_record else None,
+                "recognized": recognize_terms(f"{brand} {product_name}"),
+            }
+            if payload["brand"]:
+                products = payload["brand"].pop("popular_products")
+                if not product_name:
+                    payload["brand"]["popular_products"] = [dict(product) for product in products]
+        
+        # Add product context
+        product_context = get_brand_recognition_info(f"{brand} {product_name}")
+        
+        if curated and not include_web:
+            if structured:
+                return render_structured(output_format, payload)
+            result = f"{curated}**Product Context:**\n{product_context}\n{CURATED_FOOTER}"
+            return [TextContent(type="text", text=result)]
         
         # Create comprehensive search query
         if product_name:
@@ -455,27 +1599,49 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
             search_query = f"{brand} K-Beauty brand products popular bestsellers Korean skincare"
         
         enhanced_query = enhance_search_with_knowledge(search_query, "product")
-        web_results = await search_web(enhanced_query, "product")
+        web_data = await search_web_data(enhanced_query, "product")
+        if structured:
+            payload["web"] = web_data
+            return render_structured(output_format, payload)
+        web_results = format_search_data(web_data)
         
-        # Add product context
-        product_context = get_brand_recognition_info(f"{brand} {product_name}")
-        
-        result = f"{web_results}\n**Product Context:**\n{product_context}"
+        result = f"{curated}{web_results}\n**Product Context:**\n{product_context}"
         
         return [TextContent(type="text", text=result)]
     
     elif name == "analyze_ingredients":
         ingredient = arguments.get("ingredient", "")
+        include_web = arguments.get("include_web", False)
         
-        # Create ingredient-specific search query
-        search_query = f"{ingredient} skincare ingredient benefits safety K-Beauty Korean cosmetics hanbang"
-        enhanced_query = enhance_search_with_knowledge(search_query, "ingredient")
-        web_results = await search_web(enhanced_query, "ingredient")
+        # Answer from the curated database first
+        ingredient_record = knowledge_index().lookup(ingredient, "ingredient")
+        curated = format_curated_ingredient(ingredient_record) if ingredient_record else ""
+        
+        if structured:
+            payload = {
+                "ingredient": dict(ingredient_record.data) if ingredient_record else None,
+                "recognized": recognize_terms(ingredient),
+            }
         
         # Add ingredient context
         ingredient_context = get_brand_recognition_info(ingredient)
         
-        result = f"{web_results}\n**Ingredient Context:**\n{ingredient_context}"
+        if curated and not include_web:
+            if structured:
+                return render_structured(output_format, payload)
+            result = f"{curated}**Ingredient Context:**\n{ingredient_context}\n{CURATED_FOOTER}"
+            return [TextContent(type="text", text=result)]
+        
+        # Create ingredient-specific search query
+        search_query = f"{ingredient} skincare ingredient benefits safety K-Beauty Korean cosmetics hanbang"
+        enhanced_query = enhance_search_with_knowledge(search_query, "ingredient")
+        web_data = await search_web_data(enhanced_query, "ingredient")
+        if structured:
+            payload["web"] = web_data
+            return render_structured(output_format, payload)
+        web_results = format_search_data(web_data)
+        
+        result = f"{curated}{web_results}\n**Ingredient Context:**\n{ingredient_context}"
         
         return [TextContent(type="text", text=result)]
     
@@ -483,79 +1649,40 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
         skin_type = arguments.get("skin_type", "normal")
         concerns = arguments.get("concerns", [])
         routine_type = arguments.get("routine_type", "basic_korean")
+        include_web = arguments.get("include_web", False)
         
-        # Create comprehensive routine search query
-        concerns_text = " ".join(concerns) if concerns else ""
-        search_query = f"Korean skincare routine {skin_type} skin {concerns_text} {routine_type} K-Beauty steps products 2024"
+        # Curated routine steps answer locally; the web is only used for enrichment or unknown routines
+        routine_record = knowledge_index().lookup(routine_type, "routine")
+        curated = curated_routine(routine_record.key) if routine_record else ""
         
-        web_results = await search_web(search_query, "routine")
+        web_data = None
+        if not curated or include_web:
+            # Create comprehensive routine search query
+            concerns_text = " ".join(concerns) if concerns else ""
+            search_query = f"Korean skincare routine {skin_type} skin {concerns_text} {routine_type} K-Beauty steps products 2024"
+            web_data = await search_web_data(search_query, "routine")
         
-        # Add comprehensive routine framework
-        routine_framework = f"""**Korean Skincare Routine Framework for {skin_type.title()} Skin:**
-
-**🌅 Morning Routine (AM):**
-1. **Gentle Cleanser** (if needed) - Remove overnight impurities
-2. **Toner/First Treatment Essence** - Prepare skin for products
-3. **Vitamin C Serum** - Antioxidant protection and brightening
-4. **Hydrating Essence/Serum** - Based on skin needs
-5. **Eye Cream** - Delicate eye area care
-6. **Moisturizer** - Lock in hydration
-7. **Sunscreen SPF 30+** - Essential UV protection
-
-**🌙 Evening Routine (PM):**
-1. **Oil Cleanser** - Remove makeup and sunscreen
-2. **Water-based Cleanser** - Deep clean (double cleansing)
-3. **Exfoliation** - 2-3x per week (AHA/BHA/PHA)
-4. **Toner** - Restore pH balance
-5. **Treatment Essence** - Fermented ingredients for skin renewal
-6. **Active Serum** - Target specific concerns
-7. **Eye Cream** - Anti-aging or hydrating
-8. **Face Oil** - Optional, for extra nourishment
-9. **Moisturizer/Night Cream** - Repair and regenerate
-10. **Sleeping Mask** - 2-3x per week for intensive care
-
-**🎯 Skin Type Specific Tips:**"""
+        skin_type_key = skin_type.lower()
+        concern_key = canonical_concerns(concerns)
         
-        if skin_type.lower() == "oily":
-            routine_framework += """
-- **Focus:** Oil control, pore care, gentle exfoliation
-- **Key Ingredients:** Niacinamide, BHA, tea tree, volcanic ash
-- **Avoid:** Heavy creams, over-cleansing
-- **K-Beauty Picks:** COSRX, Innisfree, Some By Mi"""
-        elif skin_type.lower() == "dry":
-            routine_framework += """
-- **Focus:** Deep hydration, barrier repair, gentle care
-- **Key Ingredients:** Hyaluronic acid, ceramides, snail mucin, honey
-- **Avoid:** Harsh exfoliants, alcohol-based toners
-- **K-Beauty Picks:** Laneige, Beauty of Joseon, Torriden"""
-        elif skin_type.lower() == "sensitive":
-            routine_framework += """
-- **Focus:** Soothing, minimal irritation, barrier strengthening
-- **Key Ingredients:** Centella asiatica, mugwort, panthenol, ceramides
-- **Avoid:** Fragrances, high concentrations of actives
-- **K-Beauty Picks:** Purito, Dear Klairs, Dr. Jart+"""
-        elif skin_type.lower() == "combination":
-            routine_framework += """
-- **Focus:** Balance between T-zone and dry areas
-- **Key Ingredients:** Niacinamide, hyaluronic acid, gentle AHA
-- **Strategy:** Different products for different face areas
-- **K-Beauty Picks:** Missha, The Face Shop, Etude House"""
-        
-        if concerns:
-            routine_framework += f"\n\n**🎯 Addressing Your Concerns ({', '.join(concerns)}):**"
-            for concern in concerns:
-                if "acne" in concern.lower():
-                    routine_framework += "\n- **Acne:** BHA (salicylic acid), tea tree, centella asiatica"
-                elif "aging" in concern.lower():
-                    routine_framework += "\n- **Anti-aging:** Retinol, peptides, ginseng, vitamin C"
-                elif "dark" in concern.lower() or "pigment" in concern.lower():
-                    routine_framework += "\n- **Pigmentation:** Vitamin C, arbutin, kojic acid, rice water"
-                elif "pore" in concern.lower():
-                    routine_framework += "\n- **Pores:** Niacinamide, BHA, clay masks, volcanic ash"
-        
-        result = f"{web_results}\n{routine_framework}"
+        if structured:
+            return render_structured(output_format, {
+                "skin_type": skin_type,
+                "concerns": list(concern_key),
+                "routine": dict(routine_record.data) if routine_record else None,
+                "skin_type_tips": SKIN_TYPE_TIPS.get(skin_type_key, {}),
+                "concern_ingredients": dict(routine_concern_tips(concern_key)),
+                "web": web_data,
+            })
         
-        return [TextContent(type="text", text=result)]
+        parts = [curated]
+        if web_data is not None:
+            parts.append(format_search_data(web_data))
+        parts += ["\n", routine_framework(skin_type_key, concern_key)]
+        if curated and not include_web:
+            parts += ["\n\n", CURATED_FOOTER]
+        
+        return [TextContent(type="text", text="".join(parts))]
     
     elif name == "compare_products":
         products = arguments.get("products", [])
@@ -563,18 +1690,45 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
         if len(products) < 2:
             return [TextContent(type="text", text="Please provide at least 2 products to compare")]
         
-        # Search for each product comprehensively
+        # Search for every product concurrently; slow lookups degrade to curated context
+        search_queries = []
+        for product in products:
+            brand = product.get("brand", "")
+            product_name = product.get("product_name", "")
+            search_query = f"{brand} {product_name} K-Beauty review ingredients benefits price comparison"
+            search_queries.append(enhance_search_with_knowledge(search_query, "product"))
+
+        def search_timed_out(index: int, error: BaseException) -> Dict[str, Any]:
+            logger.warning(f"Comparison search for product {index + 1} skipped: {error!r}")
+            return {"query": search_queries[index], "error": "Search timed out"}
+
+        remaining = remaining_budget()
+        web_data = await gather_bounded(
+            [lambda q=q: search_web_data(q, "product") for q in search_queries],
+            limit=COMPARE_CONCURRENCY,
+            deadline=COMPARE_DEADLINE if remaining is None else min(COMPARE_DEADLINE, remaining),
+            fallback=search_timed_out,
+        )
+        
+        if structured:
+            return render_structured(output_format, {"products": [
+                {
+                    "brand": product.get("brand", ""),
+                    "product_name": product.get("product_name", ""),
+                    "recognized": recognize_terms(f"{product.get('brand', '')} {product.get('product_name', '')}"),
+                    "web": data,
+                }
+                for product, data in zip(products, web_data)
+            ]})
+        web_results = [format_search_data(data) for data in web_data]
+
         comparison_results = "**🔍 K-Beauty Product Comparison Search Results**\n\n"
         
-        for i, product in enumerate(products):
+        for i, (product, web_result) in enumerate(zip(products, web_results)):
             brand = product.get("brand", "")
             product_name = product.get("product_name", "")
             
-            search_query = f"{brand} {product_name} K-Beauty review ingredients benefits price comparison"
-            enhanced_query = enhance_search_with_knowledge(search_query, "product")
-            
             comparison_results += f"**🌸 Product {i+1}: {brand.title()} {product_name}**\n"
-            web_result = await search_web(enhanced_query, "product")
             comparison_results += f"{web_result}\n"
             
             # Add context for each product
@@ -610,7 +1764,29 @@ When comparing K-Beauty products, consider:
             return [TextContent(type="text", text="Please provide an image of your face for skin analysis.")]
         
         # Analyze the skin from the uploaded image
-        analysis = await analyze_skin_from_image(image_data)
+        try:
+            analysis = await analyze_skin_from_image(image_data)
+        except ImageRejected as e:
+            return [TextContent(type="text", text=str(e))]
+        except DeadlineExceeded:
+            return [TextContent(type="text", text="Photo analysis took too long; please try a smaller photo.")]
+        
+        # Web search for latest product reviews
+        concerns = " ".join(analysis["primary_concerns"])
+        web_search_query = f"K-Beauty products for {concerns} Korean skincare routine"
+        web_data = await search_web_data(web_search_query, "product")
+        
+        if structured:
+            return render_structured(output_format, {
+                "analysis": analysis,
+                "guidance": {concern: list(PHOTO_CONCERN_GUIDE[concern]) for concern in analysis["primary_concerns"]},
+                "picks": [
+                    {"brand": brand_name, "name": product["name"], "price_usd": product["price_usd"]}
+                    for brand_name, product in photo_product_picks(analysis["skin_type"])
+                ],
+                "notes": additional_info,
+                "web": web_data,
+            })
         
         # Get K-Beauty recommendations based on analysis
         recommendations = get_kbeauty_recommendations_from_analysis(analysis)
@@ -619,12 +1795,7 @@ When comparing K-Beauty products, consider:
         if additional_info:
             recommendations += f"\n\n### Additional Notes\nUser mentioned: {additional_info}"
         
-        # Add web search for latest product reviews
-        if "primary_concerns" in analysis:
-            concerns = " ".join(analysis["primary_concerns"])
-            web_search_query = f"K-Beauty products for {concerns} Korean skincare routine"
-            web_results = await search_web(web_search_query, "product")
-            recommendations += f"\n\n### Latest Product Information\n{web_results}"
+        recommendations += f"\n\n### Latest Product Information\n{format_search_data(web_data)}"
         
         return [TextContent(type="text", text=recommendations)]
     
@@ -641,89 +1812,184 @@ When comparing K-Beauty products, consider:
         search_query = f"K-Beauty products for {concerns_text} {skin_type} skin {budget} budget Korean skincare"
         
         # Get web search results
-        web_results = await search_web(search_query, "product")
+        web_data = await search_web_data(search_query, "product")
+        concern_key = canonical_concerns(concerns)
         
-        # Create structured recommendations
-        result = f"## Targeted K-Beauty Recommendations\n\n"
-        result += f"**Skin Type:** {skin_type.title()}\n"
-        result += f"**Primary Concerns:** {', '.join([concern.title() for concern in concerns])}\n"
-        result += f"**Budget Preference:** {budget.title()}\n\n"
+        if structured:
+            return render_structured(output_format, {
+                "skin_type": skin_type,
+                "concerns": list(concern_key),
+                "budget": budget,
+                "recommendations": {
+                    concern: [name for name, _ in concern_picks(concern, skin_type.lower(), budget.lower())]
+                    for concern in concern_key
+                },
+                "web": web_data,
+            })
         
-        # Add concern-specific recommendations
-        result += "### Concern-Specific Product Recommendations\n\n"
+        report = concern_matcher_report(skin_type.lower(), concern_key, budget.lower())
+        result = "".join([report, "### Latest Product Information\n", format_search_data(web_data), ROUTINE_INTEGRATION_TIPS])
         
-        for concern in concerns:
-            concern_lower = concern.lower()
-            result += f"#### For {concern.title()}:\n"
-            
-            if "acne" in concern_lower:
-                if budget in ["budget", "all"]:
-                    result += "- **COSRX BHA Blackhead Power Liquid** - Gentle yet effective BHA treatment\n"
-                    result += "- **COSRX Snail 96 Mucin Power Essence** - Healing and anti-inflammatory\n"
-                if budget in ["mid-range", "luxury", "all"]:
-                    result += "- **Beauty of Joseon Red Bean Water Gel** - Gentle moisture for acne-prone skin\n"
-                if budget in ["luxury", "all"]:
-                    result += "- **Sulwhasoo Clarifying Mask** - Deep pore cleansing with traditional herbs\n"
-            
-            elif "aging" in concern_lower or "wrinkle" in concern_lower:
-                if budget in ["budget", "all"]:
-                    result += "- **Beauty of Joseon Glow Deep Serum** - Alpha arbutin + niacinamide\n"
-                    result += "- **COSRX Retinol 0.1 Cream** - Gentle retinol for beginners\n"
-                if budget in ["mid-range", "luxury", "all"]:
-                    result += "- **Laneige Time Freeze Intensive Cream** - Advanced anti-aging formula\n"
-                if budget in ["luxury", "all"]:
-                    result += "- **Sulwhasoo Concentrated Ginseng Renewing Cream** - Premium anti-aging\n"
-            
-            elif "dry" in concern_lower or "dehydrat" in concern_lower:
-                if budget in ["budget", "all"]:
-                    result += "- **Laneige Water Sleeping Mask** - Overnight hydration boost\n"
-                    result += "- **COSRX Hyaluronic Acid Intensive Cream** - Deep moisture\n"
-                if budget in ["mid-range", "luxury", "all"]:
-                    result += "- **Laneige Cream Skin Refiner** - Toner-cream hybrid for extra moisture\n"
-                if budget in ["luxury", "all"]:
-                    result += "- **Sulwhasoo First Care Activating Serum** - Luxury hydrating treatment\n"
-            
-            elif "pigment" in concern_lower or "dark spot" in concern_lower:
-                if budget in ["budget", "all"]:
-                    result += "- **Beauty of Joseon Glow Deep Serum** - Alpha arbutin for brightening\n"
-                    result += "- **Purito Centella Unscented Serum** - Niacinamide for even tone\n"
-                if budget in ["mid-range", "luxury", "all"]:
-                    result += "- **Klairs Freshly Juiced Vitamin C Serum** - Gentle vitamin C\n"
-                if budget in ["luxury", "all"]:
-                    result += "- **Sulwhasoo Concentrated Ginseng Renewing Serum** - Brightening ginseng\n"
-            
-            elif "sensitive" in concern_lower:
-                if budget in ["budget", "all"]:
-                    result += "- **Purito Centella Unscented Recovery Cream** - Ultra-gentle moisture\n"
-                    result += "- **COSRX Snail 96 Mucin Power Essence** - Soothing and healing\n"
-                if budget in ["mid-range", "luxury", "all"]:
-                    result += "- **Dr. Jart+ Cicapair Tiger Grass Cream** - Centella for redness\n"
-                if budget in ["luxury", "all"]:
-                    result += "- **Sulwhasoo Gentle Cleansing Foam** - Ultra-mild cleansing\n"
-            
-            result += "\n"
+        return [TextContent(type="text", text=result)]
+    
+    elif name == "filter_products":
+        sort = arguments.get("sort", "price")
+        try:
+            limit = min(max(int(arguments.get("limit", 10)), 1), FILTER_MAX_LIMIT)
+            offset = max(int(arguments.get("offset", 0)), 0)
+            prices = [None if arguments.get(key) is None else float(arguments[key]) for key in ("min_price", "max_price")]
+        except (TypeError, ValueError):
+            return [TextContent(type="text", text="limit, offset and prices must be numbers.")]
+        if sort not in SORT_ORDERS:
+            return [TextContent(type="text", text=f"Sort must be one of: {', '.join(SORT_ORDERS)}.")]
+        facets = {key: list_argument(arguments, key) for key in ("types", "skin_types", "benefits", "brands")}
+        if None in facets.values():
+            return [TextContent(type="text", text="types, skin_types, benefits and brands must be lists.")]
         
-        # Add web search results
-        result += f"### Latest Product Information\n{web_results}"
+        result = product_index().filter(
+            **facets,
+            min_price=prices[0],
+            max_price=prices[1],
+            sort=sort,
+            limit=limit,
+            offset=offset,
+        )
+        products = [catalog_product(product_id) for product_id in result.product_ids]
         
-        # Add routine suggestions
-        result += "\n### Quick Routine Integration Tips\n"
-        result += "1. **Start Slowly**: Introduce one new product every 1-2 weeks\n"
-        result += "2. **Patch Test**: Always test new products on your inner arm first\n"
-        result += "3. **Layer Properly**: Thinnest to thickest consistency\n"
-        result += "4. **Morning vs Evening**: Use actives (BHA, retinol) at night\n"
-        result += "5. **Sun Protection**: Essential when using any active ingredients\n"
+        if structured:
+            return render_structured(output_format, {"total": result.total, "offset": offset, "products": products})
+        return [TextContent(type="text", text=format_filtered_products(result.total, offset, products))]
+    
+    elif name == "check_shelf_compatibility":
+        products = arguments.get("products", [])
         
-        return [TextContent(type="text", text=result)]
+        if len(products) < 2:
+            return [TextContent(type="text", text="Please provide at least 2 products to check together.")]
+        if len(products) > SHELF_MAX_PRODUCTS:
+            return [TextContent(type="text", text=f"A shelf check can cover at most {SHELF_MAX_PRODUCTS} products.")]
+        
+        report = check_shelf(products)
+        if structured:
+            return render_structured(output_format, report)
+        return [TextContent(type="text", text=format_shelf_report(report))]
+    
+    elif name == "build_routine":
+        skin_type = str(arguments.get("skin_type", "normal")).lower()
+        routine_type = arguments.get("routine_type", "basic_korean")
+        try:
+            top_k = min(max(int(arguments.get("top_k", 3)), 1), ROUTINE_MAX_PLANS)
+            budget = None if arguments.get("budget_usd") is None else float(arguments["budget_usd"])
+        except (TypeError, ValueError):
+            return [TextContent(type="text", text="top_k and budget_usd must be numbers.")]
+        if budget is not None and not (math.isfinite(budget) and budget >= 0):
+            return [TextContent(type="text", text="budget_usd must be a finite amount of at least 0.")]
+        concerns = list_argument(arguments, "concerns")
+        if concerns is None:
+            return [TextContent(type="text", text="concerns must be a list of skin concerns.")]
+        
+        routine_record = knowledge_index().lookup(routine_type, "routine")
+        if routine_record is None:
+            return [TextContent(type="text", text=f"Routine type must be one of: {', '.join(SKINCARE_ROUTINES)}.")]
+        
+        report = build_routine_plans(
+            routine_record.key, skin_type, canonical_concerns(concerns), budget, top_k
+        )
+        if structured:
+            return render_structured(output_format, report)
+        return [TextContent(type="text", text=format_routine_plans(report))]
+    
+    elif name == "server_stats":
+        if not metrics.enabled:
+            return [TextContent(type="text", text="Runtime metrics are disabled on this server (KBEAUTY_METRICS=0).")]
+        
+        report = server_stats_report()
+        if structured:
+            return render_structured(output_format, report)
+        return [TextContent(type="text", text=format_server_stats(report))]
+    
+    elif name == "batch_call":
+        calls = arguments.get("calls", [])
+        
+        if not calls:
+            return [TextContent(type="text", text="Please provide at least one tool call to run.")]
+        if len(calls) > BATCH_MAX_CALLS:
+            return [TextContent(type="text", text=f"A batch can run at most {BATCH_MAX_CALLS} tool calls.")]
+        
+        # A batch-level format is the default for every call in the batch
+        if "format" in arguments:
+            calls = [
+                {**call, "arguments": {"format": output_format, **(call.get("arguments") or {})}}
+                if isinstance(call, dict) and isinstance(call.get("arguments") or {}, dict) else call
+                for call in calls
+            ]
+        return [TextContent(type="text", text=await run_batch(calls))]
     
     return [TextContent(type="text", text=f"Unknown tool: {name}")]
 
-async def main():
-    """Run the K-Beauty MCP server."""
-    from mcp.server.stdio import stdio_server
-    
-    async with stdio_server() as (read_stream, write_stream):
-        await app.run(read_stream, write_stream, app.create_initialization_options())
+@asynccontextmanager
+async def server_resources() -> AsyncIterator[None]:
+    """Open the shared HTTP pool for the server lifetime and release every resource on exit."""
+    async with http_client:
+        try:
+            yield
+        finally:
+            photo_pipeline.close()
+            profiler.close()
+            await search_cache.close()
+
+def warm_up() -> None:
+    """Build the lazily loaded indexes and tool schemas ahead of the first request."""
+    for build in (product_index, knowledge_index, fuzzy_index, term_matcher, ingredient_graph, routine_builder, tool_registry):
+        build()
+
+def prometheus_metrics() -> Optional[Callable[[], str]]:
+    """Renderer for the /metrics endpoint, or None to leave it out when metrics are off."""
+    return metrics.render_prometheus if metrics.enabled else None
+
+def http_app():
+    """ASGI app factory for ``--workers``: each worker process builds its own app."""
+    return create_http_app(app, env_str("KBEAUTY_TRANSPORT", "http"), server_resources, warm_up, prometheus_metrics())
+
+async def main(transport: str = "stdio", config: Optional[HttpServeConfig] = None):
+    """Run the K-Beauty MCP server over stdio, or over HTTP for many concurrent sessions."""
+    if transport == "stdio":
+        from mcp.server.stdio import stdio_server
+
+        async with server_resources():
+            async with stdio_server() as (read_stream, write_stream):
+                await app.run(read_stream, write_stream, app.create_initialization_options())
+        return
+
+    await serve_http(app, transport, server_resources, config or HttpServeConfig.from_env(), warm_up, prometheus_metrics())
+
+def cli(argv: Optional[Sequence[str]] = None) -> None:
+    """Command line entry point: ``k-beauty-mcp [--transport stdio|http|sse] [--host H] [--port P] [--workers N]``."""
+    parser = argparse.ArgumentParser(description="K-Beauty MCP server")
+    parser.add_argument("--transport", choices=TRANSPORTS, default=env_str("KBEAUTY_TRANSPORT", "stdio"),
+                        help="stdio for a single local client (default), http or sse to serve many sessions")
+    parser.add_argument("--host", help="address to bind in http/sse mode (default KBEAUTY_SERVE_HOST or 127.0.0.1)")
+    parser.add_argument("--port", type=int, help="port to listen on in http/sse mode (default KBEAUTY_SERVE_PORT or 8000)")
+    parser.add_argument("--workers", type=int,
+                        help="server processes sharing the port in http/sse mode (default KBEAUTY_SERVE_WORKERS or 1)")
+    args = parser.parse_args(argv)
+    if args.transport == "stdio":
+        if args.host or args.port or args.workers:
+            parser.error("--host, --port and --workers need --transport http or sse")
+        asyncio.run(main())
+        return
+
+    config = HttpServeConfig.from_env()
+    config.host = args.host or config.host
+    config.port = args.port or config.port
+    config.workers = args.workers or config.workers
+    if config.workers <= 1:
+        asyncio.run(main(args.transport, config))
+        return
+    if isinstance(search_cache.backend, MemoryCache):
+        logger.warning("KBEAUTY_CACHE_PATH is empty, so each worker keeps a separate search cache")
+    # Workers are fresh processes that import http_app; they learn the transport from the environment
+    os.environ["KBEAUTY_TRANSPORT"] = args.transport
+    serve_workers("kbeauty_mcp:http_app", config)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    cli()
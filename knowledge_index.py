@@ -0,0 +1,160 @@
+"""
+Entity resolution over the curated K-Beauty data modules.
+
+Maps brand names, Korean names, product names, ingredient names and routine
+names to their records in ``data/`` so tools can answer from local facts
+without a web round trip.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional
+
+from fuzzy_index import FuzzyIndex
+from term_matcher import TermMatcher
+
+_PARENTHESIZED = re.compile(r"\(([^)]*)\)")
+
+# Fuzzy resolution returns a specific record, so it must be more confident
+# than keyword recognition: "vitamin c" must not resolve to "vitamin b3".
+FUZZY_MIN_SCORE = 0.8
+
+
+class EntityRecord(NamedTuple):
+    """A resolved entity: its kind, key in the source dict and the record itself."""
+
+    kind: str   # "brand", "product", "ingredient" or "routine"
+    key: str
+    data: Mapping[str, Any]
+    brand_key: Optional[str] = None  # owning brand, for products
+
+
+def normalize_name(text: str) -> str:
+    """Casefold and collapse separators so lookups ignore case and spacing."""
+    return " ".join(text.casefold().replace("_", " ").split())
+
+
+def name_variants(name: str) -> List[str]:
+    """Split ``"Laneige (라네즈)"`` into ``["laneige (라네즈)", "laneige", "라네즈"]``."""
+    variants = [name]
+    inner = _PARENTHESIZED.findall(name)
+    if inner:
+        variants.append(_PARENTHESIZED.sub(" ", name))
+        variants.extend(inner)
+    return [v for v in (normalize_name(v) for v in variants) if v]
+
+
+class KnowledgeIndex:
+    """Alias table and term matcher over brands, products, ingredients and routines."""
+
+    def __init__(
+        self,
+        brands: Mapping[str, Mapping[str, Any]],
+        ingredients: Mapping[str, Mapping[str, Any]],
+        routines: Mapping[str, Mapping[str, Any]],
+    ):
+        self._aliases: Dict[str, List[EntityRecord]] = {}
+
+        for brand_key, brand in brands.items():
+            record = EntityRecord("brand", brand_key, brand)
+            self._add(record, [brand_key, *name_variants(brand["name"])])
+            brand_names = [normalize_name(brand_key), *name_variants(brand["name"])]
+            for product in brand.get("popular_products", []):
+                product_record = EntityRecord("product", product["name"], product, brand_key)
+                product_name = normalize_name(product["name"])
+                self._add(product_record, [product_name, *(f"{b} {product_name}" for b in brand_names)])
+
+        for ingredient_key, ingredient in ingredients.items():
+            record = EntityRecord("ingredient", ingredient_key, ingredient)
+            aliases = [ingredient_key, *name_variants(ingredient["name"])]
+            if ingredient.get("korean_name"):
+                aliases.append(ingredient["korean_name"])
+            self._add(record, aliases)
+
+        for routine_key, routine in routines.items():
+            self._add(EntityRecord("routine", routine_key, routine), [routine_key, routine["name"]])
+
+        self._matcher = TermMatcher((alias, alias) for alias in self._aliases)
+        self._fuzzy = FuzzyIndex(self._aliases)
+
+    def _add(self, record: EntityRecord, aliases: Iterable[str]) -> None:
+        for alias in aliases:
+            alias = normalize_name(alias)
+            if not alias:
+                continue
+            records = self._aliases.setdefault(alias, [])
+            if record not in records:
+                records.append(record)
+
+    def __len__(self) -> int:
+        return len(self._aliases)
+
+    def aliases(self) -> List[str]:
+        return list(self._aliases)
+
+    def resolve(self, text: str, kind: Optional[str] = None) -> Optional[EntityRecord]:
+        """Resolve an exact name or alias; ``None`` when nothing matches."""
+        for record in self._aliases.get(normalize_name(text), []):
+            if kind is None or record.kind == kind:
+                return record
+        return None
+
+    def find(self, text: str, kind: Optional[str] = None) -> List[EntityRecord]:
+        """Return every entity mentioned in free text, longest mention first."""
+        found: List[EntityRecord] = []
+        matches = self._matcher.find_all(normalize_name(text))
+        for match in sorted(matches, key=lambda m: m.start - m.end):
+            for record in self._aliases[match.term]:
+                if (kind is None or record.kind == kind) and record not in found:
+                    found.append(record)
+        return found
+
+    def resolve_fuzzy(self, text: str, kind: Optional[str] = None) -> Optional[EntityRecord]:
+        """Resolve a misspelled or oddly spaced name ("sulwasoo", "설화 수")."""
+        for match in self._fuzzy.search(text, k=5):
+            if match.score < FUZZY_MIN_SCORE:
+                continue
+            for record in self._aliases[match.term]:
+                if kind is None or record.kind == kind:
+                    return record
+        return None
+
+    def lookup(self, text: str, kind: Optional[str] = None) -> Optional[EntityRecord]:
+        """Exact alias, then an embedded mention, then a fuzzy match."""
+        record = self.resolve(text, kind)
+        if record is None:
+            record = next(iter(self.find(text, kind)), None)
+        if record is None:
+            record = self.resolve_fuzzy(text, kind)
+        return record
+
+    def resolve_product(self, brand_key: str, product_name: str) -> Optional[EntityRecord]:
+        """Resolve a product of ``brand_key`` from an exact, embedded or partial name."""
+        candidates = self.products_of(brand_key)
+        wanted = normalize_name(product_name)
+        for record in candidates:
+            if normalize_name(record.key) == wanted:
+                return record
+        for record in self.find(product_name, "product"):
+            if record.brand_key == brand_key:
+                return record
+        # Partial names such as "snail essence": every word must appear in the product name
+        words = set(wanted.split())
+        for record in candidates:
+            if words and words <= set(normalize_name(record.key).split()):
+                return record
+        for match in self._fuzzy.search(product_name, k=5):
+            if match.score < FUZZY_MIN_SCORE:
+                continue
+            for record in self._aliases[match.term]:
+                if record.kind == "product" and record.brand_key == brand_key:
+                    return record
+        return None
+
+    def products_of(self, brand_key: str) -> List[EntityRecord]:
+        brand = self.resolve(brand_key, "brand")
+        if brand is None:
+            return []
+        return [
+            EntityRecord("product", product["name"], product, brand.key)
+            for product in brand.data.get("popular_products", [])
+        ]
@@ -0,0 +1,250 @@
+"""
+In-process runtime metrics.
+
+A ``MetricsRegistry`` holds labelled counters and fixed-bucket histograms
+plus callback metrics that read counters other components already keep
+(cache hits, breaker trips). Recording is a dict lookup and an add, with
+no locks: everything runs on the event loop thread.
+
+A disabled registry hands out shared no-op metrics, so instrumented code
+needs no ``if enabled`` checks of its own; only the clock reads around a
+call are worth guarding.
+
+The registry renders as a JSON-friendly snapshot and in the Prometheus
+text exposition format.
+"""
+
+import bisect
+import math
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from config import env_bool
+
+# Seconds, from a cached lookup to a slow upstream search
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bytes of rendered tool output
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+Labels = Tuple[str, ...]
+CallbackValue = Union[float, Dict[Labels, float]]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic count per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def expose(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_number(value)}"
+                for key, value in sorted(self.values.items())]
+
+    def snapshot(self) -> Dict[str, float]:
+        return {",".join(key) or "total": value for key, value in sorted(self.values.items())}
+
+
+class _Series:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * (buckets + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """Distribution of observed values over fixed upper-bound buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series: Dict[Labels, _Series] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = _Series(len(self.buckets))
+        series.counts[bisect.bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def quantile(self, q: float, *labels: str) -> Optional[float]:
+        """Upper bound of the bucket holding the ``q`` quantile (inf past the last bucket)."""
+        series = self.series.get(labels)
+        if series is None or series.count == 0:
+            return None
+        rank, seen = q * series.count, 0
+        for bound, count in zip((*self.buckets, math.inf), series.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+    def expose(self) -> List[str]:
+        lines = []
+        for key, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), series.counts):
+                cumulative += count
+                le = f'le="{_format_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_number(series.sum)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series.count}")
+        return lines
+
+    def snapshot(self) -> Dict[str, Dict[str, Optional[float]]]:
+        return {
+            ",".join(key) or "total": {
+                "count": series.count,
+                "sum": series.sum,
+                "p50": self.quantile(0.5, *key),
+                "p95": self.quantile(0.95, *key),
+            }
+            for key, series in sorted(self.series.items())
+        }
+
+
+class CallbackMetric:
+    """Counter or gauge whose value is read from a callback at collection time."""
+
+    def __init__(self, name: str, help: str, kind: str, fn: Callable[[], CallbackValue], labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labels = tuple(labels)
+        self.fn = fn
+
+    def _values(self) -> Dict[Labels, float]:
+        value = self.fn()
+        return value if isinstance(value, dict) else {(): value}
+
+    def expose(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_number(value)}"
+                for key, value in sorted(self._values().items())]
+
+    def snapshot(self) -> Dict[str, float]:
+        return {",".join(key) or "total": value for key, value in sorted(self._values().items())}
+
+
+class _NullMetric:
+    """Stand-in handed out by a disabled registry; records nothing."""
+
+    values: Dict[Labels, float] = {}
+    series: Dict[Labels, _Series] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        pass
+
+    def observe(self, value: float, *labels: str) -> None:
+        pass
+
+    def total(self) -> float:
+        return 0
+
+    def quantile(self, q: float, *labels: str) -> Optional[float]:
+        return None
+
+
+_NULL = _NullMetric()
+
+
+class WaitTimer:
+    """Wall time during which at least one wait is in progress.
+
+    Use as a context manager around each wait; overlapping waits (a fan-out
+    of searches) count once, so the total never exceeds the elapsed time.
+    """
+
+    def __init__(self):
+        self.total = 0.0
+        self._open = 0
+        self._since = 0.0
+
+    def __enter__(self) -> "WaitTimer":
+        if self._open == 0:
+            self._since = time.perf_counter()
+        self._open += 1
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._open -= 1
+        if self._open == 0:
+            self.total += time.perf_counter() - self._since
+
+
+class MetricsRegistry:
+    """Named metrics of one server process."""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: Dict[str, Union[Counter, Histogram, CallbackMetric]] = {}
+
+    @classmethod
+    def from_env(cls) -> "MetricsRegistry":
+        """Enabled unless ``KBEAUTY_METRICS`` is set to a false value."""
+        return cls(enabled=env_bool("KBEAUTY_METRICS", True))
+
+    def _register(self, metric):
+        if not self.enabled:
+            return _NULL
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def callback(self, name: str, help: str, fn: Callable[[], CallbackValue],
+                 kind: str = "gauge", labels: Sequence[str] = ()) -> None:
+        """Expose a value some other component already keeps, read on each collection."""
+        self._register(CallbackMetric(name, help, kind, fn, labels))
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def render_prometheus(self) -> str:
+        """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,291 @@
+"""
+Bitset indexes for filtering the product catalog.
+
+Products are ranked by price and every indexed value (type, skin type,
+benefit, brand) maps to a Python int with bit ``i`` set when the ``i``-th
+cheapest product has it. A query ORs the bitsets of the values asked for
+within each field and ANDs the fields together; a price range is a
+contiguous run of bits found by bisecting the sorted prices. Results come
+out of the final bitset already in price order, so even on a 100k-product
+catalog a query is a handful of big-integer operations.
+"""
+
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from catalog import Catalog
+from knowledge_index import normalize_name
+
+# Result orders accepted by ``ProductIndex.select``
+SORT_ORDERS = ("price", "price_desc", "name")
+
+# A product for "All" skin types matches any skin type filter
+ALL_SKIN_TYPES = "all"
+
+# Set bit offsets of every byte value, lowest first
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+_BYTE_BITS_DESC = [bits[::-1] for bits in _BYTE_BITS]
+# Skipping zero bytes in C keeps sparse bitsets cheap to enumerate
+_NONZERO_BYTE = re.compile(rb"[^\x00]")
+
+
+class FilterResult(NamedTuple):
+    """One page of matches: the total match count and the page's product ids."""
+
+    total: int
+    product_ids: List[int]
+
+
+def bitset(positions: Iterable[int], size: int) -> int:
+    """Bitset of ``positions``; linear in ``size / 8``, unlike OR-ing bits one by one."""
+    buffer = bytearray((size + 7) // 8)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def set_bits(mask: int, descending: bool = False) -> Iterator[int]:
+    """Positions of the set bits of ``mask``, lowest first unless ``descending``."""
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+    if descending:
+        data = data[::-1]
+        last = len(data) - 1
+        for match in _NONZERO_BYTE.finditer(data):
+            base = (last - match.start()) * 8
+            for bit in _BYTE_BITS_DESC[data[match.start()]]:
+                yield base + bit
+    else:
+        for match in _NONZERO_BYTE.finditer(data):
+            base = match.start() * 8
+            for bit in _BYTE_BITS[data[match.start()]]:
+                yield base + bit
+
+
+def _or_all(masks: Iterable[int]) -> int:
+    combined = 0
+    for mask in masks:
+        combined |= mask
+    return combined
+
+
+class ProductIndex:
+    """Secondary indexes over a ``Catalog`` for conjunctive product queries.
+
+    Within a field the requested values are alternatives (``Oily`` OR
+    ``Acne-prone``); across fields every condition must hold. Categorical
+    values match case-insensitively and benefits match by substring
+    (``"pore"`` finds ``"Pore care"``).
+
+    Types and skin types have few values and get a bitset each up front.
+    Brands and benefits can have thousands, so they keep sorted posting
+    lists and a bitset is built, and cached, for the values queries use.
+    """
+
+    def __init__(self, catalog: Catalog, cache_size: int = 1024):
+        self.catalog = catalog
+        self.cache_size = cache_size
+        products = [
+            (catalog.price_cents(product_id), product_id, brand_key)
+            for brand_key in catalog.brand_keys()
+            for product_id in catalog.product_ids(brand_key)
+        ]
+        products.sort(key=lambda product: product[0])
+        size = len(products)
+        # Bit position -> price in cents (ascending) and catalog product id
+        self._prices = array("Q", (price for price, _, _ in products))
+        self._product_ids = array("I", (product_id for _, product_id, _ in products))
+        self._all = (1 << size) - 1
+        self._name_order: Optional[array] = None
+        self._name_ranks: Optional[array] = None
+
+        # Posting lists keyed by interned string id first; normalized afterwards
+        by_id: Dict[str, Dict[int, array]] = {"type": {}, "skin_types": {}, "key_benefits": {}}
+        brands: Dict[str, array] = {}
+        for position, (_, product_id, brand_key) in enumerate(products):
+            positions = brands.get(brand_key)
+            if positions is None:
+                positions = brands[brand_key] = array("I")
+            positions.append(position)
+            for field, index in by_id.items():
+                for string_id in catalog.string_ids(product_id, field):
+                    positions = index.get(string_id)
+                    if positions is None:
+                        positions = index[string_id] = array("I")
+                    positions.append(position)
+
+        self._postings: Dict[str, Dict[str, array]] = {
+            "type": self._normalized(by_id["type"]),
+            "skin_type": self._normalized(by_id["skin_types"]),
+            "benefit": self._normalized(by_id["key_benefits"]),
+            "brand": self._normalized_keys(brands),
+        }
+        self._types = {key: bitset(positions, size) for key, positions in self._postings["type"].items()}
+        self._skin_types = {key: bitset(positions, size) for key, positions in self._postings["skin_type"].items()}
+        self._cached: Dict[tuple, int] = {}
+
+    def _normalized(self, postings: Dict[int, array]) -> Dict[str, array]:
+        return self._normalized_keys({self.catalog.strings[string_id]: positions for string_id, positions in postings.items()})
+
+    @staticmethod
+    def _normalized_keys(postings: Dict[str, array]) -> Dict[str, array]:
+        """Merge posting lists whose values only differ in case or spacing."""
+        merged: Dict[str, array] = {}
+        for value, positions in postings.items():
+            key = normalize_name(value)
+            if key in merged:
+                merged[key] = array("I", sorted(merged[key] + positions))
+            else:
+                merged[key] = positions
+        return merged
+
+    def __len__(self) -> int:
+        return len(self._product_ids)
+
+    def product_id(self, position: int) -> int:
+        """Catalog product id at a bit position."""
+        return self._product_ids[position]
+
+    def price_cents(self, position: int) -> int:
+        """Price in cents at a bit position; positions are in ascending price order."""
+        return self._prices[position]
+
+    def value_mask(self, field: str, value: str) -> int:
+        """Bitset of one ``type``, ``skin_type`` or ``brand`` value, or of a ``benefit`` substring."""
+        key = normalize_name(value)
+        if field == "type":
+            return self._types.get(key, 0)
+        if field == "skin_type":
+            return self._skin_types.get(key, 0)
+        return self._cached_mask(field, key)
+
+    def values(self, field: str) -> List[str]:
+        """Normalized values indexed for ``type``, ``skin_type``, ``benefit`` or ``brand``."""
+        return sorted(self._postings[field])
+
+    def _cached_mask(self, field: str, term: str) -> int:
+        mask = self._cached.get((field, term))
+        if mask is None:
+            postings = self._postings[field]
+            if field == "benefit":
+                # The benefit vocabulary is far smaller than the catalog, so scan it once per term
+                matches = [positions for benefit, positions in postings.items() if term in benefit]
+            else:
+                matches = [postings[term]] if term in postings else []
+            mask = bitset((position for positions in matches for position in positions), len(self))
+            if len(self._cached) >= self.cache_size:
+                self._cached.clear()
+            self._cached[(field, term)] = mask
+        return mask
+
+    def price_mask(self, min_price: Optional[float] = None, max_price: Optional[float] = None) -> int:
+        """Bits of the products priced within ``[min_price, max_price]`` USD."""
+        low = 0 if min_price is None else bisect_left(self._prices, round(min_price * 100))
+        high = len(self._prices) if max_price is None else bisect_right(self._prices, round(max_price * 100))
+        if high <= low:
+            return 0
+        return ((1 << high) - 1) ^ ((1 << low) - 1)
+
+    def match(
+        self,
+        types: Iterable[str] = (),
+        skin_types: Iterable[str] = (),
+        benefits: Iterable[str] = (),
+        brands: Iterable[str] = (),
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+    ) -> int:
+        """Bitset of the products meeting every given condition."""
+        mask = self._all
+        if min_price is not None or max_price is not None:
+            mask &= self.price_mask(min_price, max_price)
+        skin_keys = {normalize_name(value) for value in skin_types} - {""}
+        if skin_keys:
+            skin_keys.add(ALL_SKIN_TYPES)
+        conditions = [
+            (lambda key: self._types.get(key, 0), types),
+            (lambda key: self._skin_types.get(key, 0), skin_keys),
+            (lambda key: self._cached_mask("brand", key), brands),
+            (lambda key: self._cached_mask("benefit", key), benefits),
+        ]
+        for lookup, values in conditions:
+            keys = {normalize_name(value) for value in values} - {""}
+            if keys and mask:
+                mask &= _or_all(map(lookup, keys))
+        return mask
+
+    def select(self, mask: int, sort: str = "price", limit: int = 10, offset: int = 0) -> List[int]:
+        """Catalog product ids for one page of a match bitset in the given order."""
+        if sort not in SORT_ORDERS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_ORDERS)}")
+        if limit <= 0 or offset >= mask.bit_count():
+            return []
+        if sort == "name":
+            positions = self._by_name(mask, offset + limit)[offset:]
+        elif sort == "price":
+            if offset:
+                mask &= ~((1 << self._nth_bit(mask, offset)) - 1)
+            positions = list(islice(set_bits(mask), limit))
+        else:
+            if offset:
+                mask &= (1 << (self._nth_bit(mask, mask.bit_count() - offset - 1) + 1)) - 1
+            positions = list(islice(set_bits(mask, descending=True), limit))
+        return [self._product_ids[position] for position in positions]
+
+    def filter(
+        self,
+        types: Iterable[str] = (),
+        skin_types: Iterable[str] = (),
+        benefits: Iterable[str] = (),
+        brands: Iterable[str] = (),
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: str = "price",
+        limit: int = 10,
+        offset: int = 0,
+    ) -> FilterResult:
+        """Match and paginate in one call."""
+        mask = self.match(types, skin_types, benefits, brands, min_price, max_price)
+        return FilterResult(mask.bit_count(), self.select(mask, sort, limit, offset))
+
+    def _by_name(self, mask: int, count: int) -> List[int]:
+        """The first ``count`` positions of ``mask`` in name order.
+
+        Names have no bit order. Usually the catalog is walked in name
+        order until ``count`` hits turn up, about ``count * len / matches``
+        steps; when that would take longer than sorting every match by
+        name rank, the matches are sorted instead.
+        """
+        if self._name_order is None:
+            names = [self.catalog.field(product_id, "name").casefold() for product_id in self._product_ids]
+            order = array("I", sorted(range(len(names)), key=names.__getitem__))
+            ranks = array("I", bytes(4 * len(order)))
+            for rank, position in enumerate(order):
+                ranks[position] = rank
+            self._name_order, self._name_ranks = order, ranks
+        total = mask.bit_count()
+        if count * len(self) > 8 * total * total:
+            return sorted(set_bits(mask), key=self._name_ranks.__getitem__)[:count]
+        data = mask.to_bytes((len(self) + 7) // 8, "little")
+        positions: List[int] = []
+        for position in self._name_order:
+            if data[position >> 3] >> (position & 7) & 1:
+                positions.append(position)
+                if len(positions) == count:
+                    break
+        return positions
+
+    @staticmethod
+    def _nth_bit(mask: int, n: int) -> int:
+        """Position of the ``n``-th (0-based) set bit, counting from the lowest."""
+        low, high = 0, mask.bit_length()
+        # Smallest position p with more than n set bits in mask[0..p]
+        while low < high:
+            middle = (low + high) // 2
+            if (mask & ((1 << (middle + 1)) - 1)).bit_count() > n:
+                high = middle
+            else:
+                low = middle + 1
+        return low
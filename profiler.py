@@ -0,0 +1,344 @@
+"""
+Slow tool call profiler.
+
+A tool call that runs past ``threshold`` seconds gets a profile written to
+a rotating directory of JSON files: a per-function breakdown of wall and
+CPU time plus the call's arguments with image data redacted, so an outlier
+seen in production can be diagnosed without reproducing it by hand.
+
+Profiles come from a sampling thread rather than a tracing hook, and a
+call is only sampled once it has crossed the threshold: a call that
+finishes in time costs registering with the sampler and leaving again. The
+sampler thread does the arming itself, so a call that blocks the event loop
+(a long CPU-bound render) is caught too. The price is that such a profile
+covers the call from the threshold onwards, which is where an outlier
+spends its extra time. ``sample_rate`` additionally profiles that share of
+calls from their first moment, for complete profiles of the calls that
+turn out slow.
+
+Each sample looks at the event loop thread. When the profiled call's task
+is the one running, the sample is its Python stack and the loop thread's
+CPU time since the previous sample is charged to it; otherwise the sample
+is the chain of coroutines the task is suspended in, ending at what it
+awaits (an upstream search, a photo worker, a gather of sub-calls), and
+counts as wall time only.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter as Tally
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+from config import env_float, env_int, env_str
+
+logger = logging.getLogger(__name__)
+
+# Argument keys whose values never reach a profile file
+REDACTED_KEYS = frozenset({"image_data"})
+# Functions and collapsed stacks kept per profile, largest first
+TOP_FUNCTIONS = 40
+TOP_STACKS = 60
+
+Frame = Tuple[str, str, int]  # function, file, first line
+
+
+def default_profile_dir() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "k-beauty-mcp", "profiles")
+
+
+def redact(value: Any) -> Any:
+    """Copy of tool arguments with image payloads replaced by their size."""
+    if isinstance(value, dict):
+        return {
+            key: f"<redacted {len(item)} chars>" if key in REDACTED_KEYS and isinstance(item, str) else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
+
+
+def _frame_key(frame) -> Frame:
+    code = frame.f_code
+    return code.co_name, code.co_filename, code.co_firstlineno
+
+
+def _thread_cpu_clock(thread_id: int) -> Optional[Callable[[], float]]:
+    """Reader of another thread's CPU time, where the platform offers one."""
+    try:
+        clock = time.pthread_getcpuclockid(thread_id)
+        time.clock_gettime(clock)
+    except (AttributeError, OSError):
+        return None
+    return lambda: time.clock_gettime(clock)
+
+
+class _Profile:
+    """A watched tool call and, once sampling starts, the samples collected for it."""
+
+    def __init__(self, tool: str, arguments: Dict[str, Any], task: "asyncio.Task", thread_id: int,
+                 started: float, arm_at: float):
+        # Only identity here: most calls finish before sampling ever begins
+        self.tool = tool
+        self.arguments = arguments
+        self.task = task
+        self.thread_id = thread_id
+        self.started = started
+        self.arm_at = arm_at
+        self.sampling_since: Optional[float] = None
+
+    def begin(self) -> None:
+        """Start sampling; called on the sampler thread."""
+        self.cpu_clock = _thread_cpu_clock(self.thread_id)
+        self.last_cpu = self.cpu_clock() if self.cpu_clock is not None else 0.0
+        self.samples = 0
+        self.running_samples = 0
+        self.loop_cpu = 0.0    # loop thread CPU over the profiled window, any task
+        self.task_cpu = 0.0    # the part of it spent while this call's task ran
+        self.self_wall: Dict[Frame, float] = {}
+        self.total_wall: Dict[Frame, float] = {}
+        self.total_cpu: Dict[Frame, float] = {}
+        self.stacks: Tally = Tally()
+        self.sampling_since = self.last_sample = time.perf_counter()
+
+    def _running_stack(self, frames: Dict[int, Any]) -> Optional[List[Frame]]:
+        """The task's stack if it is running on the loop thread right now, outermost first."""
+        coro = self.task.get_coro()
+        root = getattr(coro, "cr_frame", None)
+        frame = frames.get(self.thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(frame)
+            if frame is root:
+                return [_frame_key(item) for item in reversed(stack)]
+            frame = frame.f_back
+        return None
+
+    def _awaiting_stack(self) -> List[Frame]:
+        """The coroutines the suspended task is parked in, ending at what it awaits."""
+        stack: List[Frame] = []
+        awaitable: Any = self.task.get_coro()
+        while awaitable is not None:
+            frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+            if frame is None:
+                if not hasattr(awaitable, "cr_await") and not hasattr(awaitable, "gi_yieldfrom"):
+                    stack.append((f"<await {type(awaitable).__name__}>", "", 0))
+                break
+            stack.append(_frame_key(frame))
+            awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+        return stack
+
+    def sample(self, frames: Dict[int, Any]) -> None:
+        now = time.perf_counter()
+        wall, self.last_sample = now - self.last_sample, now
+        cpu = 0.0
+        if self.cpu_clock is not None:
+            current = self.cpu_clock()
+            cpu, self.last_cpu = current - self.last_cpu, current
+            self.loop_cpu += cpu
+        stack = self._running_stack(frames)
+        if stack is not None:
+            self.running_samples += 1
+            self.task_cpu += cpu
+        else:
+            stack, cpu = self._awaiting_stack(), 0.0
+        if not stack:
+            return
+        self.samples += 1
+        self.self_wall[stack[-1]] = self.self_wall.get(stack[-1], 0.0) + wall
+        for key in set(stack):
+            self.total_wall[key] = self.total_wall.get(key, 0.0) + wall
+            if cpu:
+                self.total_cpu[key] = self.total_cpu.get(key, 0.0) + cpu
+        self.stacks[";".join(name for name, _, _ in stack)] += 1
+
+    def report(self, elapsed: float, threshold: float, interval: float) -> Dict[str, Any]:
+        def ms(seconds: float) -> float:
+            return round(seconds * 1000, 2)
+
+        functions = sorted(self.total_wall, key=self.total_wall.get, reverse=True)[:TOP_FUNCTIONS]
+        return {
+            "tool": self.tool,
+            "arguments": redact(self.arguments),
+            "started_at": time.time() - elapsed,
+            "elapsed_ms": ms(elapsed),
+            "threshold_ms": ms(threshold),
+            "profiled_from_ms": ms((self.sampling_since or self.started) - self.started),
+            "interval_ms": ms(interval),
+            "samples": self.samples,
+            "running_samples": self.running_samples,
+            "loop_cpu_ms": ms(self.loop_cpu) if self.cpu_clock else None,
+            "task_cpu_ms": ms(self.task_cpu) if self.cpu_clock else None,
+            "functions": [
+                {
+                    "function": name,
+                    "file": path,
+                    "line": line,
+                    "wall_ms": ms(self.total_wall[(name, path, line)]),
+                    "self_wall_ms": ms(self.self_wall.get((name, path, line), 0.0)),
+                    "cpu_ms": ms(self.total_cpu.get((name, path, line), 0.0)) if self.cpu_clock else None,
+                }
+                for name, path, line in functions
+            ],
+            # Semicolon-separated stacks with sample counts, the input format of flame graph tools
+            "stacks": dict(self.stacks.most_common(TOP_STACKS)),
+        }
+
+
+class SlowCallProfiler:
+    """Profiles tool calls that take longer than ``threshold`` seconds."""
+
+    def __init__(
+        self,
+        threshold: float = 5.0,
+        interval: float = 0.005,
+        sample_rate: float = 0.0,
+        directory: Optional[str] = None,
+        keep: int = 50,
+    ):
+        self.threshold = threshold
+        self.interval = interval
+        self.sample_rate = sample_rate
+        self.directory = directory or default_profile_dir()
+        self.keep = keep
+        self._sequence = itertools.count()
+        self._calls: List[_Profile] = []
+        self._wake = threading.Condition()  # guards the call list; held only briefly
+        self._sampling = threading.Lock()   # held by the sampler thread while it walks stacks
+        self._next_wake = math.inf  # when the sampler thread next looks at the calls
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    @classmethod
+    def from_env(cls) -> "SlowCallProfiler":
+        """Build a profiler from ``KBEAUTY_PROFILE_*`` environment variables.
+
+        ``KBEAUTY_PROFILE_THRESHOLD=0`` turns profiling off.
+        """
+        return cls(
+            threshold=env_float("KBEAUTY_PROFILE_THRESHOLD", 5.0),
+            interval=env_float("KBEAUTY_PROFILE_INTERVAL_MS", 5.0) / 1000,
+            sample_rate=env_float("KBEAUTY_PROFILE_SAMPLE_RATE", 0.0),
+            directory=env_str("KBEAUTY_PROFILE_DIR", "") or None,
+            keep=env_int("KBEAUTY_PROFILE_KEEP", 50),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def watch(self, tool: str, arguments: Dict[str, Any]) -> ContextManager[None]:
+        """Context manager around one tool call, run inside the call's task."""
+        if not self.enabled:
+            return nullcontext()
+        return self._watch(tool, arguments)
+
+    @contextmanager
+    def _watch(self, tool: str, arguments: Dict[str, Any]) -> Iterator[None]:
+        started = time.perf_counter()
+        full = self.sample_rate > 0 and random.random() < self.sample_rate
+        profile = _Profile(tool, arguments, asyncio.current_task(), threading.get_ident(),
+                           started, started if full else started + self.threshold)
+        self._register(profile)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._wake:
+                self._calls.remove(profile)
+            if profile.sampling_since is not None and elapsed >= self.threshold:
+                # Wait out a sample of this call that may still be in progress
+                with self._sampling:
+                    report = profile.report(elapsed, self.threshold, self.interval)
+                # File writes stay off the event loop
+                asyncio.get_running_loop().run_in_executor(None, self._save, report)
+
+    def _register(self, profile: _Profile) -> None:
+        with self._wake:
+            self._calls.append(profile)
+            if self._thread is None:
+                self._closed = False
+                self._thread = threading.Thread(target=self._run, name="slow-call-profiler", daemon=True)
+                self._thread.start()
+            # Calls share one threshold, so a newcomer only moves the sampler's
+            # next wake-up when the sampler is idle or the call is sampled at once
+            if profile.arm_at < self._next_wake:
+                self._wake.notify()
+
+    def _run(self) -> None:
+        """Sampler thread: arms calls that crossed the threshold and samples the armed ones."""
+        while True:
+            with self._wake:
+                if self._closed:
+                    self._next_wake = math.inf
+                    return
+                now = time.perf_counter()
+                armed = []
+                next_arm = math.inf
+                for profile in self._calls:
+                    if profile.sampling_since is None and profile.arm_at <= now:
+                        profile.begin()
+                    elif profile.sampling_since is None:
+                        next_arm = min(next_arm, profile.arm_at)
+                        continue
+                    armed.append(profile)
+                if not armed:
+                    self._next_wake = next_arm
+                    self._wake.wait(None if next_arm == math.inf else max(next_arm - now, 0.0))
+                    continue
+                self._next_wake = now + self.interval
+            # Stacks are walked without the call list lock, so starting and
+            # finishing calls on the event loop never wait for a sample
+            with self._sampling:
+                frames = sys._current_frames()
+                for profile in armed:
+                    try:
+                        profile.sample(frames)
+                    except Exception:
+                        # A frame torn down mid-walk: skip this sample
+                        logger.debug("Profiler sample failed", exc_info=True)
+                del frames
+            with self._wake:
+                if not self._closed:
+                    self._wake.wait(max(now + self.interval - time.perf_counter(), 0.0))
+
+    def _save(self, report: Dict[str, Any]) -> Optional[str]:
+        """Write one profile and trim the directory to the newest ``keep`` files."""
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(report["started_at"]))
+        name = f"{stamp}-{re.sub(r'[^A-Za-z0-9_]', '_', report['tool'])}-{report['elapsed_ms']:.0f}ms-{os.getpid()}-{next(self._sequence)}.json"
+        path = os.path.join(self.directory, name)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=1)
+            profiles = sorted(
+                (entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")),
+                key=lambda entry: entry.stat().st_mtime_ns,
+            )
+            for entry in profiles[:max(len(profiles) - self.keep, 0)]:
+                os.remove(entry.path)
+        except OSError as e:
+            logger.warning(f"Could not save slow call profile: {e}")
+            return None
+        logger.info(f"Saved profile of a {report['elapsed_ms']:.0f} ms {report['tool']} call to {path}")
+        return path
+
+    def close(self) -> None:
+        """Stop the sampling thread; it starts again with the next slow call."""
+        with self._wake:
+            self._closed = True
+            self._wake.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
@@ -0,0 +1,187 @@
+"""
+Deadline budgets and a circuit breaker for upstream dependencies.
+
+Each tool call runs inside a deadline scope; upstream calls read the time
+left with ``remaining_budget()`` so a hung connection can never outlive the
+call that started it. The circuit breaker watches upstream error and slow
+call rates and, while open, makes callers skip the network entirely.
+"""
+
+import asyncio
+import contextvars
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, Optional, TypeVar
+
+from config import env_float, env_int
+
+T = TypeVar("T")
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("kbeauty_deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The tool call's time budget ran out before the operation finished."""
+
+
+@contextmanager
+def deadline_scope(budget: Optional[float]) -> Iterator[None]:
+    """Run the enclosed block with at most ``budget`` seconds left.
+
+    Nested scopes can only shorten the deadline, never extend it.
+    """
+    if budget is None:
+        yield
+        return
+    deadline = time.monotonic() + budget
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left in the current deadline scope, or ``None`` when unbounded."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+async def within_budget(awaitable: Awaitable[T]) -> T:
+    """Await ``awaitable``, raising ``DeadlineExceeded`` if the budget runs out."""
+    remaining = remaining_budget()
+    if remaining is None:
+        return await awaitable
+    if remaining <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded("tool call budget exhausted")
+    try:
+        return await asyncio.wait_for(awaitable, remaining)
+    except asyncio.TimeoutError as e:
+        raise DeadlineExceeded("tool call budget exhausted") from e
+
+
+class CircuitOpenError(Exception):
+    """The breaker is open; the upstream call was not attempted."""
+
+
+class CircuitBreaker:
+    """Rolling-window circuit breaker over error and slow-call rates.
+
+    Closed: calls go through and their outcomes are recorded. When at least
+    ``min_calls`` of the last ``window`` calls are recorded and the share of
+    failed or slow calls reaches ``failure_rate``, the breaker opens. Open:
+    calls are rejected for ``open_seconds``. Half-open: up to
+    ``half_open_calls`` probes go through; a good probe closes the breaker,
+    a bad one opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 3.0,
+        window: int = 20,
+        min_calls: int = 5,
+        open_seconds: float = 30.0,
+        half_open_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._clock = clock
+        self._outcomes: Deque[bool] = deque(maxlen=window)  # True = failed or slow
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self.rejected = 0
+        self.trips = 0
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        """Build a breaker from ``KBEAUTY_BREAKER_*`` environment variables."""
+        return cls(
+            failure_rate=env_float("KBEAUTY_BREAKER_FAILURE_RATE", 0.5),
+            slow_call_seconds=env_float("KBEAUTY_BREAKER_SLOW_CALL", 3.0),
+            window=env_int("KBEAUTY_BREAKER_WINDOW", 20),
+            min_calls=env_int("KBEAUTY_BREAKER_MIN_CALLS", 5),
+            open_seconds=env_float("KBEAUTY_BREAKER_OPEN_SECONDS", 30.0),
+        )
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def _acquire(self) -> None:
+        state = self.state
+        if state == self.OPEN or (state == self.HALF_OPEN and self._probes >= self.half_open_calls):
+            self.rejected += 1
+            raise CircuitOpenError("upstream circuit is open")
+        if state == self.HALF_OPEN:
+            self._probes += 1
+
+    def _record(self, bad: bool) -> None:
+        if self._state == self.HALF_OPEN:
+            if bad:
+                self._trip()
+            else:
+                self._state = self.CLOSED
+                self._outcomes.clear()
+            return
+        self._outcomes.append(bad)
+        if len(self._outcomes) >= self.min_calls:
+            if sum(self._outcomes) / len(self._outcomes) >= self.failure_rate:
+                self._trip()
+
+    def _trip(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = self._clock()
+        self._outcomes.clear()
+        self.trips += 1
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run ``fn`` through the breaker, raising ``CircuitOpenError`` when open."""
+        self._acquire()
+        started = self._clock()
+        probing = self._state == self.HALF_OPEN
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            if self._clock() - started >= self.slow_call_seconds:
+                # Given up on after running past the slow threshold (a budget
+                # ran out): an upstream that always hangs must still trip
+                self._record(True)
+            elif probing and self._state == self.HALF_OPEN:
+                # The caller went away early; that says nothing about upstream health
+                self._probes -= 1
+            raise
+        except Exception:
+            self._record(True)
+            raise
+        self._record(self._clock() - started >= self.slow_call_seconds)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": sum(self._outcomes),
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,328 @@
+"""
+Constraint-based routine builder.
+
+Fills the typed steps of a routine (cleanser, toner, serum, ...) with one
+catalog product each, such that every product suits the skin type, the
+routine fits the budget and no two products used in the same part of the
+day have conflicting ingredients. Routines are ranked by how well their
+products fit the skin type plus how many of the user's concerns the
+routine covers as a whole.
+
+The search is a depth-first branch and bound over the product filter
+bitsets. Bitset algebra splits each step's candidates into groups that
+score the same and cover the same concerns; within a group bit order is
+price order, so a group is read cheapest first and only as far as the
+search reaches. From the groups' cheapest prices the builder derives, for
+every suffix of steps, the best score reachable at each cost given the
+concerns already covered and the actives already picked. That bound is
+exact except for conflicts among the remaining steps' own products, so a
+branch ends as soon as it cannot reach the top k within the remaining
+budget.
+"""
+
+import bisect
+import heapq
+import re
+from typing import Callable, Dict, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from ingredient_graph import IngredientGraph
+from product_filter import ProductIndex, set_bits
+
+# Score of a product made for the exact skin type, or for all skin types
+EXACT_SKIN_SCORE = 2
+ALL_SKIN_SCORE = 1
+# Score per product addressing a concern, and per concern the routine covers at all
+CONCERN_SCORE = 1
+COVERAGE_SCORE = 3
+
+ROUTINE_SLOTS = ("AM", "PM")
+_SLOT_NOTE = re.compile(r"\((AM|PM)\b", re.IGNORECASE)
+
+
+class RoutineStep(NamedTuple):
+    """One typed step of a routine and the part of the day it belongs to."""
+
+    number: int
+    type: str
+    description: str
+    slots: Tuple[str, ...]
+
+
+class RoutinePlan(NamedTuple):
+    """A complete routine: one product id per fillable step."""
+
+    score: int
+    price_cents: int
+    picks: Tuple[Tuple[RoutineStep, int], ...]
+    covered: Tuple[str, ...]
+
+
+class RoutineResult(NamedTuple):
+    plans: List[RoutinePlan]
+    unfilled: List[RoutineStep]  # steps the catalog has no suitable product for
+
+
+def routine_steps(routine: Mapping) -> List[RoutineStep]:
+    """Typed steps of a ``SKINCARE_ROUTINES`` entry; "(AM)"/"(PM)" notes limit a step to that slot."""
+    steps = []
+    for step in routine["steps"]:
+        note = _SLOT_NOTE.search(step["description"])
+        slots = (note.group(1).upper(),) if note else ROUTINE_SLOTS
+        steps.append(RoutineStep(step["step"], step["type"], step["description"], slots))
+    return steps
+
+
+class _Group:
+    """Candidates of one step that score the same and cover the same concerns.
+
+    Products are read cheapest first, materialized only as far as the search
+    gets, and kept for the next branch that reads the group.
+    """
+
+    def __init__(
+        self, index: ProductIndex, ingredients: Callable[[int], Tuple[int, int]], score: int, covers: int, mask: int
+    ):
+        self.score = score
+        self.covers = covers  # bitset of concern indexes the products address
+        self.size = mask.bit_count()
+        self._index = index
+        self._ingredients = ingredients
+        self._positions = set_bits(mask)
+        self._items: List[Tuple[int, int, int, int]] = []  # (product id, price in cents, ingredients, conflicts)
+        self._cheapest: Dict[int, Optional[int]] = {}
+
+    def read(self, start: int = 0) -> Iterator[Tuple[int, int, int, int, int]]:
+        """(item number, product id, price in cents, ingredient bits, conflict bits) from item ``start`` on."""
+        i = start
+        while True:
+            while i >= len(self._items):
+                position = next(self._positions, None)
+                if position is None:
+                    return
+                product_id = self._index.product_id(position)
+                self._items.append((product_id, self._index.price_cents(position), *self._ingredients(product_id)))
+            yield (i, *self._items[i])
+            i += 1
+
+    def cheapest(self, forbidden: int = 0) -> Optional[int]:
+        """Price of the cheapest product holding none of the ``forbidden`` ingredient bits."""
+        if forbidden not in self._cheapest:
+            self._cheapest[forbidden] = next(
+                (price for _, _, price, bits, _ in self.read() if not bits & forbidden), None
+            )
+        return self._cheapest[forbidden]
+
+
+class _Frontier(NamedTuple):
+    """Best score reachable at each cost: costs ascending, scores strictly increasing."""
+
+    costs: List[int]
+    scores: List[int]
+
+    def best(self, budget: Optional[int]) -> Optional[Tuple[int, int]]:
+        """(score, least cost of that score) of the best option within ``budget``."""
+        i = len(self.costs) if budget is None else bisect.bisect_right(self.costs, budget)
+        return (self.scores[i - 1], self.costs[i - 1]) if i else None
+
+
+class RoutineBuilder:
+    """Top-k routine search over a product index, honoring ingredient conflicts.
+
+    A product's ingredients are recognized from its name and benefits, since
+    the catalog carries no full ingredient lists.
+    """
+
+    def __init__(self, index: ProductIndex, graph: IngredientGraph):
+        self.index = index
+        self.graph = graph
+        self._actives: Dict[int, Tuple[int, int]] = {}
+        self.nodes = 0  # search nodes visited by the last build, for tuning
+
+    def _ingredients(self, product_id: int) -> Tuple[int, int]:
+        """(ingredient bits, conflicting ingredient bits) of a product, computed on first use."""
+        found = self._actives.get(product_id)
+        if found is None:
+            product = self.index.catalog.product(product_id)
+            keys = self.graph.resolve(" ".join([product["name"], *product["key_benefits"]]))
+            found = self._actives[product_id] = (self.graph.bits(keys), self.graph.conflict_bits(keys))
+        return found
+
+    def _groups(
+        self, step_type: str, skin_type: str, concern_masks: Sequence[int], max_price: Optional[float]
+    ) -> List[_Group]:
+        """The step's non-empty candidate groups, best score first."""
+        index = self.index
+        mask = index.value_mask("type", step_type)
+        if max_price is not None:
+            mask &= index.price_mask(max_price=max_price)
+        all_skin = index.value_mask("skin_type", "all")
+        if skin_type and skin_type != "normal":
+            exact = index.value_mask("skin_type", skin_type)
+            skin_levels = [(EXACT_SKIN_SCORE, mask & exact), (ALL_SKIN_SCORE, mask & all_skin & ~exact)]
+        else:
+            skin_levels = [(ALL_SKIN_SCORE, mask & all_skin), (0, mask & ~all_skin)]
+
+        groups = []
+        for skin_score, skin_mask in skin_levels:
+            # Split the products by exactly which concerns they cover; only
+            # non-empty parts survive, so this never enumerates every subset
+            parts = [(0, skin_mask)] if skin_mask else []
+            for i, concern_mask in enumerate(concern_masks):
+                if not concern_mask & skin_mask:
+                    continue
+                split = []
+                for covers, part in parts:
+                    split += [(covers | 1 << i, part & concern_mask), (covers, part & ~concern_mask)]
+                parts = [(covers, part) for covers, part in split if part]
+            groups += [
+                _Group(index, self._ingredients, skin_score + CONCERN_SCORE * covers.bit_count(), covers, part)
+                for covers, part in parts
+            ]
+        groups.sort(key=lambda group: (-group.score, group.cheapest()))
+        return groups
+
+    def build(
+        self,
+        steps: Sequence[RoutineStep],
+        skin_type: str = "",
+        concerns: Sequence[Tuple[str, Sequence[str]]] = (),
+        budget: Optional[float] = None,
+        top_k: int = 3,
+    ) -> RoutineResult:
+        """The ``top_k`` best routines filling every step the catalog can fill.
+
+        ``concerns`` pairs each concern with the benefit keywords that address
+        it; ``budget`` caps the total price in USD. Ties on score go to the
+        cheaper routine.
+        """
+        skin_type = skin_type.strip().lower()
+        concern_masks = [self._any_benefit(terms) for _, terms in concerns]
+        budget_cents = None if budget is None else round(budget * 100)
+
+        groups = {step: self._groups(step.type, skin_type, concern_masks, budget) for step in steps}
+        # Twin steps (same type and slots, see below) take distinct products,
+        # so twins beyond the number of candidates are left unfilled too
+        twins: Dict[Tuple[str, Tuple[str, ...]], int] = {}
+        for step in steps:
+            seen = twins[step.type, step.slots] = twins.get((step.type, step.slots), 0) + 1
+            if seen > sum(group.size for group in groups[step]):
+                groups[step] = []
+        unfilled = [step for step in steps if not groups[step]]
+        # Fewest candidates first keeps the top of the tree narrow
+        order = sorted(
+            (step for step in steps if groups[step]), key=lambda step: sum(group.size for group in groups[step])
+        )
+        if not order:
+            return RoutineResult([], unfilled)
+        step_groups = [groups[step] for step in order]
+        count = len(order)
+
+        slot_numbers = [[ROUTINE_SLOTS.index(slot) for slot in step.slots] for step in order]
+        frontiers: Dict[Tuple[int, int, Tuple[int, ...]], _Frontier] = {}
+
+        def frontier(depth: int, covered: int, forbidden: Tuple[int, ...]) -> _Frontier:
+            """What steps ``depth`` on can add to the score at each cost, coverage included.
+
+            Products conflicting with the picks so far are left out, conflicts
+            among the remaining steps' products are not: that keeps the bound
+            optimistic, as it must be.
+            """
+            key = (depth, covered, forbidden)
+            found = frontiers.get(key)
+            if found is None:
+                if depth == count:
+                    found = _Frontier([0], [COVERAGE_SCORE * covered.bit_count()])
+                else:
+                    options = []
+                    step_forbidden = 0
+                    for slot in slot_numbers[depth]:
+                        step_forbidden |= forbidden[slot]
+                    for group in step_groups[depth]:
+                        cheapest = group.cheapest(step_forbidden)
+                        if cheapest is None:
+                            continue
+                        rest = frontier(depth + 1, covered | group.covers, forbidden)
+                        options += [(cheapest + cost, group.score + score) for cost, score in zip(rest.costs, rest.scores)]
+                    options.sort(key=lambda option: (option[0], -option[1]))
+                    found = _Frontier([], [])
+                    for cost, score in options:
+                        if not found.scores or score > found.scores[-1]:
+                            found.costs.append(cost)
+                            found.scores.append(score)
+                frontiers[key] = found
+            return found
+
+        no_picks = (0,) * len(ROUTINE_SLOTS)
+        if budget_cents is not None and frontier(0, 0, no_picks).costs[0] > budget_cents:
+            return RoutineResult([], unfilled)
+        # Two steps of the same type and slots are interchangeable; the later
+        # one only reads candidates after the earlier one's pick, so each pair
+        # of products is tried once
+        twin_of = [
+            max((j for j in range(i) if (order[j].type, order[j].slots) == (step.type, step.slots)), default=None)
+            for i, step in enumerate(order)
+        ]
+
+        top: List[Tuple[int, int, int, Tuple[int, ...], int]] = []  # min-heap of (score, -price, seq, picks, covered)
+        picks: List[int] = []
+        places: List[Tuple[int, int]] = []  # (group number, item number) of each pick
+        self.nodes = 0
+
+        def search(depth: int, score: int, cost: int, covered: int, forbidden: Tuple[int, ...]) -> None:
+            self.nodes += 1
+            if depth == count:
+                entry = (score + COVERAGE_SCORE * covered.bit_count(), -cost, self.nodes, tuple(picks), covered)
+                if len(top) < top_k:
+                    heapq.heappush(top, entry)
+                elif entry[:2] > top[0][:2]:
+                    heapq.heapreplace(top, entry)
+                return
+            slots = slot_numbers[depth]
+            first_group, first_item = (0, 0) if twin_of[depth] is None else places[twin_of[depth]]
+            if twin_of[depth] is not None:
+                first_item += 1
+            for group_number in range(first_group, len(step_groups[depth])):
+                group = step_groups[depth][group_number]
+                rest = frontier(depth + 1, covered | group.covers, forbidden)
+                if not rest.costs:
+                    continue
+                start = first_item if group_number == first_group else 0
+                for item, product_id, price, bits, conflicts in group.read(start):
+                    spent = cost + price
+                    best = rest.best(None if budget_cents is None else budget_cents - spent)
+                    # A group comes cheapest first, so once one product is
+                    # over budget or out of the top k, so is the rest of it
+                    if best is None:
+                        break
+                    if len(top) == top_k and (score + group.score + best[0], -(spent + best[1])) <= top[0][:2]:
+                        break
+                    if any(bits & forbidden[slot] for slot in slots):
+                        continue
+                    placed = tuple(
+                        slot_forbidden | conflicts if slot in slots else slot_forbidden
+                        for slot, slot_forbidden in enumerate(forbidden)
+                    )
+                    picks.append(product_id)
+                    places.append((group_number, item))
+                    search(depth + 1, score + group.score, spent, covered | group.covers, placed)
+                    picks.pop()
+                    places.pop()
+
+        search(0, 0, 0, 0, no_picks)
+
+        plans = []
+        for score, negative_cost, _, chosen, covered in sorted(top, reverse=True):
+            by_step = dict(zip(order, chosen))
+            plans.append(RoutinePlan(
+                score,
+                -negative_cost,
+                tuple((step, by_step[step]) for step in steps if step in by_step),
+                tuple(name for i, (name, _) in enumerate(concerns) if covered >> i & 1),
+            ))
+        return RoutineResult(plans, unfilled)
+
+    def _any_benefit(self, terms: Sequence[str]) -> int:
+        mask = 0
+        for term in terms:
+            mask |= self.index.value_mask("benefit", term)
+        return mask
@@ -0,0 +1,516 @@
+"""
+Response cache for upstream web searches.
+
+Search results are cached per (normalized query, search type). Entries stay
+fresh for a TTL; once past it they are still served immediately while a
+background task refreshes them (stale-while-revalidate), until they exceed
+the maximum staleness and are treated as misses.
+
+Backends share the ``CacheBackend`` interface: an LRU ``MemoryCache``, an
+``SqliteCache`` file that survives restarts, and ``TieredCache`` to stack
+the two. ``SearchCache`` goes through the async ``aget``/``aset`` variants,
+which an SQLite store runs on its own thread so a locked or slow file
+never stalls the event loop.
+
+Several server processes (``--workers``) pointed at the same SQLite file
+share one cache: a result fetched by any worker is a hit for all of them,
+and a short fetch lease stored next to the entries makes the others wait
+for that result instead of sending the same query upstream in parallel.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Set, Tuple
+
+from config import env_float, env_int, env_str
+
+logger = logging.getLogger(__name__)
+
+# Seconds between looks at the shared store while another process fetches a key
+LEASE_POLL_INTERVAL = 0.05
+
+
+class CacheEntry(NamedTuple):
+    """A cached value with its freshness metadata (unix timestamps)."""
+
+    value: Any
+    stored_at: float
+    fresh_until: float
+    expires_at: float
+
+    def is_fresh(self, now: float) -> bool:
+        return now < self.fresh_until
+
+    def is_expired(self, now: float) -> bool:
+        return now >= self.expires_at
+
+
+def make_cache_key(query: str, search_type: str) -> str:
+    """Normalize a query so trivially different spellings share an entry."""
+    normalized = " ".join(query.casefold().split())
+    return f"{search_type}:{normalized}"
+
+
+class CacheBackend(ABC):
+    """Storage interface shared by every cache layer."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[CacheEntry]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, entry: CacheEntry) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    async def aget(self, key: str) -> Optional[CacheEntry]:
+        """``get`` for callers on the event loop; stores doing file I/O run it off the loop."""
+        return self.get(key)
+
+    async def aset(self, key: str, entry: CacheEntry) -> None:
+        """``set`` for callers on the event loop."""
+        self.set(key, entry)
+
+    def claim(self, key: str, seconds: float) -> bool:
+        """Take the fetch lease for ``key`` unless another process holds an unexpired one.
+
+        Only stores shared between processes need leases; within one process
+        concurrent fetches are already coalesced, so the default always grants.
+        """
+        return True
+
+    def release(self, key: str) -> None:
+        """Give up a lease taken with ``claim``."""
+
+    async def aclaim(self, key: str, seconds: float) -> bool:
+        """``claim`` for callers on the event loop."""
+        return self.claim(key, seconds)
+
+    async def arelease(self, key: str) -> None:
+        """``release`` for callers on the event loop."""
+        self.release(key)
+
+    def close(self) -> None:
+        """Release any resources held by the backend."""
+
+
+class MemoryCache(CacheBackend):
+    """Size-bounded in-process store with LRU eviction."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteCache(CacheBackend):
+    """Persistent store in a single SQLite file (WAL mode).
+
+    Opening is cheap: nothing is loaded up front and each lookup is a single
+    primary-key read. Every ``compact_every`` writes, expired rows are
+    dropped and the least recently used rows beyond ``max_entries`` are
+    evicted. Storage errors are logged and treated as misses so a broken
+    cache file never breaks a search.
+
+    The async variants run on one dedicated thread, which also serializes
+    access to the connection.
+    """
+
+    def __init__(self, path: str, max_entries: int = 50000, compact_every: int = 500):
+        self.path = path
+        self.max_entries = max_entries
+        self.compact_every = compact_every
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def _off_loop(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-cache")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def aget(self, key: str) -> Optional[CacheEntry]:
+        return await self._off_loop(self.get, key)
+
+    async def aset(self, key: str, entry: CacheEntry) -> None:
+        await self._off_loop(self.set, key, entry)
+
+    async def aclaim(self, key: str, seconds: float) -> bool:
+        return await self._off_loop(self.claim, key, seconds)
+
+    async def arelease(self, key: str) -> None:
+        await self._off_loop(self.release, key)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS search_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    fresh_until REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS search_cache_accessed ON search_cache (accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS search_leases (key TEXT PRIMARY KEY, until REAL NOT NULL)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, stored_at, fresh_until, expires_at, accessed_at FROM search_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            # Refresh the LRU timestamp at most once a minute to keep reads cheap
+            if now - row[4] > 60:
+                conn.execute("UPDATE search_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return CacheEntry(json.loads(row[0]), row[1], row[2], row[3])
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Search cache read failed: {e}")
+            return None
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(entry.value, ensure_ascii=False), entry.stored_at,
+                 entry.fresh_until, entry.expires_at, time.time()),
+            )
+            self._writes += 1
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Search cache write failed: {e}")
+            return
+        if self._writes % self.compact_every == 0:
+            self.compact()
+
+    def compact(self) -> None:
+        """Drop expired rows and trim the store to ``max_entries``."""
+        try:
+            conn = self._connect()
+            conn.execute("DELETE FROM search_cache WHERE expires_at <= ?", (time.time(),))
+            conn.execute(
+                """DELETE FROM search_cache WHERE key IN (
+                    SELECT key FROM search_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Search cache compaction failed: {e}")
+
+    def delete(self, key: str) -> None:
+        try:
+            self._connect().execute("DELETE FROM search_cache WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning(f"Search cache delete failed: {e}")
+
+    def clear(self) -> None:
+        try:
+            self._connect().execute("DELETE FROM search_cache")
+        except sqlite3.Error as e:
+            logger.warning(f"Search cache clear failed: {e}")
+
+    def claim(self, key: str, seconds: float) -> bool:
+        now = time.time()
+        try:
+            # One atomic upsert: inserts a new lease or takes over an expired one
+            cursor = self._connect().execute(
+                """INSERT INTO search_leases VALUES (?, ?)
+                   ON CONFLICT (key) DO UPDATE SET until = excluded.until WHERE search_leases.until <= ?""",
+                (key, now + seconds, now),
+            )
+            return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            logger.warning(f"Search cache lease failed: {e}")
+            return True
+
+    def release(self, key: str) -> None:
+        try:
+            self._connect().execute("DELETE FROM search_leases WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning(f"Search cache lease release failed: {e}")
+
+    def __len__(self) -> int:
+        try:
+            return self._connect().execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Search cache count failed: {e}")
+            return 0
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class TieredCache(CacheBackend):
+    """Memory layer in front of a persistent layer; disk hits are promoted."""
+
+    def __init__(self, memory: CacheBackend, persistent: CacheBackend):
+        self.memory = memory
+        self.persistent = persistent
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self.memory.get(key)
+        if entry is None or not entry.is_fresh(time.time()):
+            # Another process sharing the file may have refreshed it already
+            stored = self.persistent.get(key)
+            if stored is not None and (entry is None or stored.fresh_until > entry.fresh_until):
+                self.memory.set(key, stored)
+                entry = stored
+        return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        self.memory.set(key, entry)
+        self.persistent.set(key, entry)
+
+    async def aget(self, key: str) -> Optional[CacheEntry]:
+        # The memory layer stays on the caller's thread; only a miss or stale hit reaches the disk
+        entry = await self.memory.aget(key)
+        if entry is None or not entry.is_fresh(time.time()):
+            stored = await self.persistent.aget(key)
+            if stored is not None and (entry is None or stored.fresh_until > entry.fresh_until):
+                await self.memory.aset(key, stored)
+                entry = stored
+        return entry
+
+    async def aset(self, key: str, entry: CacheEntry) -> None:
+        await self.memory.aset(key, entry)
+        await self.persistent.aset(key, entry)
+
+    def delete(self, key: str) -> None:
+        self.memory.delete(key)
+        self.persistent.delete(key)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        self.persistent.clear()
+
+    def __len__(self) -> int:
+        return len(self.persistent)
+
+    def claim(self, key: str, seconds: float) -> bool:
+        return self.persistent.claim(key, seconds)
+
+    def release(self, key: str) -> None:
+        self.persistent.release(key)
+
+    async def aclaim(self, key: str, seconds: float) -> bool:
+        return await self.persistent.aclaim(key, seconds)
+
+    async def arelease(self, key: str) -> None:
+        await self.persistent.arelease(key)
+
+    def close(self) -> None:
+        self.persistent.close()
+
+
+def default_cache_path() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "k-beauty-mcp", "search-cache.sqlite3")
+
+
+class SearchCache:
+    """TTL cache with stale-while-revalidate in front of an async loader."""
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        ttl: float = 3600.0,
+        max_stale: float = 86400.0,
+        lease_timeout: float = 5.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.lease_timeout = lease_timeout
+        self._clock = clock
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "SearchCache":
+        """Build a cache from ``KBEAUTY_CACHE_*`` environment variables.
+
+        Results persist in ``KBEAUTY_CACHE_PATH`` (an SQLite file under the
+        user cache directory by default) behind an in-memory LRU layer; set
+        it to an empty string to keep the cache in memory only.
+        """
+        backend: CacheBackend = MemoryCache(max_entries=env_int("KBEAUTY_CACHE_MAX_ENTRIES", 1024))
+        path = env_str("KBEAUTY_CACHE_PATH", default_cache_path())
+        if path:
+            backend = TieredCache(
+                backend,
+                SqliteCache(path, max_entries=env_int("KBEAUTY_CACHE_DISK_MAX_ENTRIES", 50000)),
+            )
+        return cls(
+            backend,
+            ttl=env_float("KBEAUTY_CACHE_TTL", 3600.0),
+            max_stale=env_float("KBEAUTY_CACHE_MAX_STALE", 86400.0),
+            lease_timeout=env_float("KBEAUTY_CACHE_LEASE_TIMEOUT", 5.0),
+        )
+
+    def _entry(self, value: Any) -> CacheEntry:
+        now = self._clock()
+        fresh_until = now + self.ttl
+        return CacheEntry(value, now, fresh_until, fresh_until + self.max_stale)
+
+    def put(self, key: str, value: Any) -> None:
+        self.backend.set(key, self._entry(value))
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for ``key``, calling ``fetch`` on a miss.
+
+        Exceptions from ``fetch`` propagate and nothing is cached, so
+        upstream failures are never pinned in the cache. When another
+        process sharing the store is already fetching ``key``, its result
+        is awaited for up to ``lease_timeout`` seconds before fetching here.
+        """
+        entry = await self.lookup(key, fetch)
+        if entry is not None:
+            return entry.value
+        return await self.load(key, fetch)
+
+    async def load(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """The miss path of ``get_or_fetch``: fetch and store ``key`` under the fetch lease.
+
+        The lease is per store, not per caller, so concurrent callers in one
+        process should share a single ``load`` (through a ``SingleFlight``);
+        otherwise all but one of them poll for the lease like a separate
+        process would.
+        """
+        leased = await self.backend.aclaim(key, self.lease_timeout)
+        if not leased:
+            entry, leased = await self._await_other_fetch(key, fetch)
+            if entry is not None:
+                return entry.value
+        self.misses += 1
+        try:
+            value = await fetch()
+            await self.backend.aset(key, self._entry(value))
+        finally:
+            # Past the wait deadline the lease may still be another process's
+            if leased:
+                await self.backend.arelease(key)
+        return value
+
+    async def lookup(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Optional[CacheEntry]:
+        """A usable entry for ``key`` (counted as a hit), or None.
+
+        A stale entry is returned and refreshed in the background with ``fetch``.
+        """
+        entry = await self.backend.aget(key)
+        now = self._clock()
+        if entry is None or entry.is_expired(now):
+            return None
+        if entry.is_fresh(now):
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+            self._schedule_refresh(key, fetch)
+        return entry
+
+    async def _await_other_fetch(
+        self, key: str, fetch: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Optional[CacheEntry], bool]:
+        """Poll the shared store while another process holds the fetch lease for ``key``.
+
+        Returns the entry once it appears, or None and whether the lease was
+        taken over here.
+        """
+        deadline = time.monotonic() + self.lease_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LEASE_POLL_INTERVAL)
+            entry = await self.lookup(key, fetch)
+            if entry is not None:
+                return entry, False
+            # The holder failed or gave up: fetch here rather than wait out the lease
+            if await self.backend.aclaim(key, self.lease_timeout):
+                return None, True
+        return None, False
+
+    def _schedule_refresh(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> None:
+        if key in self._refreshing:
+            return
+        task = asyncio.ensure_future(self._refresh(key, fetch))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+
+    async def _refresh(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> None:
+        # Another process sharing the store is refreshing it already
+        if not await self.backend.aclaim(key, self.lease_timeout):
+            return
+        try:
+            await self.backend.aset(key, self._entry(await fetch()))
+        except Exception as e:
+            # Keep serving the stale value; the next read will retry
+            logger.warning(f"Background refresh failed for {key!r}: {e}")
+        finally:
+            await self.backend.arelease(key)
+
+    async def close(self) -> None:
+        """Cancel outstanding background refreshes and close the backend."""
+        tasks: Set[asyncio.Task] = set(self._refreshing.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._refreshing.clear()
+        self.backend.close()
@@ -0,0 +1,149 @@
+"""
+Skin photo decoding and analysis.
+
+Everything here is CPU-bound and runs inside photo pipeline worker
+processes, so this module must stay importable without the MCP server
+(no imports from ``kbeauty_mcp``).
+"""
+
+import base64
+import binascii
+import io
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Long edge, in pixels, of the image the analysis runs on
+ANALYSIS_SIZE = 512
+# Long edge of the thumbnail perceptual hashes are computed from; small
+# enough that JPEGs are decoded at 1/8 scale
+FINGERPRINT_SIZE = 64
+# Rows of the difference hash (HASH_SIZE * HASH_SIZE bits)
+HASH_SIZE = 8
+
+
+class ImageRejected(ValueError):
+    """The submitted photo cannot be analyzed; the message is shown to the user."""
+
+
+def strip_data_url(image_data: str) -> str:
+    """Drop a ``data:image/...;base64,`` prefix if the client sent one."""
+    head = image_data[:100]
+    if head.startswith("data:") and "," in head:
+        return image_data[head.index(",") + 1:]
+    return image_data
+
+
+def decode_image(image_data: str, max_pixels: int, size: int = ANALYSIS_SIZE):
+    """Decode base64 image data into an RGB image no larger than ``size`` pixels.
+
+    The pixel limit is checked from the header before any pixel data is
+    decoded, and JPEGs are decoded directly at a reduced scale.
+    """
+    try:
+        from PIL import Image
+    except ImportError as e:
+        raise ImageRejected("Photo analysis requires the Pillow package (pip install Pillow).") from e
+
+    try:
+        raw = base64.b64decode(strip_data_url(image_data), validate=False)
+    except (binascii.Error, ValueError) as e:
+        raise ImageRejected("The image data is not valid base64.") from e
+
+    try:
+        image = Image.open(io.BytesIO(raw))
+        width, height = image.size
+        if width * height > max_pixels:
+            raise ImageRejected(
+                f"The image is {width}x{height}; please upload a photo under {max_pixels // 1_000_000} megapixels."
+            )
+        image.draft("RGB", (size, size))
+        image = image.convert("RGB")
+        image.thumbnail((size, size))
+    except ImageRejected:
+        raise
+    except Exception as e:
+        raise ImageRejected("The image could not be decoded; please upload a JPEG or PNG photo.") from e
+    return image, (width, height)
+
+
+def perceptual_hash(image) -> int:
+    """64-bit difference hash: whether each pixel of a 9x8 grayscale copy is
+    brighter than its left neighbour.
+
+    Recompression, rescaling and small crops flip only a few bits, so near
+    duplicates are a small Hamming distance apart.
+    """
+    from PIL import Image
+
+    width = HASH_SIZE + 1
+    pixels = image.convert("L").resize((width, HASH_SIZE), Image.Resampling.BILINEAR).tobytes()
+    fingerprint = 0
+    for row in range(0, len(pixels), width):
+        for left, right in zip(pixels[row:row + width - 1], pixels[row + 1:row + width]):
+            fingerprint = (fingerprint << 1) | (right > left)
+    return fingerprint
+
+
+def fingerprint_image_data(image_data: str, max_pixels: int) -> int:
+    """Perceptual hash of a base64 photo from a cheap reduced-scale decode."""
+    image, _ = decode_image(image_data, max_pixels, size=FINGERPRINT_SIZE)
+    return perceptual_hash(image)
+
+
+def _concerns(zones: Dict[str, Dict[str, Any]], metrics: Dict[str, float]) -> Tuple[str, List[str]]:
+    """Merge zone issues into an overall concern list and estimated skin type."""
+    concerns: List[str] = []
+    for zone in zones.values():
+        concerns.extend(issue for issue in zone["issues"] if issue not in concerns)
+    if metrics["brightness"] < 0.35:
+        concerns.append("dullness")
+
+    t_zone_oily = "oiliness" in zones.get("t_zone", {}).get("issues", [])
+    if t_zone_oily and zones.get("cheek_area", {}).get("shine", 0.0) >= 0.05:
+        skin_type = "oily"
+    elif t_zone_oily:
+        skin_type = "combination"
+    elif "sensitivity" in concerns:
+        skin_type = "sensitive"
+    elif "dullness" in concerns:
+        skin_type = "dry"
+    else:
+        skin_type = "normal"
+    return skin_type, concerns
+
+
+def analyze_image_data(image_data: str, max_pixels: int) -> Dict[str, Any]:
+    """Decode, downscale and analyze a base64 photo; runs in a worker process."""
+    return _analyze(*decode_image(image_data, max_pixels))
+
+
+def analyze_unless_known(
+    image_data: str, max_pixels: int, known: Sequence[int], max_distance: int
+) -> Tuple[int, Optional[Dict[str, Any]]]:
+    """Perceptual hash of a base64 photo and, unless a ``known`` hash is within
+    ``max_distance`` bits of it, its analysis; runs in a worker process.
+
+    The payload is decoded once for both, so a new photo costs one job.
+    """
+    image, size = decode_image(image_data, max_pixels)
+    fingerprint = perceptual_hash(image)
+    if any((fingerprint ^ other).bit_count() <= max_distance for other in known):
+        return fingerprint, None
+    return fingerprint, _analyze(image, size)
+
+
+def _analyze(image, size: Tuple[int, int]) -> Dict[str, Any]:
+    try:
+        from zone_metrics import analyze_zones
+    except ImportError as e:
+        raise ImageRejected("Photo analysis requires the NumPy package (pip install numpy).") from e
+
+    width, height = size
+    zones, metrics = analyze_zones(image)
+    skin_type, concerns = _concerns(zones, metrics)
+    return {
+        "skin_type": skin_type,
+        "primary_concerns": concerns,
+        "metrics": metrics,
+        "zones": zones,
+        "image": {"width": width, "height": height, "analyzed_at": list(image.size)},
+    }
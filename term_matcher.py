@@ -0,0 +1,132 @@
+"""
+Multi-pattern term matcher (Aho-Corasick) for K-Beauty vocabulary.
+
+All terms are compiled into a single automaton once, so recognizing every
+brand, category and ingredient in a query is one pass over the query no
+matter how large the vocabulary grows.
+"""
+
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Tuple
+
+
+class TermMatch(NamedTuple):
+    """A recognized term and its span in the lowercased query."""
+
+    term: str
+    kind: str
+    start: int
+    end: int
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isascii() and char.isalnum()
+
+
+class TermMatcher:
+    """Aho-Corasick automaton over lowercase terms tagged with a kind.
+
+    Matches respect word boundaries on ASCII letters and digits, so "hera"
+    is not found inside "therapy". Hangul terms may be followed directly by
+    particles ("설화수는") because Korean does not separate them with spaces.
+    """
+
+    def __init__(self, terms: Iterable[Tuple[str, str]] = ()):
+        # State 0 is the root; each state has its goto edges, failure link,
+        # the (term, kind) pairs that end at it and, once compiled, those plus
+        # the pairs inherited through its failure links.
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._own: List[List[Tuple[str, str]]] = [[]]
+        self._out: List[List[Tuple[str, str]]] = [[]]
+        self._compiled = False
+        for term, kind in terms:
+            self.add(term, kind)
+        self.compile()
+
+    @classmethod
+    def from_groups(cls, groups: Mapping[str, Iterable[str]]) -> "TermMatcher":
+        """Build a matcher from ``{kind: [terms...]}``, e.g. ``KBEAUTY_SEARCH_TERMS``."""
+        return cls((term, kind) for kind, terms in groups.items() for term in terms)
+
+    def add(self, term: str, kind: str) -> None:
+        term = term.lower().strip()
+        if not term:
+            return
+        state = 0
+        for char in term:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._own.append([])
+                self._out.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        if (term, kind) not in self._own[state]:
+            self._own[state].append((term, kind))
+        self._compiled = False
+
+    def compile(self) -> None:
+        """Compute failure links breadth-first; call after adding terms.
+
+        Outputs are rebuilt from each state's own terms, so compiling again
+        after adding more terms never duplicates matches.
+        """
+        queue = list(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+            self._out[state] = list(self._own[state])
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                candidate = self._goto[fail].get(char, 0)
+                self._fail[next_state] = candidate if candidate != next_state else 0
+                # Inherit matches that end at the failure state (suffix terms)
+                self._out[next_state] = self._own[next_state] + self._out[self._fail[next_state]]
+        self._compiled = True
+
+    def find_all(self, text: str) -> List[TermMatch]:
+        """Return every word-bounded term occurrence in ``text``, in order of position."""
+        if not self._compiled:
+            self.compile()
+        text = text.lower()
+        goto, fail, out = self._goto, self._fail, self._out
+        matches: List[TermMatch] = []
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not out[state]:
+                continue
+            end = index + 1
+            for term, kind in out[state]:
+                start = end - len(term)
+                if self._bounded(text, start, end):
+                    matches.append(TermMatch(term, kind, start, end))
+        matches.sort(key=lambda match: (match.start, -match.end))
+        return matches
+
+    @staticmethod
+    def _bounded(text: str, start: int, end: int) -> bool:
+        if start > 0 and _is_word_char(text[start - 1]) and _is_word_char(text[start]):
+            return False
+        if end < len(text) and _is_word_char(text[end]) and _is_word_char(text[end - 1]):
+            return False
+        return True
+
+    def terms_by_kind(self, text: str) -> Dict[str, List[str]]:
+        """Group the distinct matched terms of ``text`` by kind, in order of appearance."""
+        grouped: Dict[str, List[str]] = {}
+        for match in self.find_all(text):
+            terms = grouped.setdefault(match.kind, [])
+            if match.term not in terms:
+                terms.append(match.term)
+        return grouped
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Tests for the columnar brand and product catalog."""
+
+import json
+
+import pytest
+
+from catalog import BrandsView, Catalog, ProductView, load_default_catalog
+from data.brands import KBEAUTY_BRANDS
+
+NESTED = {
+    "alpha": {
+        "name": "Alpha",
+        "founded": 2001,
+        "popular_products": [
+            {"name": "Alpha Serum", "type": "serum", "price_usd": 24.5,
+             "key_benefits": ["Hydration", "Glow"], "skin_types": ["All"]},
+            {"name": "Alpha Cream", "type": "cream", "price_usd": 30,
+             "key_benefits": ["Hydration"], "skin_types": ["Dry", "Normal"]},
+        ],
+    },
+    "beta": {
+        "name": "Beta",
+        "founded": 2010,
+        "popular_products": [
+            {"name": "Beta Toner", "type": "toner", "price_usd": 18,
+             "key_benefits": ["Glow"], "skin_types": ["All"]},
+        ],
+    },
+}
+
+
+def test_round_trip_from_nested_shape():
+    catalog = Catalog.from_brands(NESTED)
+    view = BrandsView(lambda: catalog)
+    plain = {key: {**brand, "popular_products": [dict(p) for p in brand["popular_products"]]}
+             for key, brand in view.items()}
+    assert plain == NESTED
+    assert len(catalog) == 3
+
+
+def test_prices_keep_their_type():
+    catalog = Catalog.from_brands(NESTED)
+    serum, cream = catalog.products_of("alpha")
+    assert serum["price_usd"] == 24.5
+    assert cream["price_usd"] == 30 and isinstance(cream["price_usd"], int)
+
+
+def test_repeated_strings_are_interned_once():
+    catalog = Catalog.from_brands(NESTED)
+    # serum, cream, toner, Hydration, Glow, All, Dry, Normal
+    assert len(catalog.strings) == 8
+
+
+def test_products_are_grouped_by_brand_in_file_order():
+    rows = [
+        ["beta", "B1", "toner", 1, [], []],
+        ["alpha", "A1", "serum", 2, [], []],
+        ["beta", "B2", "toner", 3, [], []],
+    ]
+    catalog = Catalog({"alpha": {"name": "Alpha"}, "beta": {"name": "Beta"}}, rows)
+    assert [p["name"] for p in catalog.products_of("beta")] == ["B1", "B2"]
+    assert [p["name"] for p in catalog.products_of("alpha")] == ["A1"]
+
+
+def test_unknown_brand_is_rejected():
+    with pytest.raises(ValueError, match="unknown brand"):
+        Catalog({"alpha": {"name": "Alpha"}}, [["gamma", "G1", "toner", 1, [], []]])
+
+
+def test_file_columns_are_checked(tmp_path):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps({"brands": {}, "columns": ["name", "brand"], "products": []}))
+    with pytest.raises(ValueError, match="columns"):
+        Catalog.from_file(str(path))
+
+
+def test_brands_view_loads_on_first_access():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return Catalog.from_brands(NESTED)
+
+    view = BrandsView(loader)
+    assert calls == []
+    assert view["beta"]["name"] == "Beta"
+    assert list(view) == ["alpha", "beta"]
+    assert calls == [1]
+    with pytest.raises(KeyError):
+        view["gamma"]
+
+
+def test_product_views_compare_like_dicts():
+    catalog = Catalog.from_brands(NESTED)
+    toner = catalog.products_of("beta")[0]
+    assert isinstance(toner, ProductView)
+    assert toner == NESTED["beta"]["popular_products"][0]
+    assert toner == catalog.products_of("beta")[0]
+
+
+def test_catalog_path_override(tmp_path, monkeypatch):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps({
+        "brands": {"alpha": {"name": "Alpha"}},
+        "columns": ["brand", "name", "type", "price_usd", "key_benefits", "skin_types"],
+        "products": [["alpha", "A1", "serum", 9.99, ["Glow"], ["All"]]],
+    }))
+    monkeypatch.setenv("KBEAUTY_CATALOG_PATH", str(path))
+    catalog = load_default_catalog()
+    assert dict(catalog.products_of("alpha")[0])["price_usd"] == 9.99
+
+
+def test_bundled_catalog_keeps_the_nested_shape():
+    assert {"sulwhasoo", "cosrx", "laneige"} <= set(KBEAUTY_BRANDS)
+    for brand in KBEAUTY_BRANDS.values():
+        assert brand["name"]
+        for product in brand["popular_products"]:
+            assert set(product) == {"name", "type", "price_usd", "key_benefits", "skin_types"}
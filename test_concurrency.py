@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Tests for the async concurrency helpers"""
+
+import asyncio
+
+import pytest
+
+from concurrency import AdmissionGate, Overloaded, SingleFlight, gather_bounded
+
+
+def test_concurrent_callers_share_one_call():
+    async def run():
+        flights = SingleFlight()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flights.do("cosrx", fetch) for _ in range(5)))
+        assert results == ["result"] * 5
+        assert calls == 1
+        assert len(flights) == 0
+
+        # A later call starts a fresh flight
+        await flights.do("cosrx", fetch)
+        assert calls == 2
+
+    asyncio.run(run())
+
+
+def test_errors_propagate_to_every_waiter():
+    async def run():
+        flights = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream down")
+
+        results = await asyncio.gather(
+            *(flights.do("k", fail) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(r, ValueError) for r in results)
+
+    asyncio.run(run())
+
+
+def test_cancelling_one_waiter_keeps_the_flight_alive():
+    async def run():
+        flights = SingleFlight()
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def fetch():
+            started.set()
+            await release.wait()
+            return 42
+
+        first = asyncio.ensure_future(flights.do("k", fetch))
+        second = asyncio.ensure_future(flights.do("k", fetch))
+        await started.wait()
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        release.set()
+        assert await second == 42
+
+    asyncio.run(run())
+
+
+def test_last_waiter_cancelling_cancels_the_flight():
+    async def run():
+        flights = SingleFlight()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def fetch():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiter = asyncio.ensure_future(flights.do("k", fetch))
+        await started.wait()
+        waiter.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert len(flights) == 0
+
+    asyncio.run(run())
+
+
+def test_gather_bounded_keeps_order_and_degrades_slow_items():
+    async def run():
+        running = 0
+        peak = 0
+
+        def make(delay, value):
+            async def work():
+                nonlocal running, peak
+                running += 1
+                peak = max(peak, running)
+                try:
+                    await asyncio.sleep(delay)
+                    if value is None:
+                        raise RuntimeError("boom")
+                    return value
+                finally:
+                    running -= 1
+            return work
+
+        factories = [make(0.02, "a"), make(5, "slow"), make(0.01, None), make(0.01, "d")]
+        results = await gather_bounded(
+            factories,
+            limit=2,
+            deadline=0.2,
+            fallback=lambda i, e: f"fallback-{i}-{type(e).__name__}",
+        )
+        assert results == ["a", "fallback-1-TimeoutError", "fallback-2-RuntimeError", "d"]
+        assert peak <= 2
+
+    asyncio.run(run())
+
+
+def test_admission_gate_queues_then_sheds_load():
+    async def run():
+        gate = AdmissionGate(limit=2, queue_timeout=0.05)
+        release = asyncio.Event()
+
+        async def hold():
+            async with gate.admit():
+                await release.wait()
+
+        holders = [asyncio.create_task(hold()) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert gate.in_flight == 2
+        with pytest.raises(Overloaded):
+            async with gate.admit():
+                pass
+        assert gate.waiting == 0
+
+        # A queued caller gets in as soon as a slot frees up
+        queued = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        assert gate.waiting == 1
+        release.set()
+        await asyncio.gather(*holders, queued)
+        assert (gate.in_flight, gate.waiting) == (0, 0)
+
+    asyncio.run(run())
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Tests for the typo-tolerant fuzzy index"""
+
+import random
+
+from fuzzy_index import FuzzyIndex, bounded_edit_distance, decompose_hangul, fuzzy_key
+
+
+def levenshtein(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def test_bounded_edit_distance_matches_reference():
+    rng = random.Random(7)
+    for _ in range(2000):
+        a = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 9)))
+        b = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 9)))
+        limit = rng.randint(0, 4)
+        expected = levenshtein(a, b)
+        assert bounded_edit_distance(a, b, limit) == (expected if expected <= limit else None)
+
+
+def test_hangul_is_decomposed_into_jamo():
+    assert decompose_hangul("설화수") == "ㅅㅓㄹㅎㅘㅅㅜ"
+    assert fuzzy_key("설화 수") == fuzzy_key("설화수")
+
+
+def test_recovers_common_typos():
+    index = FuzzyIndex(["cosrx", "sulwhasoo", "hyaluronic acid", "some by mi", "설화수", "laneige"])
+    assert index.best("cosrks").term == "cosrx"
+    assert index.best("sulwasoo").term == "sulwhasoo"
+    assert index.best("hyaluronic acd").term == "hyaluronic acid"
+    assert index.best("somebymi").distance == 0
+    assert index.best("설와수").term == "설화수"
+    assert index.best("xyz") is None
+
+
+def test_search_returns_top_k_by_distance():
+    index = FuzzyIndex(["serum", "serums", "sebum", "cream"])
+    assert [m.term for m in index.search("serum", k=3)] == ["serum", "serums", "sebum"]
+
+
+def test_find_in_text_prefers_longer_runs():
+    index = FuzzyIndex(["beauty of joseon", "cosrx"])
+    found = index.find_in_text("is beuty of josun better than cosrks")
+    assert [m.term for m in found] == ["beauty of joseon", "cosrx"]
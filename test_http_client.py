@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""Tests for the shared pooled HTTP client"""
+
+import asyncio
+
+from http_client import HttpClient, HttpClientConfig
+
+
+def test_session_is_reused_until_closed():
+    async def run():
+        client = HttpClient(HttpClientConfig(limit_per_host=4, connect_timeout=1.5))
+        async with client:
+            first = client.session
+            assert client.session is first
+            assert first.connector.limit_per_host == 4
+            assert first.timeout.sock_connect == 1.5
+        assert first.closed
+        # A closed client lazily opens a fresh session on next use
+        reopened = client.session
+        assert reopened is not first
+        await client.close()
+
+    asyncio.run(run())
+
+
+def test_config_from_env(monkeypatch):
+    monkeypatch.setenv("KBEAUTY_HTTP_LIMIT_PER_HOST", "3")
+    monkeypatch.setenv("KBEAUTY_HTTP_READ_TIMEOUT", "not-a-number")
+    config = HttpClientConfig.from_env()
+    assert config.limit_per_host == 3
+    assert config.read_timeout == HttpClientConfig.read_timeout
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Tests for the off-event-loop photo analysis pipeline."""
+
+import asyncio
+import base64
+import io
+import os
+import time
+
+import pytest
+
+PIL = pytest.importorskip("PIL")
+from PIL import Image, ImageDraw, ImageFilter
+
+import kbeauty_mcp
+from image_pipeline import PhotoPipeline, PhotoResultCache, PipelineBusy, WorkerCrashed
+from skin_analysis import ImageRejected, analyze_image_data, decode_image, fingerprint_image_data
+
+
+def encode_image(color=(210, 160, 140), size=(640, 480), fmt="JPEG", image=None, **save_args) -> str:
+    buffer = io.BytesIO()
+    (image or Image.new("RGB", size, color)).save(buffer, format=fmt, **save_args)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def portrait() -> Image.Image:
+    """A smooth image with enough structure for a meaningful perceptual hash."""
+    image = Image.new("RGB", (600, 800), (205, 160, 140))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse([100, 120, 500, 700], fill=(225, 180, 160))
+    draw.ellipse([190, 300, 270, 350], fill=(70, 50, 40))
+    draw.ellipse([330, 300, 410, 350], fill=(70, 50, 40))
+    draw.rectangle([240, 540, 360, 580], fill=(170, 80, 80))
+    return image.filter(ImageFilter.GaussianBlur(4))
+
+
+def test_decode_downscales_and_accepts_data_urls():
+    image, original = decode_image("data:image/png;base64," + encode_image(fmt="PNG"), max_pixels=10**7, size=128)
+    assert original == (640, 480)
+    assert max(image.size) == 128
+    assert image.mode == "RGB"
+
+
+def test_pixel_limit_checked_before_decoding():
+    with pytest.raises(ImageRejected, match="megapixels"):
+        decode_image(encode_image(size=(2000, 2000)), max_pixels=1_000_000)
+
+
+def test_garbage_is_rejected():
+    with pytest.raises(ImageRejected):
+        decode_image(base64.b64encode(b"not an image").decode(), max_pixels=10**7)
+
+
+def test_red_photo_reads_as_sensitive():
+    analysis = analyze_image_data(encode_image(color=(200, 60, 60)), max_pixels=10**7)
+    assert "sensitivity" in analysis["primary_concerns"]
+    assert analysis["skin_type"] == "sensitive"
+
+
+def test_byte_limit_rejects_before_queueing():
+    pipeline = PhotoPipeline(max_bytes=100)
+    with pytest.raises(ImageRejected, match="too large"):
+        asyncio.run(pipeline.analyze(encode_image()))
+    assert pipeline._executor is None
+
+
+def test_full_queue_turns_jobs_away():
+    pipeline = PhotoPipeline(workers=1, max_pending=0)
+    pipeline._in_flight = 1
+    with pytest.raises(PipelineBusy):
+        asyncio.run(pipeline.run(len, "x"))
+
+
+def test_timed_out_job_keeps_its_slot_until_the_worker_finishes():
+    async def scenario():
+        pipeline = PhotoPipeline(workers=1, max_pending=0)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(pipeline.run(time.sleep, 1.0), 0.05)
+            # The worker is still busy with the abandoned job
+            with pytest.raises(PipelineBusy):
+                await pipeline.run(len, "x")
+            while pipeline._in_flight:
+                await asyncio.sleep(0.05)
+            return await pipeline.run(len, "x")
+        finally:
+            pipeline.close()
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_crashed_worker_is_replaced():
+    async def scenario():
+        pipeline = PhotoPipeline(workers=1)
+        try:
+            with pytest.raises(WorkerCrashed, match="try again"):
+                await pipeline.run(os._exit, 1)
+            return await pipeline.run(len, "x"), pipeline._in_flight
+        finally:
+            pipeline.close()
+
+    assert asyncio.run(scenario()) == (1, 0)
+
+
+def test_pipeline_runs_in_worker_process():
+    async def scenario():
+        pipeline = PhotoPipeline(workers=1)
+        try:
+            return await pipeline.analyze(encode_image())
+        finally:
+            pipeline.close()
+
+    analysis = asyncio.run(scenario())
+    assert analysis["image"]["width"] == 640
+    assert set(analysis["metrics"]) == {"brightness", "redness", "shine", "texture"}
+
+
+def test_recommendations_render_from_analysis():
+    analysis = analyze_image_data(encode_image(color=(200, 60, 60)), max_pixels=10**7)
+    report = kbeauty_mcp.get_kbeauty_recommendations_from_analysis(analysis)
+    assert "Sensitive" in report
+    assert "Centella" in report
+
+
+def test_perceptual_hash_tolerates_recompression_and_recrop():
+    image = portrait()
+    original = fingerprint_image_data(encode_image(image=image), max_pixels=10**7)
+    recompressed = fingerprint_image_data(encode_image(image=image.resize((450, 600)), quality=60), max_pixels=10**7)
+    recropped = fingerprint_image_data(encode_image(image=image.crop((12, 16, 588, 784))), max_pixels=10**7)
+    other = fingerprint_image_data(encode_image(image=image.transpose(Image.Transpose.ROTATE_90)), max_pixels=10**7)
+    assert (original ^ recompressed).bit_count() <= 6
+    assert (original ^ recropped).bit_count() <= 6
+    assert (original ^ other).bit_count() > 6
+
+
+def test_result_cache_returns_nearest_within_distance():
+    cache = PhotoResultCache(max_entries=2, max_distance=2)
+    cache.put(0b0000, {"skin_type": "dry"})
+    cache.put(0b1110, {"skin_type": "oily"})
+    assert cache.get(0b0001)["skin_type"] == "dry"
+    assert cache.get(0b1111)["skin_type"] == "oily"
+    assert cache.get(0b1111_0000_0000) is None
+
+    cache.put(0b1111_1111_0000_0000, {"skin_type": "normal"})  # evicts the least recently used entry
+    assert len(cache) == 2
+    assert cache.get(0b0000) is None
+
+
+def test_result_cache_matches_nearby_hashes_by_default_and_hands_out_copies():
+    cache = PhotoResultCache()
+    analysis = {"skin_type": "oily", "concerns": ["shine"]}
+    cache.put(0b1010, analysis)
+    analysis["concerns"].append("added after put")
+    assert cache.get(0b1011) == {"skin_type": "oily", "concerns": ["shine"]}
+    assert cache.get(0b0101) is None
+    cached = cache.get(0b1010)
+    cached["concerns"].append("changed by a caller")
+    assert cache.get(0b1010)["concerns"] == ["shine"]
+
+
+def test_resubmitted_photo_reuses_analysis():
+    async def scenario():
+        pipeline = PhotoPipeline(workers=1, results=PhotoResultCache())
+        jobs = []
+        run = pipeline.run
+
+        async def counted(fn, *args):
+            jobs.append(fn.__name__)
+            return await run(fn, *args)
+
+        pipeline.run = counted
+        try:
+            first = await pipeline.analyze(encode_image(image=portrait()))
+            again = await pipeline.analyze(encode_image(image=portrait().resize((300, 400)), quality=70))
+        finally:
+            pipeline.close()
+        return pipeline.results, jobs, first, again
+
+    results, jobs, first, again = asyncio.run(scenario())
+    assert (results.hits, results.misses, len(results)) == (1, 1, 1)
+    # Each photo is decoded by a single pool job
+    assert jobs == ["analyze_unless_known", "analyze_unless_known"]
+    assert again == first
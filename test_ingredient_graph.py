@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Tests for the ingredient conflict graph."""
+
+import itertools
+import random
+
+from data.ingredient_aliases import INGREDIENT_ALIASES
+from data.ingredients import INGREDIENT_DATABASE
+from ingredient_graph import IngredientGraph
+
+GRAPH = IngredientGraph(INGREDIENT_DATABASE, INGREDIENT_ALIASES)
+
+
+def test_conflicts_are_symmetric():
+    assert set(GRAPH.conflicts_with("retinol")) == {"aha", "bha", "vitamin_c", "benzoyl_peroxide"}
+    assert GRAPH.conflicts_with("aha") == ["retinol"]
+    assert set(GRAPH.conflicts_with("vitamin_c")) == {"niacinamide", "retinol"}
+
+
+def test_note_qualifier_is_kept():
+    conflicts = GRAPH.find_conflicts([["niacinamide"], ["vitamin_c"]])
+    assert [conflict.detail for conflict in conflicts] == ["at same time"]
+
+
+def test_unknown_conflict_gets_its_own_id():
+    graph = IngredientGraph({"copper_peptide": {"name": "Copper Peptide", "incompatible": ["Direct Acids"]}})
+    assert graph.conflicts_with("copper_peptide") == ["direct_acids"]
+    assert graph.resolve("Water, Direct Acids") == ["direct_acids"]
+
+
+def test_default_graph_reports_each_match_once():
+    label = "Red Ginseng, 3-O-Ethyl Ascorbic Acid, Hydrolyzed Hyaluronic Acid"
+    matches = GRAPH._matcher.find_all(label.lower())
+    assert len(matches) == len(set(matches))
+
+
+def test_resolves_inci_names_and_korean():
+    label = "Water, Glycerin, Sodium Hyaluronate, Salicylic Acid, Retinyl Palmitate, 3-O-Ethyl Ascorbic Acid"
+    assert GRAPH.resolve(label) == ["hyaluronic_acid", "bha", "retinol", "vitamin_c"]
+    assert GRAPH.resolve("레티놀 크림") == ["retinol"]
+    assert GRAPH.resolve_names(["Glycolic Acid", "Water", "Lactic Acid"]) == ["aha"]
+
+
+def test_conflicts_within_one_product_are_not_reported():
+    assert GRAPH.find_conflicts([["retinol", "bha"], ["ginseng"]]) == []
+
+
+def test_matches_pairwise_check():
+    rng = random.Random(11)
+    keys = ["snail_secretion", "niacinamide", "retinol", "vitamin_c", "aha", "bha", "benzoyl_peroxide"]
+    groups = [rng.sample(keys, 3) for _ in range(30)]
+    expected = {
+        (i, j, a, b)
+        for (i, first), (j, second) in itertools.combinations(enumerate(groups), 2)
+        for a in first for b in second
+        if b in GRAPH.conflicts_with(a)
+    }
+    found = {conflict[:4] for conflict in GRAPH.find_conflicts(groups)}
+    assert found == expected
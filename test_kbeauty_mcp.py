@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""Tests for the K-Beauty MCP server tools"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import kbeauty_mcp
+from benchmarks import fake_ddg
+from resilience import CircuitBreaker
+from search_cache import MemoryCache, SqliteCache, TieredCache
+
+
+@pytest.fixture
+def fake_search(monkeypatch):
+    """Replace the DuckDuckGo call with a counting stub and start from an empty cache."""
+    calls = []
+
+    async def fetch(query, search_type):
+        calls.append((query, search_type))
+        await asyncio.sleep(0.01)
+        return {"abstract": f"About {query}", "related": [], "definition": "", "answer": ""}
+
+    monkeypatch.setattr(kbeauty_mcp, "fetch_search_data", fetch)
+    monkeypatch.setattr(kbeauty_mcp.search_cache, "backend", MemoryCache())
+    yield calls
+
+
+def test_search_web_coalesces_and_caches(fake_search):
+    async def run():
+        results = await asyncio.gather(*(kbeauty_mcp.search_web("COSRX", "brand") for _ in range(4)))
+        assert len(set(results)) == 1
+        assert "About COSRX" in results[0]
+        await kbeauty_mcp.search_web("cosrx ", "brand")
+
+    asyncio.run(run())
+    assert fake_search == [("COSRX", "brand")]
+
+
+def test_concurrent_searches_share_one_failure_with_a_shared_cache_file(monkeypatch, tmp_path):
+    calls = []
+
+    async def failing(query, search_type):
+        calls.append(query)
+        await asyncio.sleep(0.05)
+        raise kbeauty_mcp.UpstreamError("HTTP 503")
+
+    backend = TieredCache(MemoryCache(), SqliteCache(str(tmp_path / "cache.sqlite3")))
+    monkeypatch.setattr(kbeauty_mcp, "fetch_search_data", failing)
+    monkeypatch.setattr(kbeauty_mcp.search_cache, "backend", backend)
+
+    async def run():
+        started = time.perf_counter()
+        results = await asyncio.gather(*(kbeauty_mcp.search_web_data("missha", "brand") for _ in range(5)))
+        return results, time.perf_counter() - started
+
+    try:
+        results, elapsed = asyncio.run(run())
+    finally:
+        backend.close()
+    # One upstream call whose error every caller shares, without lease polling
+    assert calls == ["missha"]
+    assert all(result["error"] == "Search temporarily unavailable" for result in results)
+    assert elapsed < 0.5
+
+
+def test_search_url_points_searches_at_a_stand_in(monkeypatch):
+    async def run():
+        runner, url = await fake_ddg.start(fake_ddg.FakeSearchConfig(latency_ms=0, jitter_ms=0, payload="large"))
+        monkeypatch.setattr(kbeauty_mcp, "SEARCH_URL", url)
+        try:
+            async with kbeauty_mcp.http_client:
+                data = await kbeauty_mcp.fetch_search_data("snail mucin", "ingredient")
+        finally:
+            await runner.cleanup()
+        return data, runner.app[fake_ddg.STATS]
+
+    data, stats = asyncio.run(run())
+    assert stats == {"requests": 1, "errors": 0}
+    assert data["abstract"].startswith("snail mucin skincare ingredient")
+    # Topic groups carry no text of their own and are skipped
+    assert len(data["related"]) == 2 and all(len(text) <= 200 for text in data["related"])
+
+
+def test_search_web_falls_back_on_upstream_error(monkeypatch):
+    async def failing(query, search_type):
+        raise kbeauty_mcp.UpstreamError("HTTP 503")
+
+    monkeypatch.setattr(kbeauty_mcp, "fetch_search_data", failing)
+    monkeypatch.setattr(kbeauty_mcp.search_cache, "backend", MemoryCache())
+    result = asyncio.run(kbeauty_mcp.search_web("laneige", "brand"))
+    assert "Search temporarily unavailable" in result
+
+
+def test_brand_recognition_avoids_substring_false_positives():
+    assert "hera" not in kbeauty_mcp.get_brand_recognition_info("retinol therapy")
+    assert "**Recognized K-Beauty Brand:** cosrx" in kbeauty_mcp.get_brand_recognition_info("COSRX snail")
+
+
+def test_enhance_search_with_knowledge_adds_context():
+    enhanced = kbeauty_mcp.enhance_search_with_knowledge("cosrx niacinamide serum", "product")
+    assert enhanced == "cosrx niacinamide serum Korean beauty brand cosrx K-Beauty serum"
+
+
+def test_compare_products_keeps_input_order(fake_search):
+    products = [
+        {"brand": "cosrx", "product_name": "Snail 96 Mucin Power Essence"},
+        {"brand": "laneige", "product_name": "Water Sleeping Mask"},
+        {"brand": "sulwhasoo", "product_name": "First Care Activating Serum"},
+    ]
+    result = asyncio.run(kbeauty_mcp.call_tool("compare_products", {"products": products}))
+    text = result[0].text
+    positions = [text.index(f"Product {i}:") for i in (1, 2, 3)]
+    assert positions == sorted(positions)
+    assert len(fake_search) == 3
+
+
+def test_product_info_answers_locally(fake_search):
+    result = asyncio.run(kbeauty_mcp.call_tool(
+        "get_product_info", {"brand": "COSRX", "product_name": "snail essence"}
+    ))
+    assert "Snail 96 Mucin Power Essence" in result[0].text
+    assert "$17" in result[0].text
+    assert fake_search == []
+
+
+def test_product_info_uses_web_on_miss(fake_search):
+    asyncio.run(kbeauty_mcp.call_tool("get_product_info", {"brand": "anua", "product_name": "toner"}))
+    assert len(fake_search) == 1
+
+
+def test_analyze_ingredients_resolves_korean_names(fake_search):
+    result = asyncio.run(kbeauty_mcp.call_tool("analyze_ingredients", {"ingredient": "나이아신아마이드"}))
+    assert "Niacinamide (Vitamin B3)" in result[0].text
+    assert fake_search == []
+
+
+def test_recommend_routine_enriches_only_on_request(fake_search):
+    local = asyncio.run(kbeauty_mcp.call_tool("recommend_routine", {"skin_type": "oily", "routine_type": "acne_prone"}))
+    assert "K-Beauty Acne-Prone Routine" in local[0].text
+    assert fake_search == []
+    asyncio.run(kbeauty_mcp.call_tool(
+        "recommend_routine", {"skin_type": "oily", "routine_type": "acne_prone", "include_web": True}
+    ))
+    assert len(fake_search) == 1
+
+
+def test_brand_recognition_recovers_typos():
+    assert "**Recognized K-Beauty Brand:** cosrx" in kbeauty_mcp.get_brand_recognition_info("cosrks")
+
+
+def test_open_breaker_skips_the_network(fake_search, monkeypatch):
+    breaker = kbeauty_mcp.CircuitBreaker(min_calls=1, window=1)
+    breaker._trip()
+    monkeypatch.setattr(kbeauty_mcp, "upstream_breaker", breaker)
+    result = asyncio.run(kbeauty_mcp.search_web("anua", "brand"))
+    assert "Search temporarily paused" in result
+    assert fake_search == []
+
+
+def test_tool_budget_bounds_slow_upstream(monkeypatch):
+    async def hang(query, search_type):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(kbeauty_mcp, "fetch_search_data", hang)
+    monkeypatch.setattr(kbeauty_mcp.search_cache, "backend", MemoryCache())
+    monkeypatch.setattr(kbeauty_mcp, "upstream_breaker", kbeauty_mcp.CircuitBreaker())
+    monkeypatch.setattr(kbeauty_mcp, "TOOL_BUDGET", 0.1)
+    result = asyncio.run(kbeauty_mcp.call_tool("search_kbeauty_brands", {"query": "anua"}))
+    assert "Search timed out" in result[0].text
+
+
+def test_batch_call_dedupes_and_keeps_order(fake_search):
+    calls = [
+        {"name": "search_kbeauty_brands", "arguments": {"query": "anua"}},
+        {"name": "analyze_ingredients", "arguments": {"ingredient": "niacinamide"}},
+        {"name": "search_kbeauty_brands", "arguments": {"query": "anua"}},
+        {"name": "no_such_tool", "arguments": {}},
+        {"name": "batch_call", "arguments": {"calls": []}},
+    ]
+    result = asyncio.run(kbeauty_mcp.call_tool("batch_call", {"calls": calls}))
+    items = json.loads(result[0].text)["results"]
+    assert [item["index"] for item in items] == [0, 1, 2, 3, 4]
+    assert items[0]["result"] == items[2]["result"]
+    assert "Niacinamide" in items[1]["result"]
+    assert "error" in items[3] and "error" in items[4]
+    assert len(fake_search) == 1
+
+
+def test_batch_call_reports_failures_per_item(fake_search, monkeypatch):
+    original = kbeauty_mcp.dispatch_tool
+
+    async def flaky(name, arguments):
+        if name == "analyze_ingredients":
+            raise RuntimeError("boom")
+        return await original(name, arguments)
+
+    monkeypatch.setattr(kbeauty_mcp, "dispatch_tool", flaky)
+    calls = [
+        {"name": "analyze_ingredients", "arguments": {"ingredient": "snail mucin"}},
+        {"name": "recommend_routine", "arguments": {"skin_type": "dry"}},
+    ]
+    items = json.loads(asyncio.run(original("batch_call", {"calls": calls}))[0].text)["results"]
+    assert items[0]["error"] == "RuntimeError: boom"
+    assert "Routine" in items[1]["result"]
+
+
+def test_every_tool_accepts_format():
+    tools = asyncio.run(kbeauty_mcp.list_tools())
+    assert all(tool.inputSchema["properties"]["format"]["enum"] == ["markdown", "compact", "json"] for tool in tools)
+
+
+def test_tool_registry_is_built_once():
+    first, second = (asyncio.run(kbeauty_mcp.list_tools()) for _ in range(2))
+    assert first == second
+    assert all(a is b for a, b in zip(first, second))
+
+
+def test_cold_start_defers_heavy_imports():
+    # A fresh interpreter: listing tools must not pull in the HTTP or imaging stacks
+    code = (
+        "import asyncio, sys, kbeauty_mcp; asyncio.run(kbeauty_mcp.list_tools()); "
+        "print([name for name in ('aiohttp', 'numpy', 'PIL') if name in sys.modules])"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True,
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_json_format_returns_only_dynamic_data(fake_search):
+    result = asyncio.run(kbeauty_mcp.call_tool(
+        "recommend_routine", {"skin_type": "oily", "concerns": ["acne"], "routine_type": "acne_prone", "format": "json"}
+    ))
+    payload = json.loads(result[0].text)
+    assert payload["routine"]["name"] == "K-Beauty Acne-Prone Routine"
+    assert payload["concern_ingredients"] == {"Acne": "BHA (salicylic acid), tea tree, centella asiatica"}
+    assert "Framework" not in result[0].text
+
+
+def test_compact_format_drops_boilerplate(fake_search):
+    products = [{"brand": "cosrx", "product_name": "Snail Essence"}, {"brand": "laneige", "product_name": "Water Sleeping Mask"}]
+    markdown = asyncio.run(kbeauty_mcp.call_tool("compare_products", {"products": products}))[0].text
+    compact = asyncio.run(kbeauty_mcp.call_tool("compare_products", {"products": products, "format": "compact"}))[0].text
+    assert "products[1].brand: laneige" in compact
+    assert "Comparison Framework" not in compact
+    assert len(compact) < len(markdown) / 2
+
+
+def test_routine_framework_is_memoized_per_canonical_key(fake_search):
+    kbeauty_mcp.routine_framework.cache_clear()
+    for concerns in (["Acne", "pores"], ["pores", "acne ", "ACNE"]):
+        asyncio.run(kbeauty_mcp.call_tool("recommend_routine", {"skin_type": "Oily", "concerns": concerns}))
+    info = kbeauty_mcp.routine_framework.cache_info()
+    assert (info.misses, info.hits) == (1, 1)
+
+
+def test_concern_matcher_renders_budget_tiers(fake_search):
+    result = asyncio.run(kbeauty_mcp.call_tool(
+        "skin_concern_matcher", {"concerns": ["Acne"], "skin_type": "oily", "budget": "Luxury"}
+    ))
+    text = result[0].text
+    assert "Sulwhasoo Clarifying Mask" in text
+    assert "COSRX BHA Blackhead Power Liquid" not in text
+    assert text.endswith("Essential when using any active ingredients\n")
+
+
+def test_filter_products_pages_by_price():
+    first = asyncio.run(kbeauty_mcp.call_tool("filter_products", {"limit": 2, "format": "json"}))
+    second = asyncio.run(kbeauty_mcp.call_tool("filter_products", {"limit": 2, "offset": 2, "format": "json"}))
+    pages = [json.loads(result[0].text) for result in (first, second)]
+    assert pages[0]["total"] == pages[1]["total"] == 6
+    prices = [product["price_usd"] for page in pages for product in page["products"]]
+    assert prices == sorted(prices)
+
+    text = asyncio.run(kbeauty_mcp.call_tool(
+        "filter_products", {"types": ["toner"], "skin_types": ["Oily"], "benefits": ["pore"], "max_price": 30}
+    ))[0].text
+    assert "**COSRX AHA/BHA Clarifying Treatment Toner** (toner, $17)" in text
+
+    single = json.loads(asyncio.run(kbeauty_mcp.call_tool("filter_products", {"types": "toner", "format": "json"}))[0].text)
+    assert [product["type"] for product in single["products"]] == ["toner"]
+    text = asyncio.run(kbeauty_mcp.call_tool("filter_products", {"brands": 5}))[0].text
+    assert text == "types, skin_types, benefits and brands must be lists."
+
+
+def test_concern_matcher_lists_catalog_matches_first(fake_search):
+    result = asyncio.run(kbeauty_mcp.call_tool(
+        "skin_concern_matcher", {"concerns": ["acne"], "skin_type": "oily", "budget": "budget", "format": "json"}
+    ))
+    picks = json.loads(result[0].text)["recommendations"]["acne"]
+    assert picks[0] == "COSRX AHA/BHA Clarifying Treatment Toner"
+    assert picks.count("COSRX Snail 96 Mucin Power Essence") <= 1
+
+
+def test_shelf_check_reports_routine_steps():
+    shelf = [
+        {"name": "Glow Toner", "ingredients": ["Water", "Glycolic Acid"], "routine": "PM"},
+        {"name": "C Serum", "ingredients": "Water, Ascorbic Acid", "routine": "AM"},
+        {"name": "Retinal Cream", "ingredients": ["Retinal", "Ceramide NP"], "routine": "PM"},
+    ]
+    report = json.loads(asyncio.run(kbeauty_mcp.call_tool(
+        "check_shelf_compatibility", {"products": shelf, "format": "json"}
+    ))[0].text)
+    assert report["conflicts"] == [{
+        "products": ["Glow Toner", "Retinal Cream"],
+        "ingredients": ["AHA", "Retinol"],
+        "detail": "",
+        "affects": [{"routine": "PM", "steps": [1, 2]}],
+    }]
+    assert [entry["products"] for entry in report["separated"]] == [["C Serum", "Retinal Cream"]]
+
+    text = asyncio.run(kbeauty_mcp.call_tool("check_shelf_compatibility", {"products": shelf}))[0].text
+    assert "**Glow Toner** (AHA) × **Retinal Cream** (Retinol) — PM steps 1 and 2" in text
+
+def test_build_routine_fills_steps_from_the_catalog():
+    report = json.loads(asyncio.run(kbeauty_mcp.call_tool(
+        "build_routine", {"skin_type": "oily", "concerns": ["acne", "aging"], "format": "json"}
+    ))[0].text)
+    plan = report["plans"][0]
+    assert [entry["product"]["type"] for entry in plan["steps"]] == ["toner", "serum"]
+    assert plan["covers"] == ["acne", "aging"]
+    assert plan["total_usd"] == sum(entry["product"]["price_usd"] for entry in plan["steps"])
+    assert [entry["type"] for entry in report["unfilled"]] == ["cleanser", "cleanser", "essence", "moisturizer", "sunscreen"]
+
+    text = asyncio.run(kbeauty_mcp.call_tool("build_routine", {"skin_type": "oily", "budget_usd": 5}))[0].text
+    assert "No combination of catalog products fits" in text
+
+def test_build_routine_validates_budget_and_concerns():
+    for budget in ("inf", 1e400, -5):
+        text = asyncio.run(kbeauty_mcp.call_tool("build_routine", {"budget_usd": budget}))[0].text
+        assert text == "budget_usd must be a finite amount of at least 0."
+    text = asyncio.run(kbeauty_mcp.call_tool("build_routine", {"concerns": 7}))[0].text
+    assert text == "concerns must be a list of skin concerns."
+    # A bare string is one concern, not a list of characters
+    report = json.loads(asyncio.run(kbeauty_mcp.call_tool(
+        "build_routine", {"skin_type": "oily", "concerns": "acne", "format": "json"}
+    ))[0].text)
+    assert report["plans"][0]["covers"] == ["acne"]
+
+
+def test_server_stats_splits_upstream_and_render_time(fake_search):
+    async def run():
+        await kbeauty_mcp.call_tool("get_product_info", {"brand": "cosrx", "include_web": True})
+        await kbeauty_mcp.call_tool("get_product_info", {"brand": "cosrx", "include_web": True})
+        return await kbeauty_mcp.call_tool("server_stats", {"format": "json"})
+
+    report = json.loads(asyncio.run(run())[0].text)
+    stats = next(tool for tool in report["tools"] if tool["tool"] == "get_product_info")
+    assert stats["calls"] >= 2
+    # The first call waits out the stubbed 10 ms search, the second is a cache hit
+    assert stats["mean_upstream_ms"] > 0 and stats["mean_render_ms"] > 0
+    assert stats["mean_response_bytes"] > 0
+    assert report["search_cache"]["misses"] >= 1 and report["search_cache"]["hits"] >= 1
+    assert "kbeauty_tool_upstream_seconds_bucket" in kbeauty_mcp.metrics.render_prometheus()
+
+
+def test_coalesced_callers_count_their_upstream_wait(fake_search):
+    tool = "get_product_info"
+    arguments = {"brand": "sulwhasoo", "include_web": True}
+
+    async def run():
+        before = kbeauty_mcp.tool_upstream_seconds.series.get((tool,))
+        before = before.sum if before else 0.0
+        await asyncio.gather(*(kbeauty_mcp.call_tool(tool, arguments) for _ in range(2)))
+        return kbeauty_mcp.tool_upstream_seconds.series[(tool,)].sum - before
+
+    # Both calls waited on the one 10 ms stubbed search
+    assert asyncio.run(run()) >= 0.018
+    assert len(fake_search) == 1
+
+
+def test_rejected_searches_are_not_timed_as_upstream_requests(fake_search, monkeypatch):
+    breaker = CircuitBreaker()
+    breaker._trip()
+    monkeypatch.setattr(kbeauty_mcp, "upstream_breaker", breaker)
+    series = kbeauty_mcp.upstream_seconds.series.get(())
+    before = series.count if series else 0
+    result = asyncio.run(kbeauty_mcp.search_web_data("etude", "brand"))
+    assert result["error"] == "Search temporarily paused after repeated errors"
+    series = kbeauty_mcp.upstream_seconds.series.get(())
+    assert (series.count if series else 0) == before
+
+
+def test_cache_hits_and_cancellations_are_not_upstream_time_or_errors(fake_search):
+    tool = "get_product_info"
+    arguments = {"brand": "laneige", "include_web": True}
+
+    async def run():
+        await kbeauty_mcp.call_tool(tool, arguments)
+        before = kbeauty_mcp.tool_upstream_seconds.series[(tool,)].sum
+        await kbeauty_mcp.call_tool(tool, arguments)  # served from the cache
+        hit_upstream = kbeauty_mcp.tool_upstream_seconds.series[(tool,)].sum - before
+
+        errors = kbeauty_mcp.tool_calls.values.get((tool, "error"), 0)
+        call = asyncio.create_task(kbeauty_mcp.call_tool(tool, {"brand": "innisfree", "include_web": True}))
+        await asyncio.sleep(0.005)  # inside the stubbed search
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        return hit_upstream, kbeauty_mcp.tool_calls.values.get((tool, "error"), 0) - errors
+
+    assert asyncio.run(run()) == (0, 0)
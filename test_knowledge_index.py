@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""Tests for the curated entity index"""
+
+from data.brands import KBEAUTY_BRANDS
+from data.ingredients import INGREDIENT_DATABASE
+from data.routines import SKINCARE_ROUTINES
+from knowledge_index import KnowledgeIndex, name_variants
+
+INDEX = KnowledgeIndex(KBEAUTY_BRANDS, INGREDIENT_DATABASE, SKINCARE_ROUTINES)
+
+
+def test_name_variants_split_korean_names():
+    assert name_variants("Laneige (라네즈)") == ["laneige (라네즈)", "laneige", "라네즈"]
+
+
+def test_resolves_brands_by_english_and_korean_name():
+    assert INDEX.resolve("설화수", "brand").key == "sulwhasoo"
+    assert INDEX.resolve("  LANEIGE ", "brand").key == "laneige"
+    assert INDEX.resolve("unknown brand") is None
+
+
+def test_resolves_ingredients_and_routines():
+    assert INDEX.resolve("hyaluronic acid", "ingredient").key == "hyaluronic_acid"
+    assert INDEX.resolve("Vitamin B3", "ingredient").key == "niacinamide"
+    assert INDEX.resolve("anti_aging", "routine").key == "anti_aging"
+
+
+def test_finds_entities_in_free_text():
+    found = INDEX.find("Is laneige water sleeping mask ok with retinol?")
+    assert [(r.kind, r.key) for r in found][:2] == [("product", "Water Sleeping Mask"), ("brand", "laneige")]
+    assert ("ingredient", "retinol") in [(r.kind, r.key) for r in found]
+
+
+def test_resolves_partial_product_names():
+    assert INDEX.resolve_product("cosrx", "aha/bha toner").key == "AHA/BHA Clarifying Treatment Toner"
+    assert INDEX.resolve_product("cosrx", "water sleeping mask") is None
+
+
+def test_fuzzy_lookup_tolerates_typos_but_not_other_entities():
+    assert INDEX.lookup("sulwasoo", "brand").key == "sulwhasoo"
+    assert INDEX.lookup("hyaluronic acd", "ingredient").key == "hyaluronic_acid"
+    assert INDEX.lookup("vitamin c", "ingredient") is None
+    assert INDEX.resolve_product("laneige", "water sleping mask").key == "Water Sleeping Mask"
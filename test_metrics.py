@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Tests for the runtime metrics registry"""
+
+import asyncio
+import math
+
+from metrics import MetricsRegistry, WaitTimer
+
+
+def test_counters_and_histograms_render_prometheus_text():
+    registry = MetricsRegistry()
+    calls = registry.counter("calls_total", "Calls", ("tool", "outcome"))
+    seconds = registry.histogram("call_seconds", "Call time", ("tool",), buckets=(0.1, 1.0))
+    registry.callback("in_flight", "Running calls", lambda: 3)
+    calls.inc("search", "ok")
+    calls.inc("search", "ok")
+    calls.inc('odd"name', "error")
+    for value in (0.05, 0.5, 5.0):
+        seconds.observe(value, "search")
+
+    text = registry.render_prometheus()
+    assert "# TYPE calls_total counter" in text
+    assert 'calls_total{tool="search",outcome="ok"} 2' in text
+    assert 'calls_total{tool="odd\\"name",outcome="error"} 1' in text
+    assert 'call_seconds_bucket{tool="search",le="0.1"} 1' in text
+    assert 'call_seconds_bucket{tool="search",le="1"} 2' in text
+    assert 'call_seconds_bucket{tool="search",le="+Inf"} 3' in text
+    assert 'call_seconds_count{tool="search"} 3' in text
+    assert "# TYPE in_flight gauge\nin_flight 3\n" in text
+
+
+def test_histogram_quantiles_are_bucket_bounds():
+    histogram = MetricsRegistry().histogram("h", "", buckets=(1, 2, 4))
+    assert histogram.quantile(0.5) is None
+    for value in (0.5, 1.5, 1.5, 3, 9):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 2
+    assert histogram.quantile(0.8) == 4
+    assert histogram.quantile(0.99) == math.inf
+    assert MetricsRegistry().snapshot() == {}
+
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry(enabled=False)
+    calls = registry.counter("calls_total", "Calls", ("tool",))
+    calls.inc("search")
+    registry.histogram("call_seconds", "Call time").observe(0.2)
+    assert calls.values == {}
+    assert registry.counter("calls_total", "registered twice is fine when off") is calls
+    assert registry.render_prometheus() == "\n"
+
+
+def test_wait_timer_counts_overlapping_waits_once():
+    async def run():
+        timer = WaitTimer()
+
+        async def wait(delay):
+            with timer:
+                await asyncio.sleep(delay)
+
+        await asyncio.gather(wait(0.05), wait(0.05), wait(0.03))
+        await asyncio.sleep(0.05)  # time outside any wait is not counted
+        return timer.total
+
+    assert 0.04 <= asyncio.run(run()) < 0.09
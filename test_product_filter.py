@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Tests for the bitset product filter indexes."""
+
+import random
+
+import pytest
+
+from catalog import Catalog
+from product_filter import ProductIndex, bitset, set_bits
+
+TYPES = ["serum", "toner", "essence", "cream", "sleeping_mask"]
+BENEFITS = ["Pore care", "Hydration", "Brightening", "Anti-aging", "Soothing", "Barrier repair"]
+SKIN_TYPES = ["Oily", "Dry", "Combination", "Sensitive", "Acne-prone", "All"]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    rng = random.Random(7)
+    brands = {f"brand{i}": {"name": f"Brand {i}"} for i in range(12)}
+    rows = [
+        [f"brand{rng.randrange(12)}", f"Product {rng.randrange(10**6):06d}", rng.choice(TYPES),
+         rng.randrange(500, 20000) / 100, rng.sample(BENEFITS, 2), rng.sample(SKIN_TYPES, 2)]
+        for _ in range(3000)
+    ]
+    return Catalog(brands, rows)
+
+
+@pytest.fixture(scope="module")
+def index(catalog):
+    return ProductIndex(catalog)
+
+
+def brute_force(catalog, types=(), skin_types=(), benefits=(), brands=(), min_price=None, max_price=None):
+    matches = []
+    for product_id in range(len(catalog)):
+        product = catalog.product(product_id)
+        skins = {s.lower() for s in product["skin_types"]}
+        if types and product["type"] not in types:
+            continue
+        if skin_types and not skins & ({s.lower() for s in skin_types} | {"all"}):
+            continue
+        if benefits and not any(term in b.lower() for term in benefits for b in product["key_benefits"]):
+            continue
+        if brands and catalog.brand_of(product_id) not in brands:
+            continue
+        if min_price is not None and product["price_usd"] < min_price:
+            continue
+        if max_price is not None and product["price_usd"] > max_price:
+            continue
+        matches.append(product_id)
+    return matches
+
+
+@pytest.mark.parametrize("query", [
+    {"types": ["serum"], "skin_types": ["Oily", "Acne-prone"], "benefits": ["pore"], "max_price": 30},
+    {"benefits": ["hydra", "barrier"], "min_price": 50, "max_price": 120},
+    {"brands": ["brand3", "brand5"], "types": ["toner", "cream"]},
+    {"skin_types": ["Sensitive"]},
+    {"min_price": 199.99},
+    {},
+])
+def test_matches_agree_with_brute_force(catalog, index, query):
+    result = index.filter(**query, limit=len(catalog))
+    expected = brute_force(catalog, **query)
+    assert result.total == len(expected)
+    assert sorted(result.product_ids) == sorted(expected)
+    prices = [catalog.product(product_id)["price_usd"] for product_id in result.product_ids]
+    assert prices == sorted(prices)
+
+
+def test_values_match_case_insensitively(index):
+    assert index.filter(types=["SERUM"]).total == index.filter(types=["serum"]).total > 0
+    assert index.filter(types=["sleeping mask"]).total == index.filter(types=["sleeping_mask"]).total > 0
+    assert index.filter(types=["no such type"]).total == 0
+
+
+def test_pages_in_both_price_orders(index):
+    everything = index.filter(skin_types=["Dry"], limit=10**6).product_ids
+    assert index.filter(skin_types=["Dry"], limit=7, offset=300).product_ids == everything[300:307]
+    descending = index.filter(skin_types=["Dry"], sort="price_desc", limit=7, offset=300).product_ids
+    assert descending == everything[::-1][300:307]
+    assert index.filter(skin_types=["Dry"], offset=len(everything)).product_ids == []
+
+
+@pytest.mark.parametrize("query", [{"skin_types": ["Dry"]}, {"types": ["serum"], "benefits": ["pore"], "max_price": 20}])
+def test_name_order_for_dense_and_sparse_matches(catalog, index, query):
+    matches = index.filter(**query, limit=10**6).product_ids
+    by_name = sorted(matches, key=lambda product_id: catalog.product(product_id)["name"].casefold())
+    assert index.filter(**query, sort="name", limit=5, offset=3).product_ids == by_name[3:8]
+
+
+def test_unknown_sort_is_rejected(index):
+    with pytest.raises(ValueError):
+        index.select(index.match(), sort="rating")
+
+
+def test_bitset_round_trip():
+    positions = [0, 7, 8, 63, 64, 999]
+    mask = bitset(positions, 1000)
+    assert list(set_bits(mask)) == positions
+    assert list(set_bits(mask, descending=True)) == positions[::-1]
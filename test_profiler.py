@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Tests for the slow tool call profiler"""
+
+import asyncio
+import json
+import time
+
+from profiler import SlowCallProfiler, redact
+
+
+def busy_render(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+async def slow_call(profiler, arguments):
+    with profiler.watch("analyze_skin_photo", arguments):
+        await asyncio.sleep(0.08)
+        busy_render(0.12)
+
+
+def test_slow_call_saves_redacted_profile(tmp_path):
+    profiler = SlowCallProfiler(threshold=0.05, interval=0.002, directory=str(tmp_path))
+    arguments = {"image_data": "A" * 5000, "skin_type": "oily"}
+    try:
+        asyncio.run(slow_call(profiler, arguments))
+    finally:
+        profiler.close()
+
+    [path] = tmp_path.glob("*.json")
+    report = json.loads(path.read_text())
+    assert "analyze_skin_photo" in path.name
+    assert report["arguments"] == {"image_data": "<redacted 5000 chars>", "skin_type": "oily"}
+    assert "AAAA" not in path.read_text()
+    assert report["elapsed_ms"] >= 200
+    assert report["profiled_from_ms"] >= 50
+    assert report["running_samples"] > 0
+    functions = {entry["function"]: entry for entry in report["functions"]}
+    # The busy loop blocks the event loop, and is still caught by the sampler thread
+    assert functions["busy_render"]["wall_ms"] > 50
+    if report["task_cpu_ms"] is not None:
+        assert functions["busy_render"]["cpu_ms"] > 0
+    assert any(stack.endswith("slow_call;busy_render") for stack in report["stacks"])
+
+
+def test_fast_calls_save_nothing(tmp_path):
+    profiler = SlowCallProfiler(threshold=1.0, interval=0.002, directory=str(tmp_path))
+
+    async def run():
+        for _ in range(20):
+            with profiler.watch("search_products", {"query": "cica"}):
+                await asyncio.sleep(0)
+
+    try:
+        asyncio.run(run())
+        assert profiler._calls == []
+    finally:
+        profiler.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_calls_do_not_wait_for_a_sample_in_progress(tmp_path):
+    profiler = SlowCallProfiler(threshold=0.01, interval=0.002, directory=str(tmp_path))
+
+    async def run():
+        slow = asyncio.create_task(slow_call(profiler, {}))
+        await asyncio.sleep(0.03)  # the slow call is armed and being sampled
+        with profiler._sampling:  # stands in for a long stack walk
+            started = time.perf_counter()
+            for _ in range(20):
+                with profiler.watch("search_products", {}):
+                    await asyncio.sleep(0)
+            waited = time.perf_counter() - started
+        await slow
+        return waited
+
+    try:
+        assert asyncio.run(run()) < 0.05
+    finally:
+        profiler.close()
+
+
+def test_disabled_profiler_starts_no_thread(tmp_path):
+    profiler = SlowCallProfiler(threshold=0, directory=str(tmp_path))
+
+    async def run():
+        with profiler.watch("search_products", {}):
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert profiler._thread is None
+
+
+def test_profile_directory_keeps_newest_files(tmp_path):
+    profiler = SlowCallProfiler(threshold=0.02, interval=0.002, directory=str(tmp_path), keep=2)
+
+    async def run():
+        for _ in range(3):
+            with profiler.watch("compare_products", {}):
+                await asyncio.sleep(0.04)
+
+    try:
+        asyncio.run(run())
+    finally:
+        profiler.close()
+    sequence = sorted(path.stem.rsplit("-", 1)[1] for path in tmp_path.glob("*.json"))
+    assert sequence == ["1", "2"]
+
+
+def test_redact_reaches_nested_batch_arguments():
+    arguments = {"calls": [{"name": "analyze_skin_photo", "arguments": {"image_data": "xyz", "zone": "t"}}]}
+    assert redact(arguments) == {
+        "calls": [{"name": "analyze_skin_photo", "arguments": {"image_data": "<redacted 3 chars>", "zone": "t"}}]
+    }
+    assert arguments["calls"][0]["arguments"]["image_data"] == "xyz"
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Tests for deadline budgets and the upstream circuit breaker"""
+
+import asyncio
+
+import pytest
+
+from resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    deadline_scope,
+    remaining_budget,
+    within_budget,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_nested_deadlines_only_shorten():
+    assert remaining_budget() is None
+    with deadline_scope(5):
+        with deadline_scope(60):
+            assert remaining_budget() <= 5
+        with deadline_scope(1):
+            assert remaining_budget() <= 1
+    assert remaining_budget() is None
+
+
+def test_within_budget_raises_when_time_runs_out():
+    async def run():
+        with deadline_scope(0.05):
+            with pytest.raises(DeadlineExceeded):
+                await within_budget(asyncio.sleep(1))
+        assert await within_budget(asyncio.sleep(0, result="ok")) == "ok"
+
+    asyncio.run(run())
+
+
+def test_breaker_opens_on_errors_and_recovers_through_half_open():
+    async def run():
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_rate=0.5, window=4, min_calls=4, open_seconds=10, clock=clock)
+
+        async def ok():
+            return "ok"
+
+        async def fail():
+            raise RuntimeError("503")
+
+        for fn in (ok, fail, ok, fail):
+            try:
+                await breaker.call(fn)
+            except RuntimeError:
+                pass
+        assert breaker.state == CircuitBreaker.OPEN
+
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(ok)
+        assert breaker.rejected == 1
+
+        clock.now += 10
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(RuntimeError):
+            await breaker.call(fail)
+        assert breaker.state == CircuitBreaker.OPEN
+
+        clock.now += 10
+        assert await breaker.call(ok) == "ok"
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(run())
+
+
+def test_breaker_counts_slow_calls_as_failures():
+    async def run():
+        clock = FakeClock()
+        breaker = CircuitBreaker(slow_call_seconds=2, window=2, min_calls=2, clock=clock)
+
+        async def slow():
+            clock.now += 5
+            return "late"
+
+        await breaker.call(slow)
+        await breaker.call(slow)
+        assert breaker.state == CircuitBreaker.OPEN
+
+    asyncio.run(run())
+
+
+def test_breaker_trips_on_calls_cancelled_past_the_slow_threshold():
+    async def run():
+        clock = FakeClock()
+        breaker = CircuitBreaker(slow_call_seconds=2, window=2, min_calls=2, clock=clock)
+
+        async def hangs():
+            clock.now += 5
+            await asyncio.sleep(10)
+
+        for _ in range(2):
+            with pytest.raises(DeadlineExceeded):
+                with deadline_scope(0.01):
+                    await within_budget(breaker.call(hangs))
+        assert breaker.state == CircuitBreaker.OPEN
+
+        # A caller leaving before the threshold is not held against upstream
+        fresh = CircuitBreaker(slow_call_seconds=2, window=2, min_calls=2, clock=FakeClock())
+        for _ in range(2):
+            with pytest.raises(DeadlineExceeded):
+                with deadline_scope(0.01):
+                    await within_budget(fresh.call(lambda: asyncio.sleep(10)))
+        assert fresh.state == CircuitBreaker.CLOSED and fresh.stats()["recent_failures"] == 0
+
+    asyncio.run(run())
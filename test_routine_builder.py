@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Tests for the constraint-based routine builder."""
+
+import itertools
+import random
+
+import pytest
+
+from catalog import Catalog
+from data.ingredient_aliases import INGREDIENT_ALIASES
+from data.ingredients import INGREDIENT_DATABASE
+from ingredient_graph import IngredientGraph
+from product_filter import ProductIndex
+from routine_builder import (
+    ALL_SKIN_SCORE, CONCERN_SCORE, COVERAGE_SCORE, EXACT_SKIN_SCORE, RoutineBuilder, RoutineStep, routine_steps,
+)
+
+GRAPH = IngredientGraph(INGREDIENT_DATABASE, INGREDIENT_ALIASES)
+TYPES = ["cleanser", "toner", "serum", "sleeping_mask"]
+ACTIVES = ["Retinol", "AHA", "BHA", "Vitamin C", "Niacinamide", "Snail", ""]
+BENEFITS = ["Pore care", "Hydration", "Brightening", "Anti-aging", "Soothing"]
+SKIN_TYPES = ["Oily", "Dry", "Sensitive", "All"]
+STEPS = routine_steps({"steps": [
+    {"step": 1, "type": "cleanser", "description": "Oil cleanser"},
+    {"step": 2, "type": "cleanser", "description": "Water-based cleanser"},
+    {"step": 3, "type": "toner", "description": "Exfoliating toner (AM)"},
+    {"step": 4, "type": "serum", "description": "Treatment serum"},
+    {"step": 5, "type": "sleeping_mask", "description": "Overnight mask (PM)"},
+]})
+CONCERNS = [("acne", ("pore",)), ("aging", ("aging",)), ("dryness", ("hydrat",))]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    rng = random.Random(3)
+    rows = [
+        ["brand", f"{rng.choice(ACTIVES)} Product {i}", TYPES[i % len(TYPES)], rng.randrange(500, 6000) / 100,
+         rng.sample(BENEFITS, 2), rng.sample(SKIN_TYPES, 2)]
+        for i in range(28)
+    ]
+    return Catalog({"brand": {"name": "Brand"}}, rows)
+
+
+@pytest.fixture(scope="module")
+def builder(catalog):
+    return RoutineBuilder(ProductIndex(catalog), GRAPH)
+
+
+def brute_force(catalog, steps, skin_type, concerns, budget, top_k):
+    def score(product_id):
+        product = catalog.product(product_id)
+        skins = {skin.lower() for skin in product["skin_types"]}
+        if skin_type == "normal":
+            points = ALL_SKIN_SCORE if "all" in skins else 0
+        elif skin_type in skins:
+            points = EXACT_SKIN_SCORE
+        elif "all" in skins:
+            points = ALL_SKIN_SCORE
+        else:
+            return None
+        return points + CONCERN_SCORE * len(covers(product_id))
+
+    def covers(product_id):
+        benefits = [benefit.lower() for benefit in catalog.product(product_id)["key_benefits"]]
+        return {name for name, terms in concerns if any(term in b for term in terms for b in benefits)}
+
+    def clash(first, second):
+        names = [" ".join([catalog.product(p)["name"], *catalog.product(p)["key_benefits"]]) for p in (first, second)]
+        keys = [GRAPH.resolve(name) for name in names]
+        return bool(GRAPH.bits(keys[0]) & GRAPH.conflict_bits(keys[1]))
+
+    options = [[p for p in range(len(catalog)) if catalog.product(p)["type"] == step.type and score(p) is not None]
+               for step in steps]
+    plans, seen = [], set()
+    for picks in itertools.product(*options):
+        # The two cleanser steps are interchangeable, so a swapped pair is the same routine
+        if len(set(picks)) < len(picks) or frozenset(picks) in seen:
+            continue
+        seen.add(frozenset(picks))
+        price = sum(round(catalog.product(p)["price_usd"] * 100) for p in picks)
+        if budget is not None and price > budget * 100:
+            continue
+        if any(set(a.slots) & set(b.slots) and clash(p, q)
+               for (a, p), (b, q) in itertools.combinations(zip(steps, picks), 2)):
+            continue
+        covered = set().union(*map(covers, picks))
+        plans.append((sum(map(score, picks)) + COVERAGE_SCORE * len(covered), price))
+    plans.sort(key=lambda plan: (-plan[0], plan[1]))
+    return plans[:top_k]
+
+
+@pytest.mark.parametrize("skin_type, concerns, budget", [
+    ("oily", CONCERNS, None),
+    ("dry", CONCERNS[1:], 90),
+    ("normal", CONCERNS, 120),
+    ("sensitive", [], 60),
+])
+def test_matches_brute_force(catalog, builder, skin_type, concerns, budget):
+    result = builder.build(STEPS, skin_type, concerns, budget, top_k=4)
+    expected = brute_force(catalog, STEPS, skin_type, concerns, budget, 4)
+    assert [(plan.score, plan.price_cents) for plan in result.plans] == expected
+    for plan in result.plans:
+        assert [step for step, _ in plan.picks] == STEPS
+        assert len({product_id for _, product_id in plan.picks}) == len(STEPS)
+
+
+def test_conflicting_actives_are_kept_apart_unless_split_by_slot():
+    rows = [
+        ["brand", "AHA Toner", "toner", 10.0, ["Pore care"], ["All"]],
+        ["brand", "Retinol Mask", "sleeping_mask", 20.0, ["Anti-aging"], ["All"]],
+        ["brand", "Plain Mask", "sleeping_mask", 30.0, ["Hydration"], ["All"]],
+    ]
+    builder = RoutineBuilder(ProductIndex(Catalog({"brand": {"name": "Brand"}}, rows)), GRAPH)
+    toner, mask = (RoutineStep(1, "toner", "Toner", ("AM", "PM")), RoutineStep(2, "sleeping_mask", "Mask", ("PM",)))
+    assert [pick for _, pick in builder.build([toner, mask]).plans[0].picks] == [0, 2]
+    am_toner = toner._replace(slots=("AM",))
+    assert [pick for _, pick in builder.build([am_toner, mask]).plans[0].picks] == [0, 1]
+
+
+def test_reports_unfilled_steps_and_budget_misses(builder):
+    eye_cream = RoutineStep(9, "eye_cream", "Eye cream", ("AM", "PM"))
+    result = builder.build([*STEPS, eye_cream], "oily")
+    assert result.unfilled == [eye_cream]
+    assert result.plans
+    assert builder.build(STEPS, "oily", budget=10).plans == []
+
+
+def test_twin_step_without_a_second_product_is_unfilled():
+    rows = [
+        ["brand", "Gel Cleanser", "cleanser", 12.0, ["Hydration"], ["All"]],
+        ["brand", "Toner", "toner", 15.0, ["Soothing"], ["All"]],
+    ]
+    builder = RoutineBuilder(ProductIndex(Catalog({"brand": {"name": "Brand"}}, rows)), GRAPH)
+    oil, water, toner = (
+        RoutineStep(1, "cleanser", "Oil cleanser", ("AM", "PM")),
+        RoutineStep(2, "cleanser", "Water-based cleanser", ("AM", "PM")),
+        RoutineStep(3, "toner", "Toner", ("AM", "PM")),
+    )
+    result = builder.build([oil, water, toner])
+    assert result.unfilled == [water]
+    assert [(step, pick) for step, pick in result.plans[0].picks] == [(oil, 0), (toner, 1)]
+
+
+def test_routine_steps_read_slot_notes():
+    steps = routine_steps({"steps": [
+        {"step": 1, "type": "sunscreen", "description": "SPF 30+ (AM only)"},
+        {"step": 2, "type": "sleeping_mask", "description": "Overnight mask (PM)"},
+        {"step": 3, "type": "toner", "description": "Hydrating toner"},
+    ]})
+    assert [step.slots for step in steps] == [("AM",), ("PM",), ("AM", "PM")]
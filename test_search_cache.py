@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Tests for the search result cache"""
+
+import asyncio
+import sqlite3
+
+import pytest
+
+from search_cache import CacheBackend, CacheEntry, MemoryCache, SearchCache, SqliteCache, TieredCache, make_cache_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_key_normalizes_case_and_spacing():
+    assert make_cache_key("  COSRX   snail ", "brand") == make_cache_key("cosrx snail", "brand")
+    assert make_cache_key("cosrx", "brand") != make_cache_key("cosrx", "product")
+
+
+def test_incomplete_backend_fails_on_creation():
+    class GetOnly(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnly()
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = SearchCache(MemoryCache(max_entries=2))
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.backend.get("a")  # touch "a" so "b" becomes the eviction candidate
+    cache.put("c", 3)
+    assert cache.backend.get("b") is None
+    assert cache.backend.get("a").value == 1
+    assert len(cache.backend) == 2
+
+
+def test_stale_entry_is_served_while_refreshing():
+    async def run():
+        clock = FakeClock()
+        cache = SearchCache(MemoryCache(), ttl=10, max_stale=100, clock=clock)
+        calls = []
+
+        async def fetch():
+            calls.append(clock.now)
+            return f"value@{clock.now}"
+
+        assert await cache.get_or_fetch("k", fetch) == "value@1000.0"
+        assert await cache.get_or_fetch("k", fetch) == "value@1000.0"
+        assert cache.hits == 1 and len(calls) == 1
+
+        clock.now += 20  # past TTL but within max staleness
+        assert await cache.get_or_fetch("k", fetch) == "value@1000.0"
+        await asyncio.sleep(0)  # let the background refresh run
+        assert await cache.get_or_fetch("k", fetch) == "value@1020.0"
+        assert cache.stale_hits == 1
+
+        clock.now += 1000  # beyond max staleness: treated as a miss
+        assert await cache.get_or_fetch("k", fetch) == "value@2020.0"
+        assert cache.misses == 2
+        await cache.close()
+
+    asyncio.run(run())
+
+
+def test_fetch_errors_are_not_cached():
+    async def run():
+        cache = SearchCache(MemoryCache())
+
+        async def failing():
+            raise RuntimeError("upstream down")
+
+        try:
+            await cache.get_or_fetch("k", failing)
+        except RuntimeError:
+            pass
+        assert cache.backend.get("k") is None
+
+    asyncio.run(run())
+
+
+def test_sqlite_cache_survives_reopen(tmp_path):
+    path = str(tmp_path / "cache" / "search.sqlite3")
+    first = SearchCache(SqliteCache(path))
+    first.put("brand:cosrx", {"abstract": "COSRX", "related": ["Snail"]})
+    first.backend.close()
+
+    reopened = SqliteCache(path)
+    entry = reopened.get("brand:cosrx")
+    assert entry.value == {"abstract": "COSRX", "related": ["Snail"]}
+    assert entry.fresh_until > entry.stored_at
+    assert reopened.get("brand:missing") is None
+    reopened.close()
+
+
+def test_sqlite_cache_compaction_bounds_size(tmp_path):
+    backend = SqliteCache(str(tmp_path / "search.sqlite3"), max_entries=3, compact_every=5)
+    cache = SearchCache(backend, ttl=10, max_stale=10)
+    for i in range(5):
+        cache.put(f"k{i}", i)
+    assert len(backend) == 3
+    backend.set("expired", CacheEntry("old", 0, 1, 2))
+    backend.compact()
+    assert backend.get("expired") is None
+    backend.close()
+
+
+def test_locked_sqlite_file_does_not_stall_the_loop(tmp_path):
+    path = str(tmp_path / "search.sqlite3")
+    cache = SearchCache(SqliteCache(path))
+    cache.put("warm", 1)
+    locker = sqlite3.connect(path, isolation_level=None)
+    locker.execute("BEGIN EXCLUSIVE")
+
+    async def fetch():
+        return "fresh"
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        # The write waits out the 1 s busy timeout, then is dropped with a warning
+        assert await cache.get_or_fetch("k", fetch) == "fresh"
+        ticker.cancel()
+        return ticks
+
+    try:
+        assert asyncio.run(run()) >= 50
+    finally:
+        locker.execute("ROLLBACK")
+        locker.close()
+        cache.backend.close()
+
+
+def test_unusable_sqlite_file_is_logged_not_raised(tmp_path):
+    broken = SqliteCache(str(tmp_path))  # a directory, not a database
+    broken.clear()
+    assert len(broken) == 0
+    assert broken.get("k") is None
+
+
+def test_tiered_cache_promotes_disk_hits(tmp_path):
+    disk = SqliteCache(str(tmp_path / "search.sqlite3"))
+    SearchCache(disk).put("k", "v")
+    tiered = TieredCache(MemoryCache(), disk)
+    assert tiered.get("k").value == "v"
+    assert tiered.memory.get("k").value == "v"
+    tiered.close()
+
+
+def test_from_env_can_disable_persistence(monkeypatch, tmp_path):
+    monkeypatch.setenv("KBEAUTY_CACHE_PATH", "")
+    assert isinstance(SearchCache.from_env().backend, MemoryCache)
+    monkeypatch.setenv("KBEAUTY_CACHE_PATH", str(tmp_path / "c.sqlite3"))
+    assert isinstance(SearchCache.from_env().backend, TieredCache)
+
+
+def test_workers_sharing_a_file_fetch_each_query_once(tmp_path):
+    # Two caches on one SQLite file stand in for two server worker processes
+    path = str(tmp_path / "shared.sqlite3")
+    workers = [SearchCache(TieredCache(MemoryCache(), SqliteCache(path))) for _ in range(2)]
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return {"abstract": "shared"}
+
+    async def run():
+        first = await asyncio.gather(*(worker.get_or_fetch("k", fetch) for worker in workers))
+        again = await workers[1].get_or_fetch("k", fetch)
+        return first, again
+
+    first, again = asyncio.run(run())
+    assert first == [{"abstract": "shared"}] * 2 and again == {"abstract": "shared"}
+    assert len(calls) == 1
+    # Either worker may win the lease; the other waits for its result
+    assert sorted(worker.misses for worker in workers) == [0, 1]
+    assert sum(worker.hits for worker in workers) == 2
+    for worker in workers:
+        worker.backend.close()
+
+
+def test_expired_or_released_leases_can_be_claimed_again(tmp_path):
+    disk = SqliteCache(str(tmp_path / "leases.sqlite3"))
+    assert disk.claim("k", 60)
+    assert not disk.claim("k", 60)
+    disk.release("k")
+    assert disk.claim("k", -1)  # already expired
+    assert disk.claim("k", 60)
+    assert MemoryCache().claim("k", 60) and MemoryCache().claim("k", 60)
+    disk.close()
+
+
+def test_waiter_past_the_deadline_leaves_the_holders_lease(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    holder = SqliteCache(path)
+    assert holder.claim("k", 60)  # another worker's fetch that outlives the wait
+    waiter = SearchCache(SqliteCache(path), lease_timeout=0.1)
+
+    async def fetch():
+        return "fetched anyway"
+
+    assert asyncio.run(waiter.get_or_fetch("k", fetch)) == "fetched anyway"
+    assert not holder.claim("k", 60)
+    holder.close()
+    waiter.backend.close()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""Tests for the Aho-Corasick term matcher"""
+
+from term_matcher import TermMatch, TermMatcher
+
+
+def test_finds_all_kinds_in_one_pass():
+    matcher = TermMatcher.from_groups({
+        "major_brands": ["cosrx", "beauty of joseon"],
+        "product_categories": ["serum", "eye cream", "cream"],
+        "key_ingredients": ["ginseng", "red ginseng"],
+    })
+    matches = matcher.find_all("Beauty of Joseon red ginseng eye cream vs COSRX serum")
+    assert TermMatch("beauty of joseon", "major_brands", 0, 16) in matches
+    assert [m.term for m in matches if m.kind == "key_ingredients"] == ["red ginseng", "ginseng"]
+    assert {m.term for m in matches if m.kind == "product_categories"} == {"eye cream", "cream", "serum"}
+    assert matcher.terms_by_kind("cosrx cosrx")["major_brands"] == ["cosrx"]
+
+
+def test_respects_word_boundaries():
+    matcher = TermMatcher.from_groups({"major_brands": ["hera", "dr.g", "rom&nd"]})
+    assert matcher.find_all("heat therapy mask") == []
+    assert [m.term for m in matcher.find_all("HERA cushion")] == ["hera"]
+    assert [m.term for m in matcher.find_all("dr.g and rom&nd tints")] == ["dr.g", "rom&nd"]
+
+
+def test_hangul_terms_match_before_particles():
+    matcher = TermMatcher.from_groups({"major_brands": ["설화수"]})
+    assert [m.term for m in matcher.find_all("설화수는 어때?")] == ["설화수"]
+
+
+def test_compiling_again_does_not_duplicate_matches():
+    matcher = TermMatcher([("ginseng", "key_ingredients"), ("red ginseng", "key_ingredients")])
+    matcher.compile()
+    matcher.add("snail", "key_ingredients")
+    matcher.compile()
+    assert [m.term for m in matcher.find_all("red ginseng snail")] == ["red ginseng", "ginseng", "snail"]
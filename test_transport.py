@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Tests for the network transports"""
+
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+import uvicorn
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+import kbeauty_mcp
+from transport import HttpServeConfig, create_http_app
+
+
+@asynccontextmanager
+async def no_resources():
+    yield
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def running(transport, warm_up=None, metrics_text=None):
+    port = free_port()
+    app = create_http_app(kbeauty_mcp.app, transport, no_resources, warm_up, metrics_text)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await task
+
+
+def test_http_serves_concurrent_sessions():
+    async def session(url):
+        async with streamablehttp_client(f"{url}/mcp") as (read_stream, write_stream, _):
+            async with ClientSession(read_stream, write_stream) as client:
+                await client.initialize()
+                tools = await client.list_tools()
+                result = await client.call_tool("filter_products", {"types": ["serum"], "limit": 1})
+                return len(tools.tools), result.content[0].text
+
+    async def run():
+        async with running("http", metrics_text=kbeauty_mcp.metrics.render_prometheus) as url:
+            async with httpx.AsyncClient() as client:
+                health = await client.get(f"{url}/healthz")
+                results = await asyncio.gather(*(session(url) for _ in range(3)))
+                scrape = await client.get(f"{url}/metrics")
+        assert health.json() == {"status": "ok", "transport": "http"}
+        assert scrape.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert 'kbeauty_tool_calls_total{tool="filter_products",outcome="ok"}' in scrape.text
+        assert len(set(results)) == 1
+        assert results[0][0] == len(kbeauty_mcp.tool_registry())
+        assert "serum" in results[0][1].lower()
+
+    asyncio.run(run())
+
+
+def test_readyz_waits_for_warm_up():
+    warmed = threading.Event()
+
+    async def run():
+        async with running("http", warm_up=warmed.wait) as url:
+            async with httpx.AsyncClient() as client:
+                assert (await client.get(f"{url}/healthz")).status_code == 200
+                starting = await client.get(f"{url}/readyz")
+                warmed.set()
+                for _ in range(100):
+                    ready = await client.get(f"{url}/readyz")
+                    if ready.status_code == 200:
+                        break
+                    await asyncio.sleep(0.01)
+        assert starting.status_code == 503
+        assert ready.json()["status"] == "ready"
+
+    asyncio.run(run())
+
+
+def test_workers_share_one_port(tmp_path):
+    port = free_port()
+    env = {**os.environ, "KBEAUTY_CACHE_PATH": str(tmp_path / "cache.sqlite3")}
+    server = subprocess.Popen(
+        [sys.executable, "kbeauty_mcp.py", "--transport", "http", "--port", str(port), "--workers", "2"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        pids = set()
+        deadline = time.monotonic() + 30
+        while len(pids) < 2 and time.monotonic() < deadline:
+            try:
+                # A fresh connection each time, so the kernel can hand it to either worker
+                response = httpx.get(f"http://127.0.0.1:{port}/readyz", headers={"Connection": "close"})
+                if response.status_code == 200:
+                    pids.add(response.json()["pid"])
+            except httpx.TransportError:
+                time.sleep(0.1)
+        assert len(pids) == 2
+        assert server.pid not in pids
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
+
+
+def test_sse_app_exposes_stream_and_message_routes():
+    app = create_http_app(kbeauty_mcp.app, "sse", no_resources)
+    assert {route.path for route in app.routes} == {"/healthz", "/readyz", "/sse", "/messages"}
+    with pytest.raises(ValueError):
+        create_http_app(kbeauty_mcp.app, "stdio", no_resources)
+
+
+def test_serve_config_reads_environment(monkeypatch):
+    monkeypatch.setenv("KBEAUTY_SERVE_PORT", "9100")
+    monkeypatch.setenv("KBEAUTY_SERVE_MAX_CONNECTIONS", "50")
+    config = HttpServeConfig.from_env()
+    assert (config.host, config.port, config.max_connections) == ("127.0.0.1", 9100, 50)
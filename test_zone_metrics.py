@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Tests for the vectorized per-zone skin metrics."""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+from PIL import Image, ImageDraw
+
+from skin_analysis import _concerns
+from zone_metrics import FACE_SIZE, analyze_zones, box_blur, zone_masks
+
+SKIN = (210, 160, 140)
+
+
+def face(*shapes):
+    """A plain skin-toned portrait with (fill, box-as-fractions) patches drawn on it."""
+    image = Image.new("RGB", FACE_SIZE, SKIN)
+    draw = ImageDraw.Draw(image)
+    width, height = FACE_SIZE
+    for fill, (top, bottom, left, right) in shapes:
+        draw.rectangle([left * width, top * height, right * width, bottom * height], fill=fill)
+    return image
+
+
+def test_box_blur_matches_naive_mean():
+    plane = np.random.default_rng(1).random((9, 7)).astype(np.float32)
+    blurred = box_blur(plane, 1)
+    for y in range(9):
+        for x in range(7):
+            window = plane[max(0, y - 1):y + 2, max(0, x - 1):x + 2]
+            assert blurred[y, x] == pytest.approx(window.mean(), abs=1e-5)
+
+
+def test_zone_masks_do_not_overlap():
+    masks = list(zone_masks().values())
+    assert sum(mask.sum() for mask in masks) == np.logical_or.reduce(masks).sum()
+
+
+def test_plain_skin_tone_has_no_issues():
+    zones, metrics = analyze_zones(face())
+    assert all(not zone["issues"] for zone in zones.values())
+    assert metrics["redness"] < 0.16
+
+
+def test_shiny_forehead_reads_as_combination():
+    zones, metrics = analyze_zones(face(((250, 250, 248), (0.12, 0.2, 0.35, 0.65))))
+    assert "oiliness" in zones["t_zone"]["issues"]
+    assert zones["cheek_area"]["shine"] == 0
+    assert _concerns(zones, metrics)[0] == "combination"
+
+
+def test_dark_cheek_spots_read_as_pigmentation():
+    spots = [((120, 85, 70), (0.55, 0.58, left, left + 0.04)) for left in (0.18, 0.26, 0.68, 0.76)]
+    zones, _ = analyze_zones(face(*spots))
+    assert "pigmentation" in zones["cheek_area"]["issues"]
+    assert "pigmentation" not in zones["mouth_area"]["issues"]
+
+
+def test_shadowed_under_eyes_read_as_dark_circles():
+    zones, _ = analyze_zones(face(((140, 100, 95), (0.4, 0.47, 0.2, 0.4)), ((140, 100, 95), (0.4, 0.47, 0.6, 0.8))))
+    assert zones["eye_area"]["issues"] == ["dark circles"]
@@ -0,0 +1,201 @@
+"""
+Network transports for the MCP server.
+
+stdio (the default) serves one client per process. The network modes let
+one warm process, with its caches and indexes already loaded, serve many
+concurrent sessions:
+
+* ``http``: MCP streamable HTTP at ``/mcp``
+* ``sse``:  the older HTTP+SSE transport, event stream at ``/sse`` and
+  client messages posted to ``/messages/``
+
+Both modes also answer ``GET /healthz`` for liveness probes and
+``GET /readyz``, which turns 200 only once the worker has built its
+indexes, so a load balancer never routes a request to a cold worker.
+When runtime metrics are on, ``GET /metrics`` serves them in the
+Prometheus text format; with several workers each scrape reports the
+worker that answered it.
+Keep-alive, the connection cap and graceful shutdown are handled by
+uvicorn; when the cap is reached new connections get a 503 straight away
+instead of queueing inside the process.
+
+With ``workers > 1`` uvicorn forks that many processes accepting on one
+listening socket, each building the app from an import string, so CPU
+heavy calls (photo analysis, large renders) spread over the cores.
+
+The web stack is imported only when a network mode starts.
+"""
+
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, AsyncContextManager, Callable, Dict, Optional
+
+from config import env_float, env_int, env_str
+
+if TYPE_CHECKING:
+    from mcp.server import Server
+    from starlette.applications import Starlette
+
+logger = logging.getLogger(__name__)
+
+TRANSPORTS = ("stdio", "http", "sse")
+
+
+@dataclass
+class HttpServeConfig:
+    """Listener, keep-alive and shutdown settings for the network transports."""
+
+    host: str = "127.0.0.1"        # bind address; use 0.0.0.0 to serve a whole network
+    port: int = 8000
+    keepalive_timeout: float = 5.0  # seconds an idle client connection stays open
+    max_connections: int = 200      # open connections + requests before answering 503
+    shutdown_timeout: float = 10.0  # seconds in-flight requests get to finish on SIGTERM
+    backlog: int = 2048             # pending TCP connections the kernel queues
+    workers: int = 1                # processes accepting on the listening socket
+
+    @classmethod
+    def from_env(cls) -> "HttpServeConfig":
+        """Build a config from ``KBEAUTY_SERVE_*`` environment variables."""
+        return cls(
+            host=env_str("KBEAUTY_SERVE_HOST", cls.host),
+            port=env_int("KBEAUTY_SERVE_PORT", cls.port),
+            keepalive_timeout=env_float("KBEAUTY_SERVE_KEEPALIVE", cls.keepalive_timeout),
+            max_connections=env_int("KBEAUTY_SERVE_MAX_CONNECTIONS", cls.max_connections),
+            shutdown_timeout=env_float("KBEAUTY_SERVE_SHUTDOWN_TIMEOUT", cls.shutdown_timeout),
+            backlog=env_int("KBEAUTY_SERVE_BACKLOG", cls.backlog),
+            workers=env_int("KBEAUTY_SERVE_WORKERS", cls.workers),
+        )
+
+    def uvicorn_options(self) -> Dict[str, Any]:
+        """Keyword arguments for ``uvicorn.Config`` / ``uvicorn.run``."""
+        return {
+            "host": self.host,
+            "port": self.port,
+            "timeout_keep_alive": self.keepalive_timeout,
+            "limit_concurrency": self.max_connections,
+            "timeout_graceful_shutdown": self.shutdown_timeout,
+            "backlog": self.backlog,
+        }
+
+
+class _StreamableHttpEndpoint:
+    """ASGI endpoint handing every ``/mcp`` request to the session manager."""
+
+    def __init__(self, manager: Any):
+        self.manager = manager
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.manager.handle_request(scope, receive, send)
+
+
+def create_http_app(
+    server: "Server",
+    transport: str,
+    resources: Callable[[], AsyncContextManager[Any]],
+    warm_up: Optional[Callable[[], None]] = None,
+    metrics_text: Optional[Callable[[], str]] = None,
+) -> "Starlette":
+    """ASGI app serving ``server`` over ``transport`` ("http" or "sse").
+
+    ``resources`` is entered once for the app lifetime, so every session
+    shares the same HTTP pool, caches and worker threads. ``warm_up`` runs
+    in a thread after startup; ``/readyz`` reports ready once it finishes.
+    ``metrics_text`` renders the body of ``/metrics``, which is only served
+    when it is given.
+    """
+    from contextlib import AsyncExitStack, asynccontextmanager
+
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, PlainTextResponse, Response
+    from starlette.routing import Mount, Route
+
+    ready = asyncio.Event() if warm_up else None
+
+    async def healthz(request):
+        return JSONResponse({"status": "ok", "transport": transport})
+
+    async def readyz(request):
+        if ready is not None and not ready.is_set():
+            return JSONResponse({"status": "starting", "pid": os.getpid()}, status_code=503)
+        return JSONResponse({"status": "ready", "pid": os.getpid()})
+
+    async def prometheus(request):
+        return PlainTextResponse(metrics_text(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    routes = [Route("/healthz", endpoint=healthz), Route("/readyz", endpoint=readyz)]
+    if metrics_text is not None:
+        routes.append(Route("/metrics", endpoint=prometheus))
+    contexts = [resources]
+
+    if transport == "http":
+        from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+
+        manager = StreamableHTTPSessionManager(app=server)
+        routes.append(Route("/mcp", endpoint=_StreamableHttpEndpoint(manager)))
+        contexts.append(manager.run)
+    elif transport == "sse":
+        from mcp.server.sse import SseServerTransport
+
+        sse = SseServerTransport("/messages/")
+
+        async def handle_sse(request):
+            async with sse.connect_sse(request.scope, request.receive, request._send) as (read_stream, write_stream):
+                await server.run(read_stream, write_stream, server.create_initialization_options())
+            return Response()
+
+        routes += [Route("/sse", endpoint=handle_sse), Mount("/messages/", app=sse.handle_post_message)]
+    else:
+        raise ValueError(f"Unsupported network transport: {transport!r}")
+
+    async def warm():
+        try:
+            await asyncio.to_thread(warm_up)
+        except Exception:
+            # Serve anyway: every index is also built on first use
+            logger.exception("Warm-up failed")
+        ready.set()
+
+    @asynccontextmanager
+    async def lifespan(app):
+        async with AsyncExitStack() as stack:
+            for context in contexts:
+                await stack.enter_async_context(context())
+            # Warm up in the background so liveness probes answer while the indexes build
+            warming = asyncio.create_task(warm()) if warm_up else None
+            try:
+                yield
+            finally:
+                if warming is not None:
+                    warming.cancel()
+
+    return Starlette(routes=routes, lifespan=lifespan)
+
+
+async def serve_http(
+    server: "Server",
+    transport: str,
+    resources: Callable[[], AsyncContextManager[Any]],
+    config: HttpServeConfig,
+    warm_up: Optional[Callable[[], None]] = None,
+    metrics_text: Optional[Callable[[], str]] = None,
+) -> None:
+    """Serve ``server`` over HTTP in this process until SIGINT/SIGTERM, then drain gracefully."""
+    import uvicorn
+
+    app = create_http_app(server, transport, resources, warm_up, metrics_text)
+    await uvicorn.Server(uvicorn.Config(app, **config.uvicorn_options())).serve()
+
+
+def serve_workers(app_factory: str, config: HttpServeConfig) -> None:
+    """Run ``config.workers`` processes sharing one listening socket.
+
+    ``app_factory`` is a ``"module:function"`` import string returning the
+    ASGI app: each worker imports it afresh, so nothing built in the parent
+    process is shared except the socket and the environment. Blocks until
+    the workers have shut down.
+    """
+    import uvicorn
+
+    uvicorn.run(app_factory, factory=True, workers=config.workers, **config.uvicorn_options())